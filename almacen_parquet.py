@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import trazas
+from analitica import COLUMNAS_LOCAL
+from resumenes import obtener_resumen, USUARIO_LOCAL
+
+ARCHIVO_CSV = "movimientos.csv"
+DIRECTORIO = "movimientos_parquet"
+MARCA_IMPORTACION = "_importado_csv"
+DIRECTORIO_RESUMEN = "_resumen"
+ARCHIVO_BASE = "base.parquet"
+ARCHIVO_HUELLAS = "_huellas.sqlite3"
+DELTAS_PARA_COMPACTAR = 8
+
+COLUMNAS = ["fecha", "descripcion", "tipo", "categoria", "monto"]
+ESQUEMA = pa.schema([
+    ("fecha", pa.timestamp("ns")),
+    ("descripcion", pa.string()),
+    ("tipo", pa.string()),
+    ("categoria", pa.string()),
+    ("monto", pa.float64()),
+])
+PARTICIONES = ds.partitioning(pa.schema([("año", pa.int32()), ("mes", pa.int32())]), flavor="hive")
+
+_candado = threading.RLock()
+
+# 🗂️ Libro local en Parquet particionado por año/mes:
+# movimientos_parquet/año=2025/mes=6/{base.parquet, delta-*.parquet}
+# Los movimientos sin fecha válida van a año=0/mes=0.
+
+def _ruta_particion(año, mes, directorio=DIRECTORIO):
+    return os.path.join(directorio, f"año={int(año)}", f"mes={int(mes)}")
+
+def _normalizar(df):
+    df = df.reindex(columns=COLUMNAS).copy()
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+    df["monto"] = pd.to_numeric(df["monto"], errors="coerce")
+    for col in ["descripcion", "tipo", "categoria"]:
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+def _escribir(df, ruta):
+    # Los nombres que empiezan con "." no los ve el lector del dataset
+    temporal = os.path.join(os.path.dirname(ruta), "." + os.path.basename(ruta) + ".tmp")
+    pq.write_table(pa.Table.from_pandas(df, schema=ESQUEMA, preserve_index=False), temporal)
+    os.replace(temporal, ruta)
+
+def _archivos(ruta):
+    if not os.path.isdir(ruta):
+        return []
+    return sorted(f for f in os.listdir(ruta) if f.endswith(".parquet"))
+
+def particiones_disponibles(directorio=DIRECTORIO, incluir_sin_fecha=False):
+    particiones = []
+    if not os.path.isdir(directorio):
+        return particiones
+    for carpeta_año in os.listdir(directorio):
+        if not carpeta_año.startswith("año="):
+            continue
+        for carpeta_mes in os.listdir(os.path.join(directorio, carpeta_año)):
+            if carpeta_mes.startswith("mes=") and _archivos(os.path.join(directorio, carpeta_año, carpeta_mes)):
+                particiones.append((int(carpeta_año[4:]), int(carpeta_mes[4:])))
+    return sorted(p for p in particiones if incluir_sin_fecha or p != (0, 0))
+
+# Cambia con cada archivo que se agrega, compacta o reemplaza en cualquier partición: cada uno
+# se escribe con os.replace, que actualiza la fecha de modificación de la carpeta
+def version_libro(directorio=DIRECTORIO):
+    version = []
+    for año, mes in particiones_disponibles(directorio, incluir_sin_fecha=True):
+        try:
+            version.append((año, mes, os.stat(_ruta_particion(año, mes, directorio)).st_mtime_ns))
+        except FileNotFoundError:
+            continue
+    return tuple(version)
+
+# Lee solo las particiones pedidas: el filtro año/mes se resuelve con los nombres de carpeta
+@trazas.medido("parquet.leer_movimientos")
+def leer_movimientos(año=None, mes=None, directorio=DIRECTORIO):
+    if not os.path.isdir(directorio):
+        return pd.DataFrame(columns=COLUMNAS)
+    filtro = None
+    if año is not None:
+        filtro = ds.field("año") == int(año)
+    if mes is not None:
+        filtro = (ds.field("mes") == int(mes)) if filtro is None else filtro & (ds.field("mes") == int(mes))
+    with _candado:
+        dataset = ds.dataset(
+            directorio,
+            schema=ESQUEMA.append(pa.field("año", pa.int32())).append(pa.field("mes", pa.int32())),
+            format="parquet",
+            partitioning=PARTICIONES,
+        )
+        return dataset.to_table(filter=filtro).to_pandas()
+
+# 🔑 Huella de 64 bits de cada movimiento (fecha, descripción, tipo, categoría y monto).
+# El índice de huellas vive junto al libro en _huellas.sqlite3 y se actualiza con cada alta,
+# así descartar duplicados solo consulta las huellas del lote que llega y no lee el historial.
+def huellas_movimientos(df):
+    norm = pd.DataFrame({
+        "fecha": df["fecha"].astype("datetime64[ns]"),  # misma huella sin importar la resolución de origen
+        "descripcion": df["descripcion"].astype("string").str.strip(),
+        "tipo": df["tipo"].astype("string").str.strip(),
+        "categoria": df["categoria"].astype("string").str.strip(),
+        "monto": df["monto"].round(2),
+    })
+    return pd.util.hash_pandas_object(norm, index=False).to_numpy(dtype=np.uint64).view(np.int64)
+
+# Libros anteriores al índice: se recorre el historial una sola vez al abrirlo
+def _indice_huellas(directorio):
+    os.makedirs(directorio, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(directorio, ARCHIVO_HUELLAS), timeout=10)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("CREATE TABLE IF NOT EXISTS huellas (huella INTEGER PRIMARY KEY) WITHOUT ROWID")
+    conexion.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+    if conexion.execute("SELECT 1 FROM meta WHERE clave = 'completo'").fetchone() is None:
+        for año, mes in particiones_disponibles(directorio, incluir_sin_fecha=True):
+            huellas = huellas_movimientos(leer_movimientos(año, mes, directorio))
+            conexion.executemany("INSERT OR IGNORE INTO huellas VALUES (?)", [(int(h),) for h in huellas])
+        conexion.execute("INSERT INTO meta VALUES ('completo', '1')")
+        conexion.commit()
+    return conexion
+
+def _huellas_existentes(conexion, huellas):
+    unicas = [int(h) for h in np.unique(huellas)]
+    existentes = []
+    for inicio in range(0, len(unicas), 500):
+        bloque = unicas[inicio:inicio + 500]
+        existentes += [fila[0] for fila in conexion.execute(
+            f"SELECT huella FROM huellas WHERE huella IN ({', '.join('?' * len(bloque))})", bloque)]
+    return np.array(existentes, dtype=np.int64)
+
+# Cada llamada escribe un archivo delta pequeño por partición tocada; nunca reescribe el historial.
+# Con deduplicar=True se descartan las filas repetidas en el lote o que ya están en el libro.
+@trazas.medido("parquet.agregar_movimientos")
+def agregar_movimientos(df_nuevos, directorio=DIRECTORIO, deduplicar=False):
+    df_nuevos = _normalizar(df_nuevos)
+    huellas = huellas_movimientos(df_nuevos)
+    agregados = 0
+    # closing() cierra la conexión al salir; el segundo `conexion` confirma (o revierte) la transacción
+    with _candado, closing(_indice_huellas(directorio)) as conexion, conexion:
+        if deduplicar:
+            nuevas = ~pd.Series(huellas).duplicated().to_numpy() & ~np.isin(huellas, _huellas_existentes(conexion, huellas))
+            df_nuevos, huellas = df_nuevos[nuevas], huellas[nuevas]
+        años = df_nuevos["fecha"].dt.year.fillna(0).astype(int)
+        meses = df_nuevos["fecha"].dt.month.fillna(0).astype(int)
+        resumen = resumen_local(directorio)
+        for (año, mes), df_particion in df_nuevos.groupby([años, meses]):
+            ruta = _ruta_particion(año, mes, directorio)
+            os.makedirs(ruta, exist_ok=True)
+            _escribir(df_particion, os.path.join(ruta, f"delta-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"))
+            agregados += len(df_particion)
+            if len(_archivos(ruta)) > DELTAS_PARA_COMPACTAR:
+                _compactar_particion(ruta)
+        if agregados:
+            resumen.agregar(df_nuevos, usuario=USUARIO_LOCAL)
+        conexion.executemany("INSERT OR IGNORE INTO huellas VALUES (?)", [(int(h),) for h in huellas])
+    return agregados
+
+def _compactar_particion(ruta):
+    archivos = _archivos(ruta)
+    if len(archivos) <= 1:
+        return
+    tabla = pa.concat_tables([pq.read_table(os.path.join(ruta, f), schema=ESQUEMA) for f in archivos])
+    df = tabla.to_pandas().sort_values("fecha", kind="stable")
+    _escribir(df, os.path.join(ruta, ARCHIVO_BASE))
+    for archivo in archivos:
+        if archivo != ARCHIVO_BASE:
+            os.remove(os.path.join(ruta, archivo))
+
+# Resumen mensual guardado junto al libro; si falta (libros previos) se arma una vez
+def resumen_local(directorio=DIRECTORIO):
+    carpeta = os.path.join(directorio, DIRECTORIO_RESUMEN)
+    with _candado:
+        nuevo = not os.path.exists(carpeta)
+        resumen = obtener_resumen(carpeta, COLUMNAS_LOCAL)
+        if nuevo and particiones_disponibles(directorio):
+            resumen.reconstruir(leer_movimientos(directorio=directorio), USUARIO_LOCAL, todo=True)
+    return resumen
+
+# Junta los deltas de cada partición en un solo base.parquet
+def compactar(directorio=DIRECTORIO):
+    with _candado:
+        for año, mes in particiones_disponibles(directorio) + [(0, 0)]:
+            _compactar_particion(_ruta_particion(año, mes, directorio))
+
+# Migración única desde el CSV histórico; la marca evita repetirla en cada arranque
+def importar_csv_inicial(archivo_csv=ARCHIVO_CSV, directorio=DIRECTORIO):
+    marca = os.path.join(directorio, MARCA_IMPORTACION)
+    if os.path.exists(marca):
+        return 0
+    agregados = 0
+    if os.path.exists(archivo_csv):
+        agregados = agregar_movimientos(pd.read_csv(archivo_csv), directorio)
+        compactar(directorio)
+    os.makedirs(directorio, exist_ok=True)
+    with open(marca, "w", encoding="utf-8") as f:
+        f.write(archivo_csv + "\n")
+    return agregados
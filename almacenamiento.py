@@ -0,0 +1,488 @@
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import analitica
+import indice_fechas
+import trazas
+from analitica import COLUMNAS_SHEETS, COLUMNAS_LOCAL
+from cache_ia import normalizar_libro
+from esquema import COLUMNAS_LIBRO, escribir_csv, leer_csv, sin_categorias, tipar
+from resumenes import USUARIO_LOCAL
+
+# 🗄️ Almacenes intercambiables: las tres apps hablan con esta interfaz y el backend se elige
+# con la variable de entorno ALMACEN (sheets, espejo, csv, sqlite o parquet). ARCHIVO_ALMACEN cambia el
+# archivo o carpeta de los backends locales. Los movimientos viajan siempre con las columnas
+# de Sheets: Fecha, Tipo, Categoría, Descripción, Monto, Usuario e ID.
+
+COLUMNAS = COLUMNAS_LIBRO
+ARCHIVO_CSV_APP = "movimientos_app.csv"
+ARCHIVO_SQLITE = "movimientos.sqlite3"
+SINCRONIZADO = "sincronizado"  # mismo valor que cola_sheets.SINCRONIZADO
+
+# Columnas del libro con los tipos compactos de esquema.tipar
+def _normalizar(df):
+    return tipar(df.reindex(columns=COLUMNAS))
+
+# 🆔 Cada movimiento lleva un ID estable desde que se crea; las bajas y correcciones lo usan
+# en lugar de la posición, que cambia cuando otro usuario borra filas
+# Empieza con letra para que Sheets no lo tome por número al escribirlo con USER_ENTERED
+def nuevo_id():
+    return "m" + uuid.uuid4().hex[:11]
+
+def asignar_ids(df):
+    df = df.copy()
+    df["ID"] = df["ID"].astype(object) if "ID" in df.columns else None
+    faltan = df["ID"].isna() | (df["ID"].astype(str).str.strip() == "")
+    df.loc[faltan, "ID"] = [nuevo_id() for _ in range(int(faltan.sum()))]
+    return df
+
+# Conversión entre el formato del libro local (fecha, tipo en minúsculas, ...) y el de Sheets
+def desde_local(df, usuario=USUARIO_LOCAL):
+    nombres = {COLUMNAS_LOCAL[k]: COLUMNAS_SHEETS[k] for k in ["fecha", "tipo", "categoria", "descripcion", "monto"]}
+    df = df.rename(columns=nombres)
+    tipos = {COLUMNAS_LOCAL["ingreso"]: COLUMNAS_SHEETS["ingreso"], COLUMNAS_LOCAL["egreso"]: COLUMNAS_SHEETS["egreso"]}
+    df["Tipo"] = df["Tipo"].astype("string").str.strip().str.lower().map(tipos).fillna(df["Tipo"])
+    df["Usuario"] = usuario
+    return df
+
+def a_local(df):
+    nombres = {COLUMNAS_SHEETS[k]: COLUMNAS_LOCAL[k] for k in ["fecha", "tipo", "categoria", "descripcion", "monto"]}
+    df = sin_categorias(df.rename(columns=nombres)[list(nombres.values())])
+    tipos = {COLUMNAS_SHEETS["ingreso"]: COLUMNAS_LOCAL["ingreso"], COLUMNAS_SHEETS["egreso"]: COLUMNAS_LOCAL["egreso"]}
+    df["tipo"] = df["tipo"].map(tipos).fillna(df["tipo"])
+    return tipar(df, COLUMNAS_LOCAL)
+
+def _limites_mes(mes):
+    inicio = pd.Timestamp(f"{mes}-01")
+    return inicio, inicio + pd.offsets.MonthBegin(1)
+
+def _filtrar(df, categorias=None):
+    if categorias is not None:
+        df = df[df["Categoría"].isin(categorias)]
+    return df
+
+class Almacen:
+    nombre = ""
+    solo_altas = False  # True si eliminar y editar no están disponibles; las apps esconden esas opciones
+    un_usuario = False  # True si guarda el libro local de un solo usuario (USUARIO_LOCAL)
+
+    # Todos los movimientos del usuario, incluidos los que aún no terminan de guardarse
+    def cargar(self, usuario):
+        raise NotImplementedError
+
+    # Algo barato que cambia cuando cambian los movimientos del usuario y que distingue a cada
+    # usuario, para usarlo como clave de caché (None si no se sabe)
+    def version_datos(self, usuario):
+        return None
+
+    # Movimientos del usuario ordenados por fecha con los límites de cada mes; se rearma solo
+    # cuando cambia version_datos. Si el backend no la conoce se arma en cada llamada sin guardarlo:
+    # cargar devuelve una copia nueva cada vez y la caché por objeto nunca acertaría.
+    def indice(self, usuario):
+        version = self.version_datos(usuario)
+        if version is None:
+            return indice_fechas.IndiceFechas(self.cargar(usuario), COLUMNAS_SHEETS)
+        return indice_fechas.por_version((self.nombre, id(self), usuario, version), lambda: self.cargar(usuario),
+                                         COLUMNAS_SHEETS)
+
+    # Un mes es un corte del índice de fechas, sin recorrer el libro
+    def consultar(self, usuario, mes=None, categorias=None):
+        if mes is None:
+            return _filtrar(self.cargar(usuario), categorias)
+        return _filtrar(self.indice(usuario).mes(mes), categorias)
+
+    # Meses "AAAA-MM" con movimientos, en orden
+    def meses(self, usuario):
+        return self.indice(usuario).meses()
+
+    # Totales por tipo y categoría de varios meses lado a lado (p. ej. este mes y el mismo del año
+    # pasado); cuesta una consulta por mes sin importar el largo del historial
+    def comparar(self, usuario, meses, categorias=None):
+        partes = [sin_categorias(self.consultar(usuario, m, categorias)) for m in meses]
+        return analitica.comparar_meses(pd.concat(partes) if partes else pd.DataFrame(columns=COLUMNAS), meses,
+                                        COLUMNAS_SHEETS)
+
+    def resumen_mes(self, usuario, mes, categorias=None):
+        analisis = analitica.analizar(self.consultar(usuario, mes, categorias), COLUMNAS_SHEETS)
+        return analitica.resumen_mes(analisis, mes)
+
+    # Devuelve un identificador de envío para estado(), o None si ya quedó guardado
+    def agregar(self, df, deduplicar=False):
+        raise NotImplementedError
+
+    def estado(self, envio):
+        return SINCRONIZADO, None
+
+    # Altas de una importación: descarta duplicados y devuelve cuántos movimientos eran nuevos
+    def importar(self, df):
+        df = self._sin_duplicados(_normalizar(df))
+        if not df.empty:
+            self.agregar(df)
+        return len(df)
+
+    # IDs del usuario que todavía no se pueden borrar ni corregir
+    def pendientes(self, usuario):
+        return set()
+
+    # Devuelven los IDs que se encontraron y se borraron o corrigieron
+    def eliminar(self, ids):
+        raise PermissionError(f"El almacén {self.nombre} solo admite altas")
+
+    def editar(self, df):
+        raise PermissionError(f"El almacén {self.nombre} solo admite altas")
+
+    def registrar_usuario(self, correo_usuario):
+        pass
+
+    # Quita de df los movimientos que ya existen (mismos datos, sin mirar el ID)
+    def _sin_duplicados(self, df):
+        if df.empty:
+            return df
+        existentes = [self.cargar(u) for u in df["Usuario"].dropna().unique()]
+        existentes = pd.concat(existentes) if existentes else pd.DataFrame(columns=COLUMNAS)
+        columnas = ["Usuario"] + [c for c in COLUMNAS if c not in ("Usuario", "ID")]
+        clave = lambda d: pd.util.hash_pandas_object(
+            normalizar_libro(d).assign(Usuario=d["Usuario"].astype("string").to_numpy())[columnas], index=False)
+        repetidos = clave(df).isin(clave(existentes).to_numpy()) if not existentes.empty else np.zeros(len(df), bool)
+        return df[~np.asarray(repetidos)].drop_duplicates(subset=[c for c in COLUMNAS if c != "ID"])
+
+# ---------- Google Sheets (hoja compartida o una hoja por usuario) ----------
+class AlmacenSheets(Almacen):
+    nombre = "sheets"
+
+    def __init__(self, hoja, cliente):
+        self.hoja = hoja
+        self.cliente = cliente
+
+    def version_datos(self, usuario):
+        from sheets_utils import version_datos
+        from cola_sheets import envios_pendientes
+        version = version_datos(self.hoja, usuario)
+        return None if version is None else (version, envios_pendientes(self.hoja))
+
+    def cargar(self, usuario):
+        from sheets_utils import cargar_datos_usuario
+        from cola_sheets import movimientos_pendientes
+        df = cargar_datos_usuario(self.hoja, usuario)
+        pendientes = movimientos_pendientes(self.hoja)
+        if not pendientes.empty:
+            # Unir categóricas distintas deja object: se vuelve a tipar
+            df = tipar(pd.concat([sin_categorias(df), sin_categorias(pendientes[pendientes["Usuario"] == usuario])]))
+        return df
+
+    def agregar(self, df, deduplicar=False):
+        from cola_sheets import encolar_movimientos
+        df = _normalizar(df)
+        if deduplicar:
+            df = self._sin_duplicados(df)
+        return encolar_movimientos(self.hoja, df) if not df.empty else None
+
+    def estado(self, envio):
+        from cola_sheets import estado_envio
+        return estado_envio(envio) if envio is not None else (SINCRONIZADO, None)
+
+    def pendientes(self, usuario):
+        from cola_sheets import movimientos_pendientes
+        pendientes = movimientos_pendientes(self.hoja)
+        if pendientes.empty:
+            return set()
+        return set(pendientes.loc[pendientes["Usuario"] == usuario, "ID"])
+
+    def eliminar(self, ids):
+        from sheets_utils import eliminar_movimientos
+        return list(eliminar_movimientos(self.hoja, ids))
+
+    def editar(self, df):
+        from sheets_utils import editar_movimientos
+        return list(editar_movimientos(self.hoja, df))
+
+    def registrar_usuario(self, correo_usuario):
+        from sheets_utils import registrar_usuario_activo
+        registrar_usuario_activo(correo_usuario, self.cliente)
+
+# ---------- CSV: un archivo con todos los usuarios ----------
+class AlmacenCSV(Almacen):
+    nombre = "csv"
+
+    def __init__(self, archivo=ARCHIVO_CSV_APP):
+        self.archivo = archivo
+        self._candado = threading.RLock()
+
+    def _leer(self):
+        if not os.path.exists(self.archivo):
+            return pd.DataFrame(columns=COLUMNAS)
+        return leer_csv(self.archivo)
+
+    def _reescribir(self, df):
+        temporal = self.archivo + ".tmp"
+        escribir_csv(df, temporal)
+        os.replace(temporal, self.archivo)
+
+    def version_datos(self, usuario):
+        try:
+            estado = os.stat(self.archivo)
+        except FileNotFoundError:
+            return None
+        return usuario, estado.st_mtime_ns, estado.st_size
+
+    def cargar(self, usuario):
+        with self._candado:
+            df = self._leer()
+        return df[df["Usuario"] == usuario].reset_index(drop=True)
+
+    def agregar(self, df, deduplicar=False):
+        df = asignar_ids(_normalizar(df))
+        with self._candado:
+            if deduplicar:
+                df = self._sin_duplicados(df)
+            escribir_csv(df, self.archivo, agregar=True)
+        return None
+
+    def eliminar(self, ids):
+        with self._candado:
+            df = self._leer()
+            quitados = df["ID"].isin([str(i) for i in ids])
+            self._reescribir(df[~quitados])
+        return list(df.loc[quitados, "ID"])
+
+    def editar(self, df_cambios):
+        cambios = _normalizar(df_cambios).set_index("ID")
+        with self._candado:
+            df = sin_categorias(self._leer()).set_index("ID")
+            encontrados = cambios.index[cambios.index.isin(df.index)]
+            columnas = [c for c in cambios.columns if c in df_cambios.columns]
+            df.loc[encontrados, columnas] = cambios.loc[encontrados, columnas]
+            self._reescribir(df.reset_index()[COLUMNAS])
+        return list(encontrados)
+
+# ---------- SQLite en modo WAL con índices por usuario y fecha / tipo y categoría ----------
+class AlmacenSQLite(Almacen):
+    nombre = "sqlite"
+
+    def __init__(self, archivo=ARCHIVO_SQLITE):
+        self.archivo = archivo
+        with self._conectar() as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS movimientos (
+                    id TEXT PRIMARY KEY,
+                    usuario TEXT NOT NULL,
+                    fecha TEXT,
+                    tipo TEXT,
+                    categoria TEXT,
+                    descripcion TEXT,
+                    monto REAL
+                )""")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_usuario_fecha ON movimientos (usuario, fecha)")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_usuario_tipo_categoria ON movimientos (usuario, tipo, categoria)")
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.archivo, timeout=10)
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        return conexion
+
+    @staticmethod
+    def _a_registros(df):
+        fechas = df["Fecha"].dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+        montos = df["Monto"].astype(object)
+        tabla = pd.DataFrame({
+            "id": df["ID"].astype(str),
+            "usuario": df["Usuario"],
+            "fecha": fechas.where(df["Fecha"].notna(), None),
+            "tipo": df["Tipo"],
+            "categoria": df["Categoría"],
+            "descripcion": df["Descripción"],
+            "monto": montos.where(df["Monto"].notna(), None),
+        })
+        return list(tabla.astype(object).where(tabla.notna(), None).itertuples(index=False, name=None))
+
+    @trazas.medido("sqlite.consultar")
+    def _consultar_sql(self, condiciones, parametros):
+        sql = (
+            'SELECT fecha AS "Fecha", tipo AS "Tipo", categoria AS "Categoría", descripcion AS "Descripción", '
+            'monto AS "Monto", usuario AS "Usuario", id AS "ID" FROM movimientos WHERE '
+            + " AND ".join(condiciones) + " ORDER BY fecha"
+        )
+        with self._conectar() as conexion:
+            df = pd.read_sql_query(sql, conexion, params=parametros)
+        return _normalizar(df)
+
+    @staticmethod
+    def _condiciones(usuario, mes=None, categorias=None):
+        condiciones, parametros = ["usuario = ?"], [usuario]
+        if mes is not None:
+            inicio, fin = _limites_mes(mes)
+            condiciones += ["fecha >= ?", "fecha < ?"]
+            parametros += [f"{inicio:%Y-%m-%d}", f"{fin:%Y-%m-%d}"]
+        if categorias is not None:
+            categorias = list(categorias)
+            condiciones.append(f"categoria IN ({', '.join('?' * len(categorias))})" if categorias else "0")
+            parametros += categorias
+        return condiciones, parametros
+
+    # En modo WAL las escrituras tocan el archivo -wal y los checkpoints el principal
+    def version_datos(self, usuario):
+        version = []
+        for archivo in (self.archivo, f"{self.archivo}-wal"):
+            try:
+                estado = os.stat(archivo)
+            except FileNotFoundError:
+                continue
+            version.append((estado.st_mtime_ns, estado.st_size))
+        return (usuario, *version) if version else None
+
+    def cargar(self, usuario):
+        return self._consultar_sql(*self._condiciones(usuario))
+
+    def consultar(self, usuario, mes=None, categorias=None):
+        return self._consultar_sql(*self._condiciones(usuario, mes, categorias))
+
+    # Salta de mes en mes con búsquedas en el índice (usuario, fecha) en lugar de recorrerlo entero
+    def meses(self, usuario):
+        sql = """
+            WITH RECURSIVE m(mes) AS (
+                SELECT substr(MIN(fecha), 1, 7) FROM movimientos WHERE usuario = :u AND fecha IS NOT NULL
+                UNION ALL
+                SELECT (SELECT substr(MIN(fecha), 1, 7) FROM movimientos
+                        WHERE usuario = :u AND fecha >= date(m.mes || '-01', '+1 month'))
+                FROM m WHERE m.mes IS NOT NULL
+            )
+            SELECT mes FROM m WHERE mes IS NOT NULL"""
+        with self._conectar() as conexion:
+            return [fila[0] for fila in conexion.execute(sql, {"u": usuario})]
+
+    def resumen_mes(self, usuario, mes, categorias=None):
+        condiciones, parametros = self._condiciones(usuario, mes, categorias)
+        # Suma en centavos enteros, igual que analitica y el resumen mensual
+        sql = ("SELECT tipo, categoria, SUM(CAST(ROUND(monto * 100) AS INTEGER)) / 100.0 FROM movimientos WHERE "
+               + " AND ".join(condiciones) + " GROUP BY tipo, categoria")
+        with self._conectar() as conexion:
+            grupos = pd.DataFrame(conexion.execute(sql, parametros).fetchall(), columns=["tipo", "categoria", "monto"])
+        ingresos = grupos[grupos["tipo"] == COLUMNAS_SHEETS["ingreso"]]
+        egresos = grupos[grupos["tipo"] == COLUMNAS_SHEETS["egreso"]]
+        return {
+            "ingresos": float(ingresos["monto"].sum()),
+            "egresos": float(egresos["monto"].sum()),
+            "balance": float(ingresos["monto"].sum() - egresos["monto"].sum()),
+            "ingresos_por_categoria": ingresos.groupby("categoria")["monto"].sum(),
+            "egresos_por_categoria": egresos.groupby("categoria")["monto"].sum(),
+        }
+
+    def agregar(self, df, deduplicar=False):
+        df = asignar_ids(_normalizar(df))
+        if deduplicar:
+            df = self._sin_duplicados(df)
+        with self._conectar() as conexion:
+            conexion.executemany("INSERT OR REPLACE INTO movimientos VALUES (?, ?, ?, ?, ?, ?, ?)", self._a_registros(df))
+        return None
+
+    def _existentes(self, conexion, ids):
+        ids = [str(i) for i in ids]
+        encontrados = []
+        for inicio in range(0, len(ids), 500):
+            bloque = ids[inicio:inicio + 500]
+            encontrados += [fila[0] for fila in conexion.execute(
+                f"SELECT id FROM movimientos WHERE id IN ({', '.join('?' * len(bloque))})", bloque)]
+        return encontrados
+
+    def eliminar(self, ids):
+        with self._conectar() as conexion:
+            encontrados = self._existentes(conexion, ids)
+            conexion.executemany("DELETE FROM movimientos WHERE id = ?", [(i,) for i in encontrados])
+        return encontrados
+
+    def editar(self, df_cambios):
+        df = _normalizar(df_cambios)
+        with self._conectar() as conexion:
+            encontrados = set(self._existentes(conexion, df["ID"]))
+            registros = [r for r in self._a_registros(df) if r[0] in encontrados]
+            conexion.executemany(
+                "UPDATE movimientos SET usuario = ?, fecha = ?, tipo = ?, categoria = ?, descripcion = ?, monto = ? "
+                "WHERE id = ?", [r[1:] + r[:1] for r in registros])
+        return [r[0] for r in registros]
+
+# ---------- Parquet particionado por año/mes (libro local de un solo usuario, solo altas) ----------
+# Los movimientos del libro local no llevan ID, así que no hay con qué pedir una baja o corrección,
+# ni usuario: cualquier otro usuario que USUARIO_LOCAL se rechaza en lugar de ver el libro ajeno
+class AlmacenParquet(Almacen):
+    nombre = "parquet"
+    solo_altas = True
+    un_usuario = True
+
+    def __init__(self, directorio=None):
+        import almacen_parquet
+        self._parquet = almacen_parquet
+        self.directorio = directorio or almacen_parquet.DIRECTORIO
+        # El CSV histórico de la app local se importa una sola vez
+        almacen_parquet.importar_csv_inicial(almacen_parquet.ARCHIVO_CSV, self.directorio)
+
+    @staticmethod
+    def _revisar(usuarios):
+        ajenos = {u for u in usuarios if u != USUARIO_LOCAL}
+        if ajenos:
+            raise ValueError(f"El almacén parquet es el libro local de un solo usuario; no admite {sorted(ajenos)}")
+
+    def version_datos(self, usuario):
+        self._revisar([usuario])
+        return usuario, self._parquet.version_libro(self.directorio)
+
+    def cargar(self, usuario):
+        self._revisar([usuario])
+        return _normalizar(desde_local(self._parquet.leer_movimientos(directorio=self.directorio), usuario))
+
+    def consultar(self, usuario, mes=None, categorias=None):
+        if mes is None:
+            return _filtrar(self.cargar(usuario), categorias)
+        self._revisar([usuario])
+        año, numero = (int(p) for p in mes.split("-"))
+        df = _normalizar(desde_local(self._parquet.leer_movimientos(año, numero, self.directorio), usuario))
+        return _filtrar(df, categorias)
+
+    def meses(self, usuario):
+        self._revisar([usuario])
+        return [f"{año:04d}-{mes:02d}" for año, mes in self._parquet.particiones_disponibles(self.directorio)]
+
+    def resumen_mes(self, usuario, mes, categorias=None):
+        self._revisar([usuario])
+        return self._parquet.resumen_local(self.directorio).resumen_mes(USUARIO_LOCAL, mes, categorias)
+
+    def agregar(self, df, deduplicar=False):
+        self._revisar(df["Usuario"].dropna().unique())
+        self._parquet.agregar_movimientos(a_local(_normalizar(df)), self.directorio, deduplicar=deduplicar)
+        return None
+
+    def importar(self, df):
+        self._revisar(df["Usuario"].dropna().unique())
+        return self._parquet.agregar_movimientos(a_local(_normalizar(df)), self.directorio, deduplicar=True)
+
+_almacenes = {}
+_candado_almacenes = threading.Lock()
+
+# Backend según ALMACEN (o el predeterminado de la app). Con Sheets, hoja_por_usuario elige la
+# hoja propia del usuario en lugar de la hoja compartida. Los backends de un solo usuario (parquet)
+# se rechazan para un correo real: ese usuario vería y graficaría el libro local de otro.
+def obtener_almacen(predeterminado="sheets", correo_usuario=None, hoja_por_usuario=False):
+    tipo = os.environ.get("ALMACEN", predeterminado)
+    archivo = os.environ.get("ARCHIVO_ALMACEN")
+    if tipo == "sheets":
+        from sheets_utils import conectar_google_sheets, obtener_hoja_unica, obtener_hoja_usuario
+        cliente, _ = conectar_google_sheets()
+        hoja = obtener_hoja_usuario(correo_usuario, cliente) if hoja_por_usuario else obtener_hoja_unica(cliente)
+        return AlmacenSheets(hoja, cliente)
+    clases = {"csv": AlmacenCSV, "sqlite": AlmacenSQLite, "parquet": AlmacenParquet}
+    if tipo == "espejo":
+        from espejo_sheets import AlmacenEspejo
+        clases["espejo"] = AlmacenEspejo
+    if tipo not in clases:
+        raise ValueError(f"Almacén desconocido: {tipo} (usa sheets, espejo, csv, sqlite o parquet)")
+    if clases[tipo].un_usuario and correo_usuario not in (None, USUARIO_LOCAL):
+        raise ValueError(f"El almacén {tipo} guarda el libro local de un solo usuario; usa sheets, espejo, csv o sqlite")
+    with _candado_almacenes:
+        if (tipo, archivo) not in _almacenes:
+            _almacenes[(tipo, archivo)] = clases[tipo](archivo) if archivo else clases[tipo]()
+        return _almacenes[(tipo, archivo)]
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+import trazas
+from esquema import COLUMNAS_SHEETS, COLUMNAS_LOCAL, ESCALA, centavos
+
+LIMITE_DENSO = 10_000_000  # celdas máximas para agrupar con bincount directo
+
+def _fechas(df, columnas):
+    fechas = df[columnas["fecha"]]
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        fechas = pd.to_datetime(fechas, errors="coerce")
+    return fechas
+
+# Montos en centavos enteros: las sumas y el saldo se acumulan sin error y se dividen al final
+def _centavos(df, columnas):
+    return centavos(df[columnas["monto"]])
+
+# Meses como enteros (año * 12 + mes - 1); -1 para fechas vacías.
+# El calendario se resuelve una vez por día distinto del rango y se reparte con una tabla de consulta.
+def claves_mes(fechas):
+    dias = fechas.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    nulos = np.isnat(dias)
+    enteros = dias.astype(np.int64)
+    if nulos.all():
+        return np.full(len(dias), -1, dtype=np.int64)
+    primero, ultimo = enteros[~nulos].min(), enteros[~nulos].max()
+    tabla = np.arange(primero, ultimo + 1).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return np.where(nulos, -1, tabla[np.clip(enteros - primero, 0, ultimo - primero)])
+
+def etiqueta_mes(clave):
+    return f"{clave // 12:04d}-{clave % 12 + 1:02d}"
+
+# Equivalente vectorizado de fecha.dt.to_period("M").astype(str), como categórica
+def etiquetas_mes(fechas):
+    claves = claves_mes(fechas)
+    validas = claves[claves >= 0]
+    primera = validas.min() if len(validas) else 0
+    ultima = validas.max() if len(validas) else -1
+    etiquetas = [etiqueta_mes(c) for c in range(primera, ultima + 1)]
+    codigos = np.where(claves >= 0, claves - primera, -1)
+    return pd.Series(pd.Categorical.from_codes(codigos, etiquetas), index=fechas.index)
+
+def _centavos_con_signo(df, columnas):
+    montos = _centavos(df, columnas)
+    es_ingreso = (df[columnas["tipo"]] == columnas["ingreso"]).to_numpy()
+    return np.where(es_ingreso, montos, -montos)
+
+def montos_con_signo(df, columnas=COLUMNAS_SHEETS):
+    return pd.Series(_centavos_con_signo(df, columnas) / ESCALA, index=df.index)
+
+# Saldo acumulado en orden de fecha (orden estable para movimientos del mismo día)
+@trazas.medido("analitica.saldo_acumulado")
+def saldo_acumulado(df, columnas=COLUMNAS_SHEETS, saldo_inicial=0.0):
+    orden = np.argsort(_fechas(df, columnas).to_numpy(), kind="stable")
+    ordenado = df.iloc[orden].copy()
+    con_signo = _centavos_con_signo(ordenado, columnas)
+    ordenado["monto_signed"] = con_signo / ESCALA
+    ordenado["cashflow"] = np.cumsum(con_signo) / ESCALA + saldo_inicial
+    return ordenado
+
+# Suma y conteo por combinación de códigos enteros no negativos, sin groupby
+def _agrupar(codigos, tamaños, valores):
+    combinado = np.zeros(len(valores), dtype=np.int64)
+    for codigo, tamaño in zip(codigos, tamaños):
+        combinado = combinado * tamaño + codigo
+    total = int(np.prod(tamaños, dtype=np.int64))
+    if total <= LIMITE_DENSO:
+        sumas = np.bincount(combinado, weights=valores, minlength=total)
+        conteos = np.bincount(combinado, minlength=total)
+        presentes = np.flatnonzero(conteos)
+        sumas, conteos = sumas[presentes], conteos[presentes]
+    else:
+        presentes, inversa = np.unique(combinado, return_inverse=True)
+        sumas = np.bincount(inversa, weights=valores)
+        conteos = np.bincount(inversa)
+    separados = []
+    for tamaño in reversed(tamaños):
+        presentes, resto = np.divmod(presentes, tamaño)
+        separados.append(resto)
+    return list(reversed(separados)), sumas, conteos
+
+def _factorizar(serie):
+    codigos, valores = pd.factorize(serie, use_na_sentinel=True)
+    # El código 0 queda para valores vacíos
+    return codigos + 1, np.concatenate([[np.nan], np.asarray(valores, dtype=object)])
+
+# Una sola pasada sobre el libro: tabla mes × tipo × categoría con suma y conteo
+@trazas.medido("analitica.tabla_resumen")
+def tabla_resumen(df, columnas=COLUMNAS_SHEETS):
+    if df.empty:
+        return pd.DataFrame(columns=["clave_mes", "Mes", "tipo", "categoria", "monto", "conteo"])
+    meses = claves_mes(_fechas(df, columnas))
+    valida = meses >= 0
+    meses = meses[valida]
+    mes_minimo = meses.min() if len(meses) else 0
+    tipos, nombres_tipo = _factorizar(df[columnas["tipo"]][valida])
+    categorias, nombres_categoria = _factorizar(df[columnas["categoria"]][valida])
+    (mes, tipo, categoria), sumas, conteos = _agrupar(
+        [meses - mes_minimo, tipos, categorias],
+        [int(meses.max() - mes_minimo + 1) if len(meses) else 1, len(nombres_tipo), len(nombres_categoria)],
+        _centavos(df, columnas)[valida].astype(np.float64),
+    )
+    claves = mes + mes_minimo
+    return pd.DataFrame({
+        "clave_mes": claves,
+        "Mes": [etiqueta_mes(c) for c in claves],
+        "tipo": nombres_tipo[tipo],
+        "categoria": nombres_categoria[categoria],
+        "monto": sumas / ESCALA,
+        "conteo": conteos,
+    })
+
+def _totales_por_mes(tabla, columnas):
+    por_mes = tabla.pivot_table(index="Mes", columns="tipo", values="monto", aggfunc="sum", fill_value=0.0)
+    resultado = pd.DataFrame(index=por_mes.index)
+    resultado["ingresos"] = por_mes[columnas["ingreso"]] if columnas["ingreso"] in por_mes else 0.0
+    resultado["egresos"] = por_mes[columnas["egreso"]] if columnas["egreso"] in por_mes else 0.0
+    resultado["balance"] = resultado["ingresos"] - resultado["egresos"]
+    return resultado
+
+# Totales por tipo y categoría de varios meses lado a lado, una columna por mes en el orden pedido
+def comparar_meses(df, meses, columnas=COLUMNAS_SHEETS):
+    tabla = tabla_resumen(df, columnas)
+    tabla = tabla[tabla["Mes"].isin(meses)]
+    return tabla.pivot_table(index=["tipo", "categoria"], columns="Mes", values="monto", aggfunc="sum",
+                             fill_value=0.0).reindex(columns=list(meses), fill_value=0.0).rename_axis(columns=None)
+
+def resumen_mensual(df, columnas=COLUMNAS_SHEETS):
+    return _totales_por_mes(tabla_resumen(df, columnas), columnas)
+
+def por_categoria(df, columnas=COLUMNAS_SHEETS):
+    return tabla_resumen(df, columnas)[["Mes", "tipo", "categoria", "monto", "conteo"]]
+
+# Totales por día y tipo, más el saldo diario acumulado
+@trazas.medido("analitica.resumen_diario")
+def resumen_diario(df, columnas=COLUMNAS_SHEETS, saldo_inicial=0.0):
+    if df.empty:
+        return pd.DataFrame(columns=["fecha", "ingresos", "egresos", "neto", "saldo"])
+    dias = _fechas(df, columnas).to_numpy(dtype="datetime64[D]")
+    valida = ~np.isnat(dias)
+    dias = dias[valida]
+    montos = _centavos(df, columnas)[valida].astype(np.float64)
+    tipo = df[columnas["tipo"]].to_numpy()[valida]
+    unicos, inversa = np.unique(dias, return_inverse=True)
+    ingresos = np.bincount(inversa, weights=np.where(tipo == columnas["ingreso"], montos, 0.0), minlength=len(unicos))
+    egresos = np.bincount(inversa, weights=np.where(tipo == columnas["egreso"], montos, 0.0), minlength=len(unicos))
+    neto = np.bincount(inversa, weights=np.where(tipo == columnas["ingreso"], montos, -montos), minlength=len(unicos))
+    return pd.DataFrame({
+        "fecha": pd.to_datetime(unicos),
+        "ingresos": ingresos / ESCALA,
+        "egresos": egresos / ESCALA,
+        "neto": neto / ESCALA,
+        "saldo": np.cumsum(neto) / ESCALA + saldo_inicial,
+    })
+
+# 📊 Todo lo que necesita una página de análisis, calculado desde una sola tabla resumen
+@trazas.medido("analitica.analizar")
+def analizar(df, columnas=COLUMNAS_SHEETS):
+    tabla = tabla_resumen(df, columnas)
+    por_mes = _totales_por_mes(tabla, columnas) if not tabla.empty else pd.DataFrame(
+        columns=["ingresos", "egresos", "balance"])
+    return {
+        "columnas": columnas,
+        "meses": list(por_mes.index),
+        "tabla": tabla,
+        "por_mes": por_mes,
+    }
+
+# Totales y desglose por categoría de un mes, leídos de la tabla resumen (sin tocar el libro)
+@trazas.medido("analitica.resumen_mes")
+def resumen_mes(analisis, mes):
+    columnas, tabla, por_mes = analisis["columnas"], analisis["tabla"], analisis["por_mes"]
+    del_mes = tabla[tabla["Mes"] == mes]
+    totales = por_mes.loc[mes] if mes in por_mes.index else pd.Series({"ingresos": 0.0, "egresos": 0.0, "balance": 0.0})
+    return {
+        "ingresos": float(totales["ingresos"]),
+        "egresos": float(totales["egresos"]),
+        "balance": float(totales["balance"]),
+        "ingresos_por_categoria": del_mes[del_mes["tipo"] == columnas["ingreso"]].groupby("categoria")["monto"].sum(),
+        "egresos_por_categoria": del_mes[del_mes["tipo"] == columnas["egreso"]].groupby("categoria")["monto"].sum(),
+    }
@@ -1,48 +1,66 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import plotly.express as px
+
+import graficas
+import historial
+import precarga
+import trazas
+from esquema import COLUMNAS_SHEETS, sin_categorias
+from indice_fechas import mismo_mes_hace
+from resumenes import obtener_resumen
+from almacenamiento import obtener_almacen, nuevo_id
 
 from sheets_utils import (
-    conectar_google_sheets,
-    obtener_hoja_unica,
-    cargar_datos_usuario,
-    guardar_datos_usuario,
-    registrar_usuario_activo,
-    obtener_recomendacion_financiera,
-    generar_presupuesto_sugerido
+    recomendacion_financiera_stream,
+    presupuesto_sugerido_stream,
+    analisis_concurrente
 )
 
-def conectar_google_sheets():
-    from oauth2client.service_account import ServiceAccountCredentials
-    import gspread
-
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive"
-    ]
-
-    gcp_secrets = dict(st.secrets["gcp"])
-    cred = ServiceAccountCredentials.from_json_keyfile_dict(gcp_secrets, scope)
-    cliente = gspread.authorize(cred)
-    return cliente, cred
-
 st.set_page_config(page_title="Circulo Financiero", layout="wide")
+trazas.iniciar_rerun("app")
 st.title("Circulo Financiero – Registro y Análisis de Finanzas")
 st.markdown("Registro de Ingresos y Egresos")
 
 correo_usuario = st.text_input("Correo electrónico del usuario:")
+# El título y el correo ya están en pantalla: los SDK de Google y las gráficas cargan en segundo plano
+precarga.precargar("sheets", "graficas", "ia")
 
 if correo_usuario:
-    cliente, cred = conectar_google_sheets()
-    registrar_usuario_activo(correo_usuario, cliente)
-    hoja = obtener_hoja_unica(cliente)
-
-    if "df_usuario" not in st.session_state or st.session_state.get("usuario_actual") != correo_usuario:
-        st.session_state.df_usuario = cargar_datos_usuario(hoja, correo_usuario)
-        st.session_state.usuario_actual = correo_usuario
-
-    df_usuario = st.session_state.df_usuario
+    # Réplica local de la hoja compartida salvo que ALMACEN elija otro backend
+    try:
+        almacen = obtener_almacen("espejo", correo_usuario)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+    almacen.registrar_usuario(correo_usuario)
+
+    if almacen.nombre == "espejo":
+        col_espejo, col_actualizar = st.columns([3, 1])
+        if col_actualizar.button("🔄 Actualizar desde Google Sheets"):
+            try:
+                almacen.sincronizar()
+            except Exception as e:
+                st.error(f"No se pudo sincronizar con Google Sheets: {e}")
+        espejo = almacen.estado_espejo()
+        partes = []
+        if espejo["antiguedad"] is not None:
+            partes.append(f"Datos de Google Sheets de hace {int(espejo['antiguedad'])} s")
+        if espejo["cambios_locales"]:
+            partes.append(f"{espejo['cambios_locales']} cambios por subir")
+        if espejo["conflictos"]:
+            partes.append(f"{espejo['conflictos']} cambios descartados porque otro usuario modificó la misma fila")
+        col_espejo.caption(" · ".join(partes) or "Sin sincronizar todavía")
+
+    # Las lecturas salen de la réplica local (o de la caché de Sheets) e incluyen los movimientos que aún no llegan a la hoja.
+    # La versión se toma antes de leer: si los datos cambian en medio, el próximo rerun ve otra versión.
+    version_libro = almacen.version_datos(correo_usuario)
+    df_usuario = almacen.cargar(correo_usuario)
+
+    # Resumen mensual materializado; se rearma solo si su huella no cuadra con los movimientos cargados
+    # (y solo se revisa cuando cambia la versión de datos del almacén)
+    resumen_mensual = obtener_resumen()
+    resumen_mensual.actualizar(df_usuario, correo_usuario, version_libro)
 
     CATEGORIAS = {
         "Ingreso": ["Ventas", "Nómina", "Préstamos", "Intereses", "Otros"],
@@ -65,34 +83,79 @@ if correo_usuario:
                 "Categoría": categoria,
                 "Descripción": descripcion,
                 "Monto": monto,
-                "Usuario": correo_usuario
+                "Usuario": correo_usuario,
+                "ID": nuevo_id()
             }
-            df_usuario = pd.concat([df_usuario, pd.DataFrame([nuevo])], ignore_index=True)
-            guardar_datos_usuario(hoja, df_usuario)
-            st.session_state.df_usuario = df_usuario
-            st.success("Movimiento registrado y guardado en Google Sheets")
+            df_nuevo = pd.DataFrame([nuevo])
+            st.session_state.envio = almacen.agregar(df_nuevo)
+            df_usuario = pd.concat([df_usuario, df_nuevo], ignore_index=True)
+            version_libro = None
+            resumen_mensual.agregar(df_nuevo, usuario=correo_usuario)
+            st.success("Movimiento registrado")
+
+    if st.session_state.get("envio"):
+        estado, error = almacen.estado(st.session_state.envio)
+        if estado == "pendiente":
+            st.info("Guardado localmente, sincronizando con Google Sheets...")
+        elif estado == "error":
+            st.error(f"No se pudo sincronizar con Google Sheets: {error}. El movimiento quedó en fallidos_sheets.jsonl para reintentarlo.")
+        else:
+            st.caption("Sincronizado con Google Sheets")
 
     if not df_usuario.empty:
         st.subheader("Movimientos registrados")
-        df_usuario["Fecha"] = pd.to_datetime(df_usuario["Fecha"])
-        st.dataframe(df_usuario, use_container_width=True)
-
-        st.subheader("Eliminar movimientos con error")
-        index_borrar = st.number_input("Número de fila a eliminar (empezando desde 0)", min_value=0, max_value=len(df_usuario) - 1, step=1)
-        if st.button("Eliminar fila"):
-            df_usuario = df_usuario.drop(index=index_borrar).reset_index(drop=True)
-            guardar_datos_usuario(hoja, df_usuario)
-            st.session_state.df_usuario = df_usuario
-            st.success(f"Fila {index_borrar} eliminada correctamente.")
-
-        df_usuario["Mes"] = pd.to_datetime(df_usuario["Fecha"]).dt.to_period("M").astype(str)
-        meses_disponibles = sorted(df_usuario["Mes"].unique())
+        historial.mostrar(df_usuario, COLUMNAS_SHEETS, clave="historial", version=version_libro)
+
+        # Los almacenes de solo altas (Parquet) no ofrecen bajas ni correcciones
+        if almacen.solo_altas:
+            st.caption("Este almacén solo admite altas: los movimientos no se pueden eliminar ni corregir.")
+        else:
+            # Bajas y correcciones por ID; los movimientos aún en cola no se listan
+            st.subheader("Eliminar o corregir movimientos con error")
+            sincronizados = df_usuario[~df_usuario["ID"].isin(almacen.pendientes(correo_usuario))]
+            if len(sincronizados) < len(df_usuario):
+                st.caption("Los movimientos que todavía se están sincronizando aparecerán aquí en unos segundos.")
+
+            etiquetas = {
+                r["ID"]: f"{str(r['Fecha'])[:10]} · {r['Tipo']} · {r['Categoría']} · {r['Descripción']} · ${r['Monto']:,.2f}"
+                for _, r in sincronizados.iterrows()
+            }
+            ids_borrar = st.multiselect("Movimientos a eliminar", list(etiquetas), format_func=etiquetas.get)
+            if st.button("Eliminar seleccionados") and ids_borrar:
+                borradas = almacen.eliminar(ids_borrar)
+                quitados = df_usuario["ID"].isin(borradas)
+                resumen_mensual.eliminar(df_usuario[quitados], restantes=df_usuario[~quitados], usuario=correo_usuario)
+                df_usuario = df_usuario[~quitados]
+                st.success(f"{len(borradas)} movimiento(s) eliminado(s) correctamente.")
+
+            columnas_editables = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto"]
+            # El editor recibe texto en lugar de categóricas para aceptar valores nuevos
+            originales = sin_categorias(sincronizados[columnas_editables + ["ID"]]).reset_index(drop=True)
+            editado = st.data_editor(
+                originales,
+                disabled=["ID"],
+                hide_index=True,
+                key="editor_movimientos",
+            )
+            if st.button("Guardar correcciones"):
+                iguales = (editado[columnas_editables] == originales[columnas_editables]) | (
+                    editado[columnas_editables].isna() & originales[columnas_editables].isna())
+                corregidos = editado[~iguales.all(axis=1)].assign(Usuario=correo_usuario)
+                if corregidos.empty:
+                    st.info("No hay cambios que guardar.")
+                else:
+                    corregidos = corregidos[corregidos["ID"].isin(almacen.editar(corregidos))]
+                    cambiados = df_usuario["ID"].isin(corregidos["ID"])
+                    resumen_mensual.eliminar(df_usuario[cambiados], restantes=df_usuario[~cambiados], usuario=correo_usuario)
+                    resumen_mensual.agregar(corregidos, usuario=correo_usuario)
+                    df_usuario = pd.concat([df_usuario[~cambiados], corregidos], ignore_index=True)
+                    st.success(f"{len(corregidos)} movimiento(s) corregido(s).")
+
+        meses_disponibles = resumen_mensual.meses(correo_usuario)
         mes_seleccionado = st.selectbox("Selecciona un mes para análisis:", meses_disponibles)
 
-        df_mes = df_usuario[df_usuario["Mes"] == mes_seleccionado]
-        ingresos = df_mes[df_mes["Tipo"] == "Ingreso"]["Monto"].sum()
-        egresos = df_mes[df_mes["Tipo"] == "Egreso"]["Monto"].sum()
-        balance = ingresos - egresos
+        resumen = resumen_mensual.resumen_mes(correo_usuario, mes_seleccionado)
+        ingresos, egresos, balance = resumen["ingresos"], resumen["egresos"], resumen["balance"]
 
         st.subheader(f"Resumen financiero de {mes_seleccionado}")
         col1, col2, col3 = st.columns(3)
@@ -100,72 +163,72 @@ if correo_usuario:
         col2.metric("Total Egresos", f"${egresos:,.2f}")
         col3.metric("Balance", f"${balance:,.2f}")
 
+        # Comparación con otros meses (por omisión el mismo mes del año anterior): cada mes es un
+        # corte del índice de fechas del libro, sin recorrerlo
+        with st.expander("📅 Comparar con otros meses"):
+            otros_meses = [m for m in meses_disponibles if m != mes_seleccionado]
+            anterior = mismo_mes_hace(mes_seleccionado)
+            meses_comparados = st.multiselect("Meses a comparar", otros_meses,
+                                              default=[anterior] if anterior in otros_meses else [])
+            if meses_comparados:
+                columnas_meses = sorted(meses_comparados) + [mes_seleccionado]
+                comparacion = almacen.comparar(correo_usuario, columnas_meses)
+                for mes in meses_comparados:
+                    comparacion[f"diferencia vs {mes}"] = comparacion[mes_seleccionado] - comparacion[mes]
+                st.dataframe(comparacion.reset_index(), hide_index=True, use_container_width=True)
+
         st.subheader("Visualizaciones")
 
-        df_ingresos = df_usuario[df_usuario["Tipo"] == "Ingreso"]
+        # Las gráficas mensuales también salen del resumen: una fila por mes y categoría
+        df_ingresos = graficas.ingresos_del_resumen(resumen_mensual.del_usuario(correo_usuario))
         categorias_ingreso = df_ingresos["Categoría"].unique()
         if len(categorias_ingreso) > 0:
             categoria_seleccionada = st.selectbox("Categoría para el histograma:", sorted(categorias_ingreso))
-            df_categoria = df_ingresos[df_ingresos["Categoría"] == categoria_seleccionada]
-
-            if not df_categoria.empty:
-                fig1 = px.histogram(
-                    df_categoria,
-                    x="Mes",
-                    y="Monto",
-                    title=f"Histograma mensual de '{categoria_seleccionada}'",
-                    barmode="stack",
-                    color_discrete_sequence=["#2ECC71"]
-                )
-                st.plotly_chart(fig1, use_container_width=True)
+            st.plotly_chart(graficas.histograma_categoria(df_ingresos, categoria_seleccionada), use_container_width=True)
 
         if not df_ingresos.empty:
-            fig2 = px.bar(
-                df_ingresos,
-                x="Mes",
-                y="Monto",
-                color="Categoría",
-                title="Ingresos por Categoría y Mes",
-                barmode="stack"
-            )
-            st.plotly_chart(fig2, use_container_width=True)
-
-        ingresos_mes = df_mes[df_mes["Tipo"] == "Ingreso"]
-        if not ingresos_mes.empty:
-            fig3 = px.pie(
-                ingresos_mes,
-                names="Categoría",
-                values="Monto",
-                title=f"Ingresos por Categoría ({mes_seleccionado})"
-            )
+            st.plotly_chart(graficas.ingresos_por_mes(df_ingresos), use_container_width=True)
+
+        if not resumen["ingresos_por_categoria"].empty:
+            fig3 = graficas.pastel_categorias(resumen["ingresos_por_categoria"], f"Ingresos por Categoría ({mes_seleccionado})")
             st.plotly_chart(fig3, use_container_width=True)
 
-        egresos_mes = df_mes[df_mes["Tipo"] == "Egreso"]
-        if not egresos_mes.empty:
-            fig4 = px.pie(
-                egresos_mes,
-                names="Categoría",
-                values="Monto",
-                title=f"Egresos por Categoría ({mes_seleccionado})"
-            )
+        if not resumen["egresos_por_categoria"].empty:
+            fig4 = graficas.pastel_categorias(resumen["egresos_por_categoria"], f"Egresos por Categoría ({mes_seleccionado})")
             st.plotly_chart(fig4, use_container_width=True)
 
         # Asistente IA
         st.subheader("Asistente Financiero")
         objetivo_usuario = st.text_input("¿Cuál es tu objetivo financiero?", "Ahorrar para un viaje")
 
-        colA, colB = st.columns(2)
+        colA, colB, colC = st.columns(3)
+        # La proyección se calcula localmente; el comentario del asistente IA es opcional
+        comentario_ia = colB.checkbox("Agregar comentario del asistente IA", key="presupuesto_narrativa")
         if colA.button("Obtener recomendaciones personalizadas"):
-            with st.spinner("Analizando datos..."):
-                recomendaciones = obtener_recomendacion_financiera(df_usuario, objetivo_usuario)
-                st.markdown("### Recomendaciones")
-                st.write(recomendaciones)
+            st.markdown("### Recomendaciones")
+            st.write_stream(recomendacion_financiera_stream(df_usuario, objetivo_usuario))
 
         if colB.button("Generar proyección de presupuesto"):
-            with st.spinner("Generando proyección..."):
-                presupuesto = generar_presupuesto_sugerido(df_usuario)
-                st.markdown("### Presupuesto Sugerido")
-                st.write(presupuesto)
+            st.markdown("### Presupuesto Sugerido")
+            st.write_stream(presupuesto_sugerido_stream(df_usuario, narrativa=comentario_ia))
+
+        # Ambos análisis a la vez, cada uno en su columna a medida que llegan
+        if colC.button("Generar ambos análisis"):
+            col_rec, col_pres = st.columns(2)
+            col_rec.markdown("### Recomendaciones")
+            col_pres.markdown("### Presupuesto Sugerido")
+            columnas_ia = {"recomendaciones": col_rec, "presupuesto": col_pres}
+            espacios = {nombre: columna.empty() for nombre, columna in columnas_ia.items()}
+
+            def al_recibir(nombre, texto):
+                espacios[nombre].markdown(texto)
+
+            _, errores = analisis_concurrente(df_usuario, objetivo_usuario, al_recibir)
+            for nombre, error in errores.items():
+                columnas_ia[nombre].error(f"No se pudo completar ({nombre}): {error}")
 
 else:
     st.warning("Por favor, ingresa tu correo para comenzar.")
+
+# ⏱️ Tiempos de esta ejecución (Sheets, análisis, gráficas, IA) y percentiles entre sesiones
+trazas.panel(trazas.terminar_rerun())
@@ -1,14 +1,16 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import plotly.express as px
 
-from sheets_utils import (
-    conectar_google_sheets,
-    obtener_hoja_usuario,
-    cargar_datos_usuario,
-    guardar_datos_usuario
-)
+import graficas
+import historial
+import precarga
+import trazas
+from esquema import COLUMNAS_SHEETS, sin_categorias
+from resumenes import obtener_resumen
+from almacenamiento import obtener_almacen, nuevo_id
+
+trazas.iniciar_rerun("appp")
 
 # ------------------ ESTILOS ------------------
 st.markdown(
@@ -65,11 +67,25 @@ st.markdown("💰 Registro de Ingresos y Egresos")
 # ------------------ LOGIN / CORREO ------------------
 st.info("🔐 Ingresa tu correo para cargar tus datos financieros personales")
 correo_usuario = st.text_input("Correo electrónico del usuario:")
+# La cabecera y el correo ya están en pantalla: gspread y las gráficas cargan en segundo plano
+precarga.precargar("sheets", "graficas")
 
 if correo_usuario:
-    cliente, cred = conectar_google_sheets()
-    hoja_usuario = obtener_hoja_usuario(correo_usuario, cliente, cred)
-    df = cargar_datos_usuario(hoja_usuario)
+    # Una hoja de Google Sheets por usuario salvo que ALMACEN elija otro backend
+    try:
+        almacen = obtener_almacen("sheets", correo_usuario, hoja_por_usuario=True)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+    # La versión se toma antes de leer: si los datos cambian en medio, el próximo rerun ve otra versión
+    version_libro = almacen.version_datos(correo_usuario)
+    df = almacen.cargar(correo_usuario).reset_index(drop=True)
+    ids_pendientes = almacen.pendientes(correo_usuario)
+
+    # Resumen mensual materializado; se rearma solo si su huella no cuadra con los movimientos cargados
+    # (y solo se revisa cuando cambia la versión de datos del almacén)
+    resumen_mensual = obtener_resumen("resumen_hojas_usuario")
+    resumen_mensual.actualizar(df, correo_usuario, version_libro)
 
     # ------------------ CAPTURA DE MOVIMIENTO ------------------
     CATEGORIAS = {
@@ -92,34 +108,81 @@ if correo_usuario:
                 "Tipo": tipo,
                 "Categoría": categoria,
                 "Descripción": descripcion,
-                "Monto": monto
+                "Monto": monto,
+                "Usuario": correo_usuario,
+                "ID": nuevo_id()
             }
-            df = pd.concat([df, pd.DataFrame([nuevo])], ignore_index=True)
-            guardar_datos_usuario(hoja_usuario, df)
-            st.success("✅ Movimiento registrado y guardado en tu Google Sheet")
+            df_nuevo = pd.DataFrame([nuevo])
+            st.session_state.envio = almacen.agregar(df_nuevo)
+            df = pd.concat([df, df_nuevo], ignore_index=True)
+            version_libro = None
+            resumen_mensual.agregar(df_nuevo, usuario=correo_usuario)
+            st.success("✅ Movimiento registrado")
+
+    if st.session_state.get("envio"):
+        estado, error = almacen.estado(st.session_state.envio)
+        if estado == "pendiente":
+            st.info("💾 Guardado localmente, sincronizando con tu Google Sheet...")
+        elif estado == "error":
+            st.error(f"❌ No se pudo sincronizar con tu Google Sheet: {error}. El movimiento quedó en fallidos_sheets.jsonl para reintentarlo.")
+        else:
+            st.caption("☁️ Sincronizado con tu Google Sheet")
 
     # ------------------ ANÁLISIS ------------------
     if not df.empty:
         st.subheader("📋 Movimientos registrados")
-        df["Fecha"] = pd.to_datetime(df["Fecha"])
-        st.dataframe(df, use_container_width=True)
-
-        # Botón para eliminar fila con error
-        st.subheader("🗑️ Eliminar movimientos con error")
-        index_borrar = st.number_input("Escribe el número de fila a eliminar (empezando desde 0)", min_value=0, max_value=len(df) - 1, step=1)
-        if st.button("Eliminar fila"):
-            df = df.drop(index=index_borrar).reset_index(drop=True)
-            guardar_datos_usuario(hoja_usuario, df)
-            st.success(f"✅ Fila {index_borrar} eliminada correctamente.")
-
-        df["Mes"] = pd.to_datetime(df["Fecha"]).dt.to_period("M").astype(str)
-        meses_disponibles = sorted(df["Mes"].unique())
+        historial.mostrar(df, COLUMNAS_SHEETS, clave="historial", version=version_libro)
+
+        # Los almacenes de solo altas (Parquet) no ofrecen bajas ni correcciones
+        if almacen.solo_altas:
+            st.caption("Este almacén solo admite altas: los movimientos no se pueden eliminar ni corregir.")
+        else:
+            # Bajas y correcciones por ID: solo viajan las filas afectadas, en una llamada
+            st.subheader("🗑️ Eliminar o corregir movimientos con error")
+            sincronizados = df[~df["ID"].isin(ids_pendientes)]
+            if ids_pendientes:
+                st.caption("⏳ Los movimientos que todavía se están sincronizando aparecerán aquí en unos segundos.")
+
+            etiquetas = {
+                r["ID"]: f"{str(r['Fecha'])[:10]} · {r['Tipo']} · {r['Categoría']} · {r['Descripción']} · ${r['Monto']:,.2f}"
+                for _, r in sincronizados.iterrows()
+            }
+            ids_borrar = st.multiselect("Movimientos a eliminar", list(etiquetas), format_func=etiquetas.get)
+            if st.button("Eliminar seleccionados") and ids_borrar:
+                borradas = almacen.eliminar(ids_borrar)
+                quitados = df["ID"].isin(borradas)
+                resumen_mensual.eliminar(df[quitados], restantes=df[~quitados], usuario=correo_usuario)
+                df = df[~quitados].reset_index(drop=True)
+                st.success(f"✅ {len(borradas)} movimiento(s) eliminado(s) correctamente.")
+
+            columnas_editables = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto"]
+            # El editor recibe texto en lugar de categóricas para aceptar valores nuevos
+            originales = sin_categorias(sincronizados[columnas_editables + ["ID"]]).reset_index(drop=True)
+            editado = st.data_editor(
+                originales,
+                disabled=["ID"],
+                hide_index=True,
+                key="editor_movimientos",
+            )
+            if st.button("💾 Guardar correcciones"):
+                iguales = (editado[columnas_editables] == originales[columnas_editables]) | (
+                    editado[columnas_editables].isna() & originales[columnas_editables].isna())
+                corregidos = editado[~iguales.all(axis=1)]
+                if corregidos.empty:
+                    st.info("No hay cambios que guardar.")
+                else:
+                    corregidos = corregidos[corregidos["ID"].isin(almacen.editar(corregidos.assign(Usuario=correo_usuario)))]
+                    cambiados = df["ID"].isin(corregidos["ID"])
+                    resumen_mensual.eliminar(df[cambiados], restantes=df[~cambiados], usuario=correo_usuario)
+                    resumen_mensual.agregar(corregidos, usuario=correo_usuario)
+                    df = pd.concat([df[~cambiados], corregidos], ignore_index=True)
+                    st.success(f"✅ {len(corregidos)} movimiento(s) corregido(s).")
+
+        meses_disponibles = resumen_mensual.meses(correo_usuario)
         mes_seleccionado = st.selectbox("📅 Selecciona un mes para análisis:", meses_disponibles)
 
-        df_mes = df[df["Mes"] == mes_seleccionado]
-        ingresos = df_mes[df_mes["Tipo"] == "Ingreso"]["Monto"].sum()
-        egresos = df_mes[df_mes["Tipo"] == "Egreso"]["Monto"].sum()
-        balance = ingresos - egresos
+        resumen = resumen_mensual.resumen_mes(correo_usuario, mes_seleccionado)
+        ingresos, egresos, balance = resumen["ingresos"], resumen["egresos"], resumen["balance"]
 
         st.subheader(f"📊 Resumen de {mes_seleccionado}")
         col1, col2, col3 = st.columns(3)
@@ -129,55 +192,31 @@ if correo_usuario:
 
         st.subheader("📈 Visualizaciones")
 
-        df_ingresos = df[df["Tipo"] == "Ingreso"]
+        # Las gráficas reciben el resumen mensual: una fila por mes y categoría
+        df_ingresos = graficas.ingresos_del_resumen(resumen_mensual.del_usuario(correo_usuario))
         categorias_ingreso = df_ingresos["Categoría"].unique()
         if len(categorias_ingreso) > 0:
             categoria_seleccionada = st.selectbox("Selecciona una categoría para el histograma:", sorted(categorias_ingreso))
-            df_categoria = df_ingresos[df_ingresos["Categoría"] == categoria_seleccionada]
-
-            if not df_categoria.empty:
-                fig1 = px.histogram(
-                    df_categoria,
-                    x="Mes",
-                    y="Monto",
-                    title=f"📊 Histograma mensual de '{categoria_seleccionada}'",
-                    barmode="stack",
-                    color_discrete_sequence=["#2ECC71"]
-                )
-                st.plotly_chart(fig1, use_container_width=True)
+            fig1 = graficas.histograma_categoria(
+                df_ingresos, categoria_seleccionada, f"📊 Histograma mensual de '{categoria_seleccionada}'")
+            st.plotly_chart(fig1, use_container_width=True)
 
         if not df_ingresos.empty:
-            fig2 = px.bar(
-                df_ingresos,
-                x="Mes",
-                y="Monto",
-                color="Categoría",
-                title="📊 Ingresos por Categoría y Mes (Barras Apiladas)",
-                barmode="stack"
-            )
+            fig2 = graficas.ingresos_por_mes(df_ingresos, "📊 Ingresos por Categoría y Mes (Barras Apiladas)")
             st.plotly_chart(fig2, use_container_width=True)
 
-        ingresos_mes = df_mes[df_mes["Tipo"] == "Ingreso"]
-        if not ingresos_mes.empty:
-            fig3 = px.pie(
-                ingresos_mes,
-                names="Categoría",
-                values="Monto",
-                title=f"🥧 Ingresos por Categoría – {mes_seleccionado}"
-            )
+        if not resumen["ingresos_por_categoria"].empty:
+            fig3 = graficas.pastel_categorias(resumen["ingresos_por_categoria"], f"🥧 Ingresos por Categoría – {mes_seleccionado}")
             st.plotly_chart(fig3, use_container_width=True)
 
-        egresos_mes = df_mes[df_mes["Tipo"] == "Egreso"]
-        if not egresos_mes.empty:
-            fig4 = px.pie(
-                egresos_mes,
-                names="Categoría",
-                values="Monto",
-                title=f"🥧 Egresos por Categoría – {mes_seleccionado}"
-            )
+        if not resumen["egresos_por_categoria"].empty:
+            fig4 = graficas.pastel_categorias(resumen["egresos_por_categoria"], f"🥧 Egresos por Categoría – {mes_seleccionado}")
             st.plotly_chart(fig4, use_container_width=True)
 
     else:
         st.info("No hay movimientos registrados aún.")
 else:
     st.warning("👤 Por favor, ingresa tu correo para comenzar.")
+
+# ------------------ RENDIMIENTO ------------------
+trazas.panel(trazas.terminar_rerun())
@@ -1,11 +1,20 @@
 import streamlit as st
 import pandas as pd
 import datetime
-import os
-import altair as alt
+
+import conciliacion
+import graficas
+import historial
+import precarga
+import trazas
+from analitica import COLUMNAS_LOCAL, saldo_acumulado
+from almacenamiento import obtener_almacen, desde_local, a_local
+from importacion import importar_csv
+from indice_fechas import mismo_mes_hace
+from resumenes import USUARIO_LOCAL
 
 st.set_page_config(page_title="Registro Ingresos y Egresos", layout="centered")
-ARCHIVO_CSV = "movimientos.csv"
+trazas.iniciar_rerun("appy")
 
 st.title("💰 Registro de Ingresos y Egresos")
 
@@ -19,32 +28,40 @@ st.info(
     4. Si tienes dudas, escríbenos por WhatsApp o correo (en desarrollo).  
     """
 )
+# Las gráficas (plotly y altair) cargan en segundo plano mientras se lee el libro
+precarga.precargar("graficas")
 
-# Cargar archivo local si existe
-columnas_base = ["fecha", "descripcion", "tipo", "categoria", "monto"]
-
-if os.path.exists(ARCHIVO_CSV):
-    df = pd.read_csv(ARCHIVO_CSV)
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-
-    # Asegurarse de que todas las columnas existan
-    for col in columnas_base:
-        if col not in df.columns:
-            df[col] = None
-else:
-    df = pd.DataFrame(columns=columnas_base)
+# Libro local en Parquet por año/mes (el CSV histórico se importa una sola vez),
+# salvo que ALMACEN elija otro backend
+almacen = obtener_almacen("parquet")
 
 # Subir archivo manualmente
 st.sidebar.header("📂 Cargar archivo CSV externo")
 archivo_subido = st.sidebar.file_uploader("Sube un archivo CSV", type=["csv"])
 
 if archivo_subido is not None:
-    df_nuevo = pd.read_csv(archivo_subido)
-    df_nuevo["fecha"] = pd.to_datetime(df_nuevo["fecha"], errors="coerce")
-    df = pd.concat([df, df_nuevo], ignore_index=True)
-    df.drop_duplicates(inplace=True)
-    df.to_csv(ARCHIVO_CSV, index=False)
-    st.sidebar.success("✅ Archivo cargado y combinado correctamente.")
+    # Cada archivo se importa una sola vez aunque la página se vuelva a ejecutar
+    clave_archivo = (archivo_subido.name, archivo_subido.size)
+    if st.session_state.get("archivo_importado") != clave_archivo:
+        barra = st.sidebar.progress(0.0, text="Importando...")
+        try:
+            st.session_state.reporte_importacion = importar_csv(
+                archivo_subido, almacen,
+                al_avanzar=lambda fraccion, r: barra.progress(fraccion, text=f"Importando... {r['leidas']:,} filas leídas"))
+        except ValueError as e:
+            st.session_state.reporte_importacion = {"error": str(e)}
+        st.session_state.archivo_importado = clave_archivo
+        barra.empty()
+
+    reporte = st.session_state.reporte_importacion
+    if "error" in reporte:
+        st.sidebar.error(f"❌ No se pudo importar el archivo: {reporte['error']}")
+    else:
+        st.sidebar.success(
+            f"✅ {reporte['agregadas']:,} movimientos nuevos, {reporte['duplicadas']:,} duplicados "
+            f"y {reporte['rechazadas']:,} rechazados ({reporte['segundos']:.1f} s).")
+        for motivo, cantidad in reporte["motivos"].items():
+            st.sidebar.caption(f"{cantidad:,} filas con {motivo}")
 
 # Categorías predefinidas
 categorias = ["Ventas", "Insumos", "Renta", "Servicios", "Nómina", "Otros"]
@@ -71,29 +88,28 @@ with st.form("form_registro"):
                 "categoria": categoria,
                 "monto": monto
             }
-            df = pd.concat([df, pd.DataFrame([nuevo_movimiento])], ignore_index=True)
-            df.to_csv(ARCHIVO_CSV, index=False)
+            almacen.agregar(desde_local(pd.DataFrame([nuevo_movimiento])))
             st.success("✅ Movimiento registrado y guardado.")
 
-# Preparar columnas año y mes para filtros y gráficos
-if not df.empty:
-    df["año"] = df["fecha"].dt.year
-    df["mes"] = df["fecha"].dt.month
-
-    años_disponibles = sorted(df["año"].dropna().unique())
+# Años y meses salen del almacén (particiones o índice); solo se lee el mes seleccionado
+particiones = [tuple(int(p) for p in mes.split("-")) for mes in almacen.meses(USUARIO_LOCAL)]
+if particiones:
+    años_disponibles = sorted({año for año, _ in particiones})
     if len(años_disponibles) == 0:
         st.warning("No hay datos con fecha válida.")
     else:
         año_seleccionado = st.selectbox("Selecciona año", años_disponibles, index=len(años_disponibles)-1)
 
-        meses_disponibles = sorted(df[df["año"] == año_seleccionado]["mes"].dropna().unique())
+        meses_disponibles = sorted(mes for año, mes in particiones if año == año_seleccionado)
         if len(meses_disponibles) == 0:
             st.warning("No hay datos para el año seleccionado.")
         else:
             mes_seleccionado = st.selectbox("Selecciona mes", meses_disponibles, index=len(meses_disponibles)-1)
 
             # Filtrar por año y mes
-            df_filtrado = df[(df["año"] == año_seleccionado) & (df["mes"] == mes_seleccionado)]
+            clave_mes = f"{año_seleccionado:04d}-{mes_seleccionado:02d}"
+            version_libro = almacen.version_datos(USUARIO_LOCAL)
+            df_filtrado = a_local(almacen.consultar(USUARIO_LOCAL, clave_mes))
 
             # Opcional: filtrar por categoría
             categorias_disponibles = sorted(df_filtrado["categoria"].unique())
@@ -102,15 +118,27 @@ if not df.empty:
             df_filtrado = df_filtrado[df_filtrado["categoria"].isin(categoria_filtrada)]
 
             # Mostrar totales
-            total_ingresos = df_filtrado[df_filtrado["tipo"] == "ingreso"]["monto"].sum()
-            total_egresos = df_filtrado[df_filtrado["tipo"] == "egreso"]["monto"].sum()
-            balance = total_ingresos - total_egresos
+            resumen = almacen.resumen_mes(USUARIO_LOCAL, clave_mes, categorias=categoria_filtrada)
+            total_ingresos, total_egresos, balance = resumen["ingresos"], resumen["egresos"], resumen["balance"]
 
             col1, col2, col3 = st.columns(3)
             col1.metric("Total Ingresos", f"${total_ingresos:,.2f}")
             col2.metric("Total Egresos", f"${total_egresos:,.2f}")
             col3.metric("Balance", f"${balance:,.2f}", delta_color="inverse")
 
+            # Comparación con otros meses (por omisión el mismo mes del año anterior): una consulta por mes
+            with st.expander("📅 Comparar con otros meses"):
+                otros_meses = [m for m in almacen.meses(USUARIO_LOCAL) if m != clave_mes]
+                anterior = mismo_mes_hace(clave_mes)
+                meses_comparados = st.multiselect("Meses a comparar", otros_meses,
+                                                  default=[anterior] if anterior in otros_meses else [])
+                if meses_comparados:
+                    columnas_meses = sorted(meses_comparados) + [clave_mes]
+                    comparacion = almacen.comparar(USUARIO_LOCAL, columnas_meses, categoria_filtrada)
+                    for mes in meses_comparados:
+                        comparacion[f"diferencia vs {mes}"] = comparacion[clave_mes] - comparacion[mes]
+                    st.dataframe(comparacion.reset_index(), hide_index=True, use_container_width=True)
+
             # -------------------------------
             # NUEVO BLOQUE: Saldos y cashflow
             # -------------------------------
@@ -133,21 +161,66 @@ if not df.empty:
             if saldo_banco:
                 st.metric("🏦 Saldo real banco", f"${saldo_banco:,.2f}", delta=f"${diferencia:,.2f}", delta_color="inverse")
 
+            # Conciliación contra el estado de cuenta completo: qué falta o sobra en cada lado
+            estado_subido = st.file_uploader("Estado de cuenta del banco (CSV) para conciliar", type=["csv"])
+            if estado_subido is not None:
+                clave_archivo_estado = (estado_subido.name, estado_subido.size)
+                if st.session_state.get("estado_leido") != clave_archivo_estado:
+                    try:
+                        st.session_state.estado_cuenta = conciliacion.leer_estado(estado_subido)
+                    except ValueError as e:
+                        st.session_state.estado_cuenta = {"error": str(e)}
+                    st.session_state.estado_leido = clave_archivo_estado
+                estado = st.session_state.estado_cuenta
+
+                # El saldo de apertura es el del propio estado de cuenta (el que informa el banco en su
+                # primera fila), salvo que se capture uno para la fecha en que empieza el estado
+                saldo_estado = None
+                if isinstance(estado, pd.DataFrame) and not estado.empty:
+                    saldo_estado = st.number_input(
+                        f"Saldo al {estado['fecha'].iloc[0]:%d/%m/%Y}, inicio del estado de cuenta (opcional)",
+                        value=None, step=0.01, format="%.2f")
+
+                clave_estado = (clave_archivo_estado, saldo_estado)
+                if st.session_state.get("estado_conciliado") != clave_estado:
+                    if isinstance(estado, dict):
+                        st.session_state.conciliacion = estado
+                    else:
+                        try:
+                            st.session_state.conciliacion = conciliacion.conciliar(
+                                estado, a_local(almacen.cargar(USUARIO_LOCAL)), COLUMNAS_LOCAL, saldo_inicial=saldo_estado)
+                        except ValueError as e:
+                            st.session_state.conciliacion = {"error": str(e)}
+                    st.session_state.estado_conciliado = clave_estado
+
+                resultado = st.session_state.conciliacion
+                if "error" in resultado:
+                    st.error(f"❌ No se pudo leer el estado de cuenta: {resultado['error']}")
+                else:
+                    cuentas = resultado["resumen"]
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Conciliados", f"{cuentas['conciliados']:,} de {cuentas['estado']:,}")
+                    col2.metric("Solo en el banco", f"{cuentas['solo_banco']:,}")
+                    col3.metric("Solo en tus registros", f"{cuentas['solo_libro']:,}",
+                                delta=f"{cuentas['posibles_duplicados']:,} posibles duplicados", delta_color="off")
+                    if resultado["dia_divergencia"] is not None:
+                        dia = resultado["saldos"].set_index("fecha").loc[resultado["dia_divergencia"]]
+                        st.warning(f"⚠️ Los saldos se separan el {resultado['dia_divergencia']:%d/%m/%Y}: "
+                                   f"banco ${dia['saldo_banco']:,.2f}, registros ${dia['saldo_libro']:,.2f}.")
+                    else:
+                        st.success("✅ El saldo de tus registros coincide con el del banco todos los días.")
+                    st.line_chart(resultado["saldos"].set_index("fecha")[["saldo_banco", "saldo_libro"]])
+                    with st.expander("Movimientos del banco que no registraste"):
+                        st.dataframe(resultado["solo_banco"], use_container_width=True)
+                    with st.expander("Movimientos registrados que no aparecen en el banco"):
+                        st.dataframe(resultado["solo_libro"], use_container_width=True)
+                    with st.expander("Movimientos conciliados"):
+                        st.dataframe(resultado["conciliados"], use_container_width=True)
+
             # Generar cashflow acumulado por día
-            df_filtrado = df_filtrado.sort_values("fecha")
-            df_filtrado["monto_signed"] = df_filtrado.apply(
-                lambda row: row["monto"] if row["tipo"] == "ingreso" else -row["monto"], axis=1)
-            df_filtrado["cashflow"] = df_filtrado["monto_signed"].cumsum() + saldo_inicial
-
-            line_chart = alt.Chart(df_filtrado).mark_line(point=True).encode(
-                x=alt.X('fecha:T', title='Fecha'),
-                y=alt.Y('cashflow:Q', title='Saldo acumulado'),
-                tooltip=['fecha', 'cashflow']
-            ).properties(
-                title="📈 Saldo acumulado durante el mes",
-                width=700,
-                height=300
-            )
+            df_filtrado = saldo_acumulado(df_filtrado, COLUMNAS_LOCAL, saldo_inicial)
+
+            line_chart = graficas.linea_saldo(df_filtrado)
 
             st.altair_chart(line_chart, use_container_width=True)
 
@@ -166,25 +239,18 @@ if not df.empty:
             df_filtrado["día"] = df_filtrado["fecha"].dt.day
 
             # Gráfica: Ingresos vs Egresos por día
-            chart_data = df_filtrado.groupby(["día", "tipo"])["monto"].sum().reset_index()
-
-            chart = alt.Chart(chart_data).mark_bar().encode(
-                x=alt.X('día:O', title='Día del mes'),
-                y=alt.Y('monto:Q', title='Monto'),
-                color=alt.Color('tipo:N', scale=alt.Scale(domain=['ingreso', 'egreso'],
-                                                          range=['#2ca02c', '#d62728'])),
-                tooltip=['día', 'tipo', 'monto']
-            ).properties(
-                width=700,
-                height=400,
-                title=f"Ingresos vs Egresos - {mes_seleccionado}/{año_seleccionado}"
-            )
+            chart = graficas.barras_diarias(df_filtrado, f"Ingresos vs Egresos - {mes_seleccionado}/{año_seleccionado}")
 
             st.altair_chart(chart, use_container_width=True)
 
             # Mostrar historial filtrado
             st.subheader("Historial de movimientos")
-            st.dataframe(df_filtrado.sort_values(by="fecha", ascending=False), use_container_width=True)
+            # El historial muestra el mes y las categorías elegidas: la versión los incluye
+            version_historial = None if version_libro is None else (version_libro, clave_mes, tuple(categoria_filtrada))
+            historial.mostrar(df_filtrado, COLUMNAS_LOCAL, clave="historial", version=version_historial)
 
 else:
     st.info("No hay datos cargados todavía.")
+
+# ⏱️ Tiempos de esta ejecución y percentiles entre sesiones
+trazas.panel(trazas.terminar_rerun())
@@ -0,0 +1,72 @@
+# Compara el código de análisis que tenían las apps en línea contra el módulo analitica.
+# Uso: python benchmarks/bench_analitica.py [--filas 1000000]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analitica import COLUMNAS_LOCAL, analizar, resumen_mes, saldo_acumulado, etiquetas_mes
+
+def libro_sintetico(filas, semilla=0):
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        "Fecha": pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, filas), unit="D"),
+        "Tipo": rng.choice(["Ingreso", "Egreso"], filas),
+        "Categoría": rng.choice(["Ventas", "Nómina", "Mercancías", "Gastos generales", "Otros"], filas),
+        "Monto": rng.gamma(2.0, 500.0, filas).round(2),
+    })
+
+def en_linea(df):
+    df = df.copy()
+    df["Mes"] = pd.to_datetime(df["Fecha"]).dt.to_period("M").astype(str)
+    meses = sorted(df["Mes"].unique())
+    df_mes = df[df["Mes"] == meses[-1]]
+    ingresos = df_mes[df_mes["Tipo"] == "Ingreso"]["Monto"].sum()
+    egresos = df_mes[df_mes["Tipo"] == "Egreso"]["Monto"].sum()
+    return ingresos, egresos, ingresos - egresos
+
+def vectorizado(df):
+    df = df.copy()
+    df["Mes"] = etiquetas_mes(df["Fecha"])
+    analisis = analizar(df)
+    resumen = resumen_mes(analisis, analisis["meses"][-1])
+    return resumen["ingresos"], resumen["egresos"], resumen["balance"]
+
+def signo_en_linea(df):
+    df = df.sort_values("fecha")
+    df["monto_signed"] = df.apply(lambda row: row["monto"] if row["tipo"] == "ingreso" else -row["monto"], axis=1)
+    return df["monto_signed"].cumsum()
+
+def signo_vectorizado(df):
+    return saldo_acumulado(df, COLUMNAS_LOCAL)["cashflow"]
+
+def medir(funcion, *args, repeticiones=3):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = libro_sintetico(args.filas)
+    t_linea, r_linea = medir(en_linea, df)
+    t_vec, r_vec = medir(vectorizado, df)
+    assert np.allclose(r_linea, r_vec), (r_linea, r_vec)
+    print(f"Resumen mensual ({args.filas:,} filas): en línea {t_linea:.3f}s, analitica {t_vec:.3f}s, x{t_linea / t_vec:.1f}")
+
+    local = df.rename(columns={"Fecha": "fecha", "Tipo": "tipo", "Categoría": "categoria", "Monto": "monto"})
+    local["tipo"] = local["tipo"].str.lower()
+    t_linea, r_linea = medir(signo_en_linea, local, repeticiones=1)
+    t_vec, r_vec = medir(signo_vectorizado, local)
+    assert np.isclose(r_linea.iloc[-1], r_vec.iloc[-1])
+    print(f"Saldo acumulado ({args.filas:,} filas): apply {t_linea:.3f}s, analitica {t_vec:.3f}s, x{t_linea / t_vec:.1f}")
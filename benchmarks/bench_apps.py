@@ -0,0 +1,262 @@
+# Mide las operaciones de las apps a varias escalas (usuarios × años) contra una hoja falsa con
+# latencia y cuota, y guarda los resultados en JSON para comparar entre versiones.
+# Uso: python benchmarks/bench_apps.py [--escalas 10x1,100x2] [--comparar anterior.json]
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analitica
+import conciliacion
+import graficas
+import indice_fechas
+import pronostico
+import sheets_utils
+from analitica import COLUMNAS_LOCAL, saldo_acumulado
+from esquema import tipar
+from resumenes import ResumenMensual
+from datos_sinteticos import libro_sintetico, libro_local, filas_hoja
+from gspread_falso import ClienteFalso, Red, LATENCIA, CUOTA_LECTURAS, CUOTA_ESCRITURAS
+
+ESCALAS = "10x1,100x2,250x5"
+DIRECTORIO_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+TOLERANCIA = 0.20   # fracción de aumento que cuenta como regresión
+MINIMO_REGRESION = 0.005  # segundos; diferencias menores son ruido
+
+def _limpiar_caches():
+    with sheets_utils._candado:
+        sheets_utils._datos_cache.clear()
+        sheets_utils._indices.clear()
+        sheets_utils._encabezados_cache.clear()
+
+def _reiniciar_registro():
+    with sheets_utils._candado_registro:
+        sheets_utils._registro.update(filas={}, escrito={}, version=None, vistos={}, programado=False)
+
+# Mejor de varias repeticiones; preparar() corre antes de cada una sin contar en el tiempo, y
+# el tiempo que pasa dentro de la hoja falsa se descuenta. Las llamadas y el tiempo de red
+# son los de la última repetición.
+def medir(funcion, red=None, preparar=None, repeticiones=3):
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        if red:
+            red.reiniciar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio - (red.tiempo_falso if red else 0.0))
+    resultado = {"segundos": round(min(tiempos), 6)}
+    if red:
+        resultado.update(red.resumen())
+    resultado["total"] = round(resultado["segundos"] + resultado.get("tiempo_red", 0.0), 6)
+    return resultado
+
+def _figuras_app(resumen, usuario):
+    df_ingresos = graficas.ingresos_del_resumen(resumen.del_usuario(usuario))
+    mes = resumen.meses(usuario)[-1]
+    del_mes = resumen.resumen_mes(usuario, mes)
+    figuras = [
+        graficas.histograma_categoria(df_ingresos, sorted(df_ingresos["Categoría"].unique())[0]),
+        graficas.ingresos_por_mes(df_ingresos),
+        graficas.pastel_categorias(del_mes["ingresos_por_categoria"], "Ingresos"),
+        graficas.pastel_categorias(del_mes["egresos_por_categoria"], "Egresos"),
+    ]
+    # Streamlit serializa cada figura; se incluye en la medición
+    return [f.to_json() for f in figuras]
+
+def _figuras_appy(df_mes):
+    df_saldo = saldo_acumulado(df_mes, COLUMNAS_LOCAL)
+    return [graficas.linea_saldo(df_saldo).to_dict(), graficas.barras_diarias(df_saldo, "Ingresos vs Egresos").to_dict()]
+
+# Bytes del libro con columnas de texto (object) contra el libro tipado de esquema
+def _memoria(libro):
+    return {
+        "object_bytes": int(libro.astype({c: object for c in ["Tipo", "Categoría", "Descripción", "Usuario"]})
+                            .memory_usage(deep=True).sum()),
+        "tipado_bytes": int(tipar(libro).memory_usage(deep=True).sum()),
+    }
+
+# Estado de cuenta del último año del libro local: fechas corridas 0-2 días, descripciones en
+# mayúsculas, algunos movimientos quitados y una comisión que solo está en el banco
+def _estado_banco(local, semilla):
+    rng = np.random.default_rng(semilla)
+    año = local[local["fecha"] > local["fecha"].max() - pd.Timedelta(days=365)].sort_values("fecha")
+    año = año.iloc[rng.permutation(len(año))[: int(len(año) * 0.99)]].sort_values("fecha")
+    monto = np.where(año["tipo"] == "ingreso", año["monto"], -año["monto"])
+    estado = pd.DataFrame({
+        "fecha": año["fecha"].to_numpy() + pd.to_timedelta(rng.integers(0, 3, len(año)), unit="D").to_numpy(),
+        "descripcion": año["descripcion"].astype(str).str.upper().to_numpy(),
+        "monto": monto,
+    })
+    comision = pd.DataFrame({"fecha": [estado["fecha"].iloc[len(estado) // 2]], "descripcion": ["COMISION"], "monto": [-12.5]})
+    estado = pd.concat([estado, comision]).sort_values("fecha", kind="stable", ignore_index=True)
+    return estado.assign(saldo=estado["monto"].cumsum().round(2))
+
+def correr_escala(usuarios, años, args):
+    red = Red(args.latencia, cuota_lecturas=args.cuota_lecturas, cuota_escrituras=args.cuota_escrituras)
+    cliente = ClienteFalso(red)
+    libro = libro_sintetico(usuarios, años, args.movimientos_por_mes, semilla=args.semilla)
+    filas = filas_hoja(libro)
+    hoja = cliente.open("circulo_financiero_unico").sheet1
+    hoja.filas = [list(f) for f in filas]
+    usuario = libro["Usuario"].iloc[len(libro) // 2]
+    operaciones = {}
+
+    def ejecutar(nombre, funcion, **opciones):
+        opciones.setdefault("repeticiones", args.repeticiones)
+        try:
+            operaciones[nombre] = medir(funcion, **opciones)
+        except Exception as e:
+            operaciones[nombre] = {"error": f"{type(e).__name__}: {e}"}
+
+    ejecutar("cargar_datos_usuario (frío)", lambda: sheets_utils.cargar_datos_usuario(hoja, usuario),
+             red=red, preparar=_limpiar_caches)
+    ejecutar("cargar_datos_usuario (caché)", lambda: sheets_utils.cargar_datos_usuario(hoja, usuario), red=red)
+    nuevo = libro[libro["Usuario"] == usuario].tail(1).assign(ID=None)
+    ejecutar("agregar_movimientos", lambda: sheets_utils.agregar_movimientos(hoja, nuevo), red=red)
+
+    correos = libro["Usuario"].unique()
+    # Un arranque en frío con todos los usuarios entrando: aquí aparece la cuota de lecturas
+    ejecutar("cargar todos los usuarios (frío)", lambda: [sheets_utils.cargar_datos_usuario(hoja, c) for c in correos],
+             red=red, preparar=_limpiar_caches, repeticiones=1)
+    ejecutar("registrar_usuario_activo", lambda: [sheets_utils.registrar_usuario_activo(c, cliente) for c in correos],
+             red=red, preparar=_reiniciar_registro)
+    ejecutar("sincronizar_registro", sheets_utils.sincronizar_registro, red=red,
+             preparar=lambda: [sheets_utils.registrar_usuario_activo(c, cliente) for c in correos])
+
+    df_usuario = sheets_utils.cargar_datos_usuario(hoja, usuario)
+
+    def analisis_mensual():
+        analisis = analitica.analizar(df_usuario)
+        return analitica.resumen_mes(analisis, analisis["meses"][-1])
+
+    ejecutar("analitica (análisis + mes)", analisis_mensual)
+    # Meses del libro de todos los usuarios por el índice de fechas: se arma una vez y cada mes es un corte
+    ultimo_mes = analitica.etiqueta_mes(int(analitica.claves_mes(libro["Fecha"]).max()))
+    ejecutar("índice de fechas (construir)", lambda: indice_fechas.obtener(libro), preparar=indice_fechas.limpiar_cache)
+    ejecutar("mes y mismo mes del año anterior (índice)", lambda: indice_fechas.obtener(libro).varios(
+        [indice_fechas.mismo_mes_hace(ultimo_mes), ultimo_mes]))
+    ejecutar("pronóstico de presupuesto", lambda: pronostico.pronosticar(df_usuario), preparar=pronostico.limpiar_cache)
+    with tempfile.TemporaryDirectory() as directorio:
+        resumen = ResumenMensual(os.path.join(directorio, "resumen"))
+        ejecutar("resumen mensual (reconstruir)", lambda: resumen.reconstruir(libro, todo=True))
+        ejecutar("gráficas app.py", lambda: _figuras_app(resumen, usuario), preparar=graficas.limpiar_cache)
+
+    local = libro_local(años, args.movimientos_por_mes * max(1, usuarios // 10), semilla=args.semilla)
+    mes = local["fecha"].dt.to_period("M").max()
+    df_mes = local[local["fecha"].dt.to_period("M") == mes]
+    ejecutar("gráficas appy.py", lambda: _figuras_appy(df_mes), preparar=graficas.limpiar_cache)
+    # Saldo de todo el libro local: la serie diaria se reduce a MAX_PUNTOS con LTTB
+    df_saldo = saldo_acumulado(local, COLUMNAS_LOCAL)
+    ejecutar("línea de saldo (todo el libro)", lambda: graficas.linea_saldo(df_saldo).to_dict(),
+             preparar=graficas.limpiar_cache)
+
+    estado = _estado_banco(local, args.semilla)
+    ejecutar("conciliación bancaria (1 año)", lambda: conciliacion.conciliar(estado, local))
+
+    # Reescribe la hoja entera: va al final porque cambia su contenido
+    df_guardar = libro[libro["Usuario"] == usuario]
+    ejecutar("guardar_datos_usuario", lambda: sheets_utils.guardar_datos_usuario(hoja, df_guardar), red=red,
+             preparar=lambda: setattr(hoja, "filas", [list(f) for f in filas]))
+
+    return {
+        "usuarios": usuarios,
+        "años": años,
+        "filas": len(libro),
+        "filas_usuario": int((libro["Usuario"] == usuario).sum()),
+        "filas_mes_local": len(df_mes),
+        "filas_estado_banco": len(estado),
+        "memoria": _memoria(libro),
+        "operaciones": operaciones,
+    }
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# Compara el total (cómputo + red simulada) de cada operación contra una corrida anterior
+def comparar(actual, anterior, tolerancia=TOLERANCIA):
+    base = {
+        (e["usuarios"], e["años"], nombre): op.get("total")
+        for e in anterior["escalas"] for nombre, op in e["operaciones"].items()
+    }
+    regresiones = []
+    for escala in actual["escalas"]:
+        for nombre, op in escala["operaciones"].items():
+            previo = base.get((escala["usuarios"], escala["años"], nombre))
+            if previo is None or "total" not in op:
+                continue
+            if op["total"] > previo * (1 + tolerancia) and op["total"] - previo > MINIMO_REGRESION:
+                regresiones.append((f"{escala['usuarios']}x{escala['años']}", nombre, previo, op["total"]))
+    return regresiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--escalas", default=ESCALAS, help="lista de usuarios x años, por ejemplo 10x1,100x2")
+    parser.add_argument("--movimientos-por-mes", type=int, default=40)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--latencia", type=float, default=LATENCIA)
+    parser.add_argument("--cuota-lecturas", type=int, default=CUOTA_LECTURAS)
+    parser.add_argument("--cuota-escrituras", type=int, default=CUOTA_ESCRITURAS)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="archivo JSON de resultados (por omisión en benchmarks/resultados/)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior; sale con código 1 si hay regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    # El registro escribe solo con sincronizar_registro, no desde el temporizador
+    sheets_utils.INTERVALO_REGISTRO = 24 * 3600
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "escalas": [],
+    }
+    for escala in args.escalas.split(","):
+        usuarios, años = (int(p) for p in escala.lower().split("x"))
+        resultado = correr_escala(usuarios, años, args)
+        resultados["escalas"].append(resultado)
+        print(f"\n{usuarios} usuarios × {años} años ({resultado['filas']:,} filas, {resultado['filas_usuario']:,} del usuario)")
+        memoria = resultado["memoria"]
+        print(f"  memoria del libro: {memoria['object_bytes'] / 2**20:,.1f} MB como object, "
+              f"{memoria['tipado_bytes'] / 2**20:,.1f} MB tipado")
+        for nombre, op in resultado["operaciones"].items():
+            if "error" in op:
+                print(f"  {nombre:32} ERROR {op['error']}")
+            else:
+                print(f"  {nombre:32} {op['segundos']:9.4f}s  red {op.get('tiempo_red', 0):8.3f}s  "
+                      f"llamadas {op.get('llamadas', 0):4}  esperas de cuota {op.get('esperas_cuota', 0)}")
+
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS, f"apps-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        for escala, nombre, previo, actual in regresiones:
+            print(f"REGRESIÓN {escala} {nombre}: {previo:.4f}s → {actual:.4f}s")
+        if regresiones:
+            sys.exit(1)
+        print("Sin regresiones")
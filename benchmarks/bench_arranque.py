@@ -0,0 +1,119 @@
+# Mide con python -X importtime lo que cuesta importar los módulos de cada app en un proceso nuevo
+# (con streamlit ya cargado, como lo deja el servidor) y falla si alguno carga un SDK pesado al
+# importarse o si el tiempo empeora contra una corrida anterior.
+# Uso: python benchmarks/bench_arranque.py [--repeticiones 5] [--comparar anterior.json]
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from precarga import GRUPOS
+
+# Lo que importa cada app (y el CLI de reportes) antes de dibujar la primera línea
+ARRANQUES = {
+    "app.py": ["graficas", "historial", "precarga", "trazas", "esquema", "indice_fechas", "resumenes", "almacenamiento", "sheets_utils"],
+    "appp.py": ["graficas", "historial", "precarga", "trazas", "esquema", "resumenes", "almacenamiento"],
+    "appy.py": ["conciliacion", "graficas", "historial", "precarga", "trazas", "analitica", "almacenamiento", "importacion", "indice_fechas", "resumenes"],
+    "reportes.py": ["reportes"],
+}
+# Paquetes que solo deben cargarse al primer uso o en el hilo de precarga
+PESADOS = sorted({m.split(".")[0] if m.split(".")[0] != "google" else m for g in GRUPOS.values() for m in g} | {"grpc"})
+DIRECTORIO_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+TOLERANCIA = 0.25         # fracción de aumento que cuenta como regresión
+MINIMO_REGRESION = 0.020  # segundos; diferencias menores son ruido
+
+PREVIO = "try:\n    import streamlit\nexcept ImportError:\n    pass\n"
+
+# Líneas de -X importtime: (nivel, módulo, propio, acumulado) en microsegundos
+def _lineas(salida):
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "imported package" in linea:
+            continue
+        cabeza, acumulado, nombre = linea.split("|", 2)
+        nombre = nombre[1:]
+        nivel = (len(nombre) - len(nombre.lstrip(" "))) // 2
+        yield nivel, nombre.strip(), int(cabeza.split(":", 1)[1]), int(acumulado)
+
+def _es_pesado(nombre):
+    return any(nombre == p or nombre.startswith(p + ".") for p in PESADOS)
+
+def medir_arranque(modulos):
+    codigo = PREVIO + f"import {', '.join(modulos)}\n"
+    proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], cwd=RAIZ,
+                             capture_output=True, text=True)
+    if proceso.returncode != 0:
+        return {"error": (proceso.stderr.strip().splitlines() or ["sin salida"])[-1]}
+    lineas = list(_lineas(proceso.stderr))
+    # Lo que cargó streamlit antes no cuenta: empieza después de su línea de nivel 0
+    inicio = next((i + 1 for i, (nivel, nombre, _, _) in enumerate(lineas) if nivel == 0 and nombre == "streamlit"), 0)
+    propias = lineas[inicio:]
+    raices = [(nombre, acumulado) for nivel, nombre, _, acumulado in propias if nivel == 0]
+    return {
+        "segundos": round(sum(a for _, a in raices) / 1e6, 4),
+        "modulos_cargados": len(propias),
+        "pesados": sorted({nombre for _, nombre, _, _ in propias if _es_pesado(nombre)}),
+        "mayores": [[n, round(a / 1e6, 4)] for n, a in sorted(raices, key=lambda r: -r[1])[:5]],
+    }
+
+# Mejor de varias corridas; la primera también compila los .pyc y no se cuenta si hay más
+def medir(modulos, repeticiones):
+    resultados = [medir_arranque(modulos) for _ in range(repeticiones + (1 if repeticiones > 1 else 0))]
+    if any("error" in r for r in resultados):
+        return next(r for r in resultados if "error" in r)
+    return min(resultados[1:] if len(resultados) > 1 else resultados, key=lambda r: r["segundos"])
+
+def comparar(actual, anterior, tolerancia=TOLERANCIA):
+    regresiones = []
+    for nombre, resultado in actual["arranques"].items():
+        previo = anterior.get("arranques", {}).get(nombre, {}).get("segundos")
+        if previo is None or "segundos" not in resultado:
+            continue
+        if resultado["segundos"] > previo * (1 + tolerancia) and resultado["segundos"] - previo > MINIMO_REGRESION:
+            regresiones.append((nombre, previo, resultado["segundos"]))
+    return regresiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="archivo JSON de resultados (por omisión en benchmarks/resultados/)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior; sale con código 1 si hay regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "arranques": {nombre: medir(modulos, args.repeticiones) for nombre, modulos in ARRANQUES.items()},
+    }
+    fallas = []
+    for nombre, r in resultados["arranques"].items():
+        if "error" in r:
+            print(f"  {nombre:12} ERROR {r['error']}")
+            fallas.append(f"{nombre}: no se pudo importar")
+            continue
+        print(f"  {nombre:12} {r['segundos'] * 1000:8.1f} ms  {r['modulos_cargados']:5} módulos  "
+              f"mayores: {', '.join(f'{n} {s * 1000:.0f} ms' for n, s in r['mayores'])}")
+        if r["pesados"]:
+            fallas.append(f"{nombre} carga al importarse: {', '.join(r['pesados'])}")
+
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS, f"arranque-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            for nombre, previo, actual in comparar(resultados, json.load(f), args.tolerancia):
+                fallas.append(f"REGRESIÓN {nombre}: {previo * 1000:.1f} ms → {actual * 1000:.1f} ms")
+    for falla in fallas:
+        print(falla)
+    if fallas:
+        sys.exit(1)
+    print("Arranque sin SDK pesados" + (" ni regresiones" if args.comparar else ""))
@@ -0,0 +1,85 @@
+# Libros sintéticos con forma realista: N usuarios × M años, nómina y renta mensuales más
+# movimientos sueltos repartidos según una mezcla de categorías configurable.
+import numpy as np
+import pandas as pd
+
+# Categoría → (peso, monto típico, descripciones posibles); mismas categorías que app.py
+MEZCLA = {
+    "Ingreso": {
+        "Ventas": (0.55, 1200.0, ["venta mostrador", "venta en línea", "pedido mayoreo"]),
+        "Préstamos": (0.05, 5000.0, ["préstamo banco", "préstamo familiar"]),
+        "Intereses": (0.10, 80.0, ["intereses cuenta", "rendimiento inversión"]),
+        "Otros": (0.30, 300.0, ["reembolso", "regalo", "devolución"]),
+    },
+    "Egreso": {
+        "Mercancías": (0.35, 900.0, ["proveedor", "materia prima", "inventario"]),
+        "Gastos generales": (0.25, 400.0, ["luz", "agua", "internet", "teléfono"]),
+        "Gastos financieros": (0.05, 150.0, ["comisión bancaria", "pago tarjeta"]),
+        "Gastos personales": (0.20, 250.0, ["súper", "restaurante", "farmacia", "cine"]),
+        "Combustibles": (0.10, 600.0, ["gasolina", "diésel"]),
+        "Otros": (0.05, 200.0, ["varios"]),
+    },
+}
+FRACCION_INGRESOS = 0.35  # de los movimientos sueltos
+
+def _sueltos(rng, tipo, n, mezcla):
+    categorias = list(mezcla[tipo])
+    pesos = np.array([mezcla[tipo][c][0] for c in categorias])
+    elegidas = rng.choice(len(categorias), n, p=pesos / pesos.sum())
+    escala = np.array([mezcla[tipo][c][1] for c in categorias])[elegidas]
+    descripciones = np.array([
+        mezcla[tipo][categorias[i]][2][j % len(mezcla[tipo][categorias[i]][2])]
+        for i, j in zip(elegidas, rng.integers(0, 1000, n))
+    ], dtype=object)
+    return pd.DataFrame({
+        "Tipo": tipo,
+        "Categoría": np.array(categorias, dtype=object)[elegidas],
+        "Descripción": descripciones,
+        "Monto": (rng.gamma(2.0, escala / 2.0)).round(2),
+    })
+
+# Un libro en formato de Sheets (Fecha, Tipo, Categoría, Descripción, Monto, Usuario, ID)
+def libro_sintetico(usuarios=10, años=1, movimientos_por_mes=40, mezcla=MEZCLA, inicio="2020-01-01", semilla=0):
+    rng = np.random.default_rng(semilla)
+    meses = pd.date_range(inicio, periods=12 * años, freq="MS")
+    partes = []
+    for u in range(usuarios):
+        correo = f"usuario{u:04d}@ejemplo.com"
+        n = int(rng.poisson(movimientos_por_mes * len(meses)))
+        sueltos = pd.concat([
+            _sueltos(rng, "Ingreso", int(n * FRACCION_INGRESOS), mezcla),
+            _sueltos(rng, "Egreso", n - int(n * FRACCION_INGRESOS), mezcla),
+        ], ignore_index=True)
+        dias = rng.integers(0, (meses[-1] + pd.offsets.MonthEnd(1) - meses[0]).days + 1, len(sueltos))
+        sueltos["Fecha"] = meses[0] + pd.to_timedelta(dias, unit="D")
+        # Recurrentes: nómina el día 1 y renta el día 5 de cada mes
+        nomina = round(float(rng.uniform(8000, 30000)), 2)
+        recurrentes = pd.DataFrame({
+            "Fecha": list(meses) + list(meses + pd.Timedelta(days=4)),
+            "Tipo": ["Ingreso"] * len(meses) + ["Egreso"] * len(meses),
+            "Categoría": ["Nómina"] * len(meses) + ["Gastos generales"] * len(meses),
+            "Descripción": ["nómina"] * len(meses) + ["renta"] * len(meses),
+            "Monto": [nomina] * len(meses) + [round(nomina * 0.3, 2)] * len(meses),
+        })
+        libro = pd.concat([sueltos, recurrentes], ignore_index=True)
+        libro["Usuario"] = correo
+        partes.append(libro)
+    libro = pd.concat(partes, ignore_index=True).sort_values("Fecha", kind="stable").reset_index(drop=True)
+    libro["ID"] = [f"m{i:011x}" for i in rng.permutation(len(libro))]
+    return libro[["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID"]]
+
+# Filas de texto listas para una hoja (encabezados incluidos), como las deja la app
+def filas_hoja(libro):
+    datos = libro.assign(Fecha=libro["Fecha"].dt.strftime("%Y-%m-%d"))
+    return [list(datos.columns)] + datos.astype(object).values.tolist()
+
+# Libro local de appy.py (fecha, descripcion, tipo, categoria, monto) de un solo usuario
+def libro_local(años=1, movimientos_por_mes=40, mezcla=MEZCLA, semilla=0):
+    libro = libro_sintetico(1, años, movimientos_por_mes, mezcla, semilla=semilla)
+    return pd.DataFrame({
+        "fecha": libro["Fecha"],
+        "descripcion": libro["Descripción"],
+        "tipo": libro["Tipo"].str.lower(),
+        "categoria": libro["Categoría"],
+        "monto": libro["Monto"],
+    })
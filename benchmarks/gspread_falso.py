@@ -0,0 +1,250 @@
+# Doble en memoria de la parte de gspread que usa sheets_utils: cliente, libro y hoja.
+# Cada llamada suma latencia y consume cuota (lecturas y escrituras por minuto, como la API
+# de Sheets). El tiempo de red se lleva en un reloj simulado, así los benchmarks miden el
+# costo propio sin dormir; con dormir=True las esperas son reales. El tiempo que el doble pasa
+# copiando celdas se lleva aparte (tiempo_falso) para descontarlo de las mediciones.
+import re
+import time
+from collections import Counter, deque
+
+LATENCIA = 0.08           # segundos por llamada
+LATENCIA_POR_CELDA = 2e-6  # segundos por celda leída o escrita
+CUOTA_LECTURAS = 60       # llamadas por minuto
+CUOTA_ESCRITURAS = 60
+
+def _a1(referencia):
+    coincidencia = re.match(r"(?:.*!)?([A-Z]*)(\d*)", referencia)
+    letras, numero = coincidencia.groups()
+    columna = 0
+    for letra in letras:
+        columna = columna * 26 + ord(letra) - 64
+    return (int(numero) if numero else None), (columna or None)
+
+class Red:
+    def __init__(self, latencia=LATENCIA, latencia_por_celda=LATENCIA_POR_CELDA,
+                 cuota_lecturas=CUOTA_LECTURAS, cuota_escrituras=CUOTA_ESCRITURAS, dormir=False):
+        self.latencia = latencia
+        self.latencia_por_celda = latencia_por_celda
+        self.cuotas = {"lectura": cuota_lecturas, "escritura": cuota_escrituras}
+        self.dormir = dormir
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.reloj = 0.0  # segundos de red simulados
+        self.tiempo_falso = 0.0  # segundos de CPU gastados dentro del doble
+        self.llamadas = Counter()
+        self.esperas_cuota = 0
+        self.celdas = 0
+        self._ventanas = {"lectura": deque(), "escritura": deque()}
+
+    # Espera lo necesario para respetar la cuota y suma la latencia de la llamada
+    def llamada(self, metodo, clase, celdas=0, inicio=None):
+        if inicio is not None:
+            self.tiempo_falso += time.perf_counter() - inicio
+        ventana = self._ventanas[clase]
+        while ventana and ventana[0] <= self.reloj - 60:
+            ventana.popleft()
+        if len(ventana) >= self.cuotas[clase]:
+            espera = ventana[0] + 60 - self.reloj
+            self.esperas_cuota += 1
+            self._avanzar(espera)
+            ventana.popleft()
+        ventana.append(self.reloj)
+        self.llamadas[metodo] += 1
+        self.celdas += celdas
+        self._avanzar(self.latencia + celdas * self.latencia_por_celda)
+
+    def _avanzar(self, segundos):
+        self.reloj += segundos
+        if self.dormir:
+            time.sleep(segundos)
+
+    def resumen(self):
+        return {
+            "llamadas": sum(self.llamadas.values()),
+            "por_metodo": dict(self.llamadas),
+            "tiempo_red": round(self.reloj, 4),
+            "esperas_cuota": self.esperas_cuota,
+            "celdas": self.celdas,
+            "tiempo_falso": round(self.tiempo_falso, 6),
+        }
+
+class Celda:
+    def __init__(self, valor):
+        self.value = valor
+
+class HojaFalsa:
+    _siguiente_id = 0
+
+    def __init__(self, libro, titulo, filas=None, red=None):
+        HojaFalsa._siguiente_id += 1
+        self.id = HojaFalsa._siguiente_id
+        self.spreadsheet = libro
+        self.spreadsheet_id = libro.id
+        self.title = titulo
+        self.red = red or libro.red
+        self.filas = [list(f) for f in (filas or [])]
+        self.row_count = max(1000, len(self.filas))
+        self.col_count = 26
+
+    def _valor(self, fila, columna):
+        if fila - 1 < len(self.filas) and columna - 1 < len(self.filas[fila - 1]):
+            return self.filas[fila - 1][columna - 1]
+        return ""
+
+    def _poner(self, fila, columna, valor):
+        while len(self.filas) < fila:
+            self.filas.append([])
+        registro = self.filas[fila - 1]
+        while len(registro) < columna:
+            registro.append("")
+        registro[columna - 1] = valor
+        self.row_count = max(self.row_count, fila)
+
+    # Rango A1 → bloque de valores sin filas ni celdas vacías al final, como la API
+    def _bloque(self, rango):
+        inicio, separador, fin = rango.partition(":")
+        fila_1, columna_1 = _a1(inicio)
+        fila_2, columna_2 = _a1(fin) if separador else (fila_1, columna_1)
+        fila_1, columna_1 = fila_1 or 1, columna_1 or 1
+        bloque = [f[columna_1 - 1:columna_2] for f in self.filas[fila_1 - 1:fila_2]]
+        for valores in bloque:
+            while valores and valores[-1] == "":
+                valores.pop()
+        while bloque and not bloque[-1]:
+            bloque.pop()
+        return bloque
+
+    def _escribir(self, rango, valores):
+        fila, columna = _a1(rango.partition(":")[0])
+        for i, registro in enumerate(valores):
+            for j, valor in enumerate(registro):
+                self._poner((fila or 1) + i, (columna or 1) + j, valor)
+
+    def _ultima_fila(self):
+        ultima = len(self.filas)
+        while ultima and not any(v != "" for v in self.filas[ultima - 1]):
+            ultima -= 1
+        return ultima
+
+    # ---------- lecturas ----------
+    def row_values(self, fila, **opciones):
+        inicio = time.perf_counter()
+        valores = self._bloque(f"A{fila}:{fila}")
+        self.red.llamada("row_values", "lectura", sum(map(len, valores)), inicio)
+        return valores[0] if valores else []
+
+    def col_values(self, columna, **opciones):
+        inicio = time.perf_counter()
+        valores = [f[columna - 1] if columna - 1 < len(f) else "" for f in self.filas]
+        while valores and valores[-1] == "":
+            valores.pop()
+        self.red.llamada("col_values", "lectura", len(valores), inicio)
+        return valores
+
+    def acell(self, referencia, **opciones):
+        self.red.llamada("acell", "lectura", 1)
+        return Celda(self._valor(*_a1(referencia)))
+
+    def batch_get(self, rangos, **opciones):
+        inicio = time.perf_counter()
+        bloques = [self._bloque(r) for r in rangos]
+        self.red.llamada("batch_get", "lectura", sum(len(f) for b in bloques for f in b), inicio)
+        return bloques
+
+    def get_all_values(self, **opciones):
+        inicio = time.perf_counter()
+        valores = self._bloque("A1:")
+        self.red.llamada("get_all_values", "lectura", sum(map(len, valores)), inicio)
+        return valores
+
+    # ---------- escrituras ----------
+    def update(self, values=None, range_name=None, **opciones):
+        inicio = time.perf_counter()
+        self._escribir(range_name or "A1", values)
+        self.red.llamada("update", "escritura", sum(map(len, values)), inicio)
+
+    def batch_update(self, datos, **opciones):
+        inicio = time.perf_counter()
+        for dato in datos:
+            self._escribir(dato["range"], dato["values"])
+        self.red.llamada("batch_update", "escritura", sum(len(f) for d in datos for f in d["values"]), inicio)
+
+    def append_rows(self, filas, **opciones):
+        inicio = time.perf_counter()
+        ultima = self._ultima_fila()
+        for i, registro in enumerate(filas):
+            for j, valor in enumerate(registro):
+                self._poner(ultima + 1 + i, j + 1, valor)
+        self.red.llamada("append_rows", "escritura", sum(map(len, filas)), inicio)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{ultima + 1}:Z{ultima + len(filas)}"}}
+
+    def update_cells(self, celdas, **opciones):
+        inicio = time.perf_counter()
+        for celda in celdas:
+            self._poner(celda.row, celda.col, celda.value)
+        self.red.llamada("update_cells", "escritura", len(celdas), inicio)
+
+    def clear(self):
+        self.filas = []
+        self.red.llamada("clear", "escritura")
+
+    def resize(self, rows=None, cols=None):
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+        self.red.llamada("resize", "escritura")
+
+class LibroFalso:
+    def __init__(self, nombre, red):
+        self.id = f"libro-{nombre}"
+        self.title = nombre
+        self.red = red
+        self.hojas = {}
+
+    @property
+    def sheet1(self):
+        if not self.hojas:
+            self.hojas["Hoja 1"] = HojaFalsa(self, "Hoja 1")
+        return next(iter(self.hojas.values()))
+
+    def worksheet(self, titulo):
+        self.red.llamada("worksheet", "lectura")
+        if titulo not in self.hojas:
+            from gspread.exceptions import WorksheetNotFound
+            raise WorksheetNotFound(titulo)
+        return self.hojas[titulo]
+
+    def add_worksheet(self, title, rows=1000, cols=26, **opciones):
+        self.red.llamada("add_worksheet", "escritura")
+        self.hojas[title] = HojaFalsa(self, title)
+        return self.hojas[title]
+
+    # Borrado de filas con deleteDimension (eliminar_filas)
+    def batch_update(self, cuerpo):
+        inicio = time.perf_counter()
+        por_id = {h.id: h for h in self.hojas.values()}
+        for pedido in cuerpo.get("requests", []):
+            rango = pedido["deleteDimension"]["range"]
+            del por_id[rango["sheetId"]].filas[rango["startIndex"]:rango["endIndex"]]
+        self.red.llamada("spreadsheet.batch_update", "escritura", 0, inicio)
+        return {}
+
+    # Lectura completa que usa gspread_dataframe.get_as_dataframe
+    def values_get(self, rango, params=None):
+        inicio = time.perf_counter()
+        hoja = self.hojas[rango.split("!")[0].strip("'")]
+        valores = hoja._bloque("A1:")
+        self.red.llamada("values_get", "lectura", sum(map(len, valores)), inicio)
+        return {"range": rango, "values": valores}
+
+class ClienteFalso:
+    def __init__(self, red=None):
+        self.red = red or Red()
+        self.libros = {}
+        self.http_client = None
+
+    def open(self, nombre):
+        self.red.llamada("open", "lectura")
+        if nombre not in self.libros:
+            self.libros[nombre] = LibroFalso(nombre, self.red)
+        return self.libros[nombre]
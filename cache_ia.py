@@ -0,0 +1,219 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+ARCHIVO_CACHE = "cache_ia.sqlite3"
+TTL = 7 * 24 * 3600  # segundos
+MAX_ENTRADAS = 500
+MAX_BYTES = 20 * 1024 * 1024
+# Una respuesta anterior del mismo usuario se reutiliza con un prompt de actualización si su libro
+# sigue entero dentro del actual y se agregaron a lo sumo FILAS_CERCANAS movimientos o
+# FRACCION_CERCANA del libro, lo que sea mayor
+FILAS_CERCANAS = 20
+FRACCION_CERCANA = 0.05
+COLUMNAS_NORMALIZADAS = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto"]
+
+PLANTILLA_ACTUALIZACION = """
+Antes le diste a este usuario el siguiente análisis:
+
+{respuesta_anterior}
+
+Desde entonces registró estos movimientos nuevos (los anteriores no cambiaron):
+
+{filas_nuevas}
+
+Actualiza el análisis anterior teniendo en cuenta solo estos cambios y conserva su formato.
+La tarea original era:
+{tarea}
+"""
+
+# 🔑 Libro normalizado: mismas columnas, fechas como día y montos redondeados, sin el orden de las filas
+def normalizar_libro(df):
+    norm = df.reindex(columns=[c for c in COLUMNAS_NORMALIZADAS if c in df.columns]).copy()
+    if "Fecha" in norm.columns:
+        norm["Fecha"] = pd.to_datetime(norm["Fecha"], errors="coerce").dt.strftime("%Y-%m-%d")
+    if "Monto" in norm.columns:
+        norm["Monto"] = pd.to_numeric(norm["Monto"], errors="coerce").round(2)
+    for columna in norm.columns.difference(["Fecha", "Monto"]):
+        norm[columna] = norm[columna].astype("string").str.strip()
+    return norm.reset_index(drop=True)
+
+def huellas_filas(norm):
+    if norm.empty:
+        return np.array([], dtype=np.uint64)
+    return np.sort(pd.util.hash_pandas_object(norm, index=False).to_numpy(dtype=np.uint64))
+
+# ¿Están todas las huellas de `parte` en `todo`, contando repeticiones? Ambas vienen ordenadas.
+def _contenidas(parte, todo):
+    valores, cuantas = np.unique(parte, return_counts=True)
+    posiciones = np.searchsorted(todo, valores, side="left")
+    disponibles = np.searchsorted(todo, valores, side="right") - posiciones
+    return bool(np.all(disponibles >= cuantas))
+
+# Por cada huella de `todo` (ordenado), si corresponde a una de `parte` (las primeras de cada valor)
+def _contenidas_por_fila(todo, parte):
+    if len(parte) == 0:
+        return np.zeros(len(todo), dtype=bool)
+    valores, cuantas = np.unique(parte, return_counts=True)
+    primera = np.searchsorted(todo, todo, side="left")
+    ocurrencia = np.arange(len(todo)) - primera
+    indice = np.searchsorted(valores, todo)
+    presente = (indice < len(valores)) & (valores[np.minimum(indice, len(valores) - 1)] == todo)
+    return presente & (ocurrencia < np.where(presente, cuantas[np.minimum(indice, len(valores) - 1)], 0))
+
+# Usuarios del libro: la clave de la familia nunca junta libros de personas distintas
+def _usuarios(df):
+    if "Usuario" not in df.columns:
+        return ""
+    return "|".join(sorted(df["Usuario"].dropna().astype(str).str.strip().str.lower().unique()))
+
+def _sha(*partes):
+    h = hashlib.sha256()
+    for parte in partes:
+        h.update(parte if isinstance(parte, bytes) else str(parte).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class CacheIA:
+    def __init__(self, archivo=ARCHIVO_CACHE, ttl=TTL, max_entradas=MAX_ENTRADAS, max_bytes=MAX_BYTES):
+        self.archivo = archivo
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._candado = threading.Lock()
+        with self._conectar() as conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    clave TEXT PRIMARY KEY,
+                    familia TEXT NOT NULL,
+                    huellas BLOB NOT NULL,
+                    respuesta TEXT NOT NULL,
+                    tamano INTEGER NOT NULL,
+                    creado REAL NOT NULL,
+                    usado REAL NOT NULL
+                )""")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_familia ON respuestas (familia, usado)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.archivo, timeout=10)
+
+    def _leer(self, clave):
+        with self._conectar() as conexion:
+            fila = conexion.execute(
+                "SELECT respuesta, creado FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            if fila is None or time.time() - fila[1] > self.ttl:
+                return None
+            conexion.execute("UPDATE respuestas SET usado = ? WHERE clave = ?", (time.time(), clave))
+            return fila[0]
+
+    def _cercana(self, familia, huellas):
+        limite = time.time() - self.ttl
+        with self._conectar() as conexion:
+            candidatas = conexion.execute(
+                "SELECT clave, huellas, respuesta FROM respuestas WHERE familia = ? AND creado >= ? "
+                "ORDER BY usado DESC LIMIT 5", (familia, limite)).fetchall()
+        tolerancia = max(FILAS_CERCANAS, int(FRACCION_CERCANA * len(huellas)))
+        for clave, blob, respuesta in candidatas:
+            anteriores = np.frombuffer(blob, dtype=np.uint64)
+            # Solo altas: con bajas o correcciones el análisis anterior habla de datos que ya no están
+            if len(anteriores) > len(huellas) or not _contenidas(anteriores, huellas):
+                continue
+            nuevas = ~_contenidas_por_fila(huellas, anteriores)
+            if nuevas.sum() <= tolerancia:
+                return respuesta, nuevas
+        return None
+
+    def _guardar(self, clave, familia, huellas, respuesta):
+        ahora = time.time()
+        with self._conectar() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (clave, familia, huellas.tobytes(), respuesta, len(respuesta.encode("utf-8")) + huellas.nbytes, ahora, ahora))
+            self._desalojar(conexion, ahora)
+
+    # TTL primero; después LRU hasta respetar el máximo de entradas y de bytes
+    def _desalojar(self, conexion, ahora):
+        conexion.execute("DELETE FROM respuestas WHERE creado < ?", (ahora - self.ttl,))
+        filas = conexion.execute("SELECT clave, tamano FROM respuestas ORDER BY usado DESC").fetchall()
+        total, conservar = 0, 0
+        for clave, tamano in filas:
+            if conservar >= self.max_entradas or total + tamano > self.max_bytes:
+                break
+            total += tamano
+            conservar += 1
+        sobrantes = [(clave,) for clave, _ in filas[conservar:]]
+        if sobrantes:
+            conexion.executemany("DELETE FROM respuestas WHERE clave = ?", sobrantes)
+
+    # Busca una respuesta exacta en caché; si no la hay arma el prompt a enviar (completo o de
+    # actualización sobre una respuesta cercana). Devuelve (respuesta, prompt, guardar).
+    def _preparar(self, df, plantilla, valores, nombre_modelo, formatear_datos):
+        norm = normalizar_libro(df)
+        huellas = huellas_filas(norm)
+        parametros = json.dumps(valores, sort_keys=True, ensure_ascii=False)
+        familia = _sha(plantilla, parametros, nombre_modelo, _usuarios(df))
+        clave = _sha(familia, huellas.tobytes())
+
+        def guardar(respuesta):
+            with self._candado:
+                self._guardar(clave, familia, huellas, respuesta)
+
+        with self._candado:
+            respuesta = self._leer(clave)
+        if respuesta is not None:
+            return respuesta, None, guardar
+
+        with self._candado:
+            cercana = self._cercana(familia, huellas)
+        if cercana is not None:
+            respuesta_anterior, nuevas = cercana
+            huellas_df = pd.util.hash_pandas_object(norm, index=False).to_numpy(dtype=np.uint64)
+            filas_nuevas = df.reset_index(drop=True)[np.isin(huellas_df, huellas[nuevas])]
+            prompt = PLANTILLA_ACTUALIZACION.format(
+                respuesta_anterior=respuesta_anterior,
+                filas_nuevas=filas_nuevas.to_csv(index=False) if not filas_nuevas.empty else "(ninguno)",
+                tarea=plantilla.format(texto_datos="(ver cambios arriba)", **valores),
+            )
+        else:
+            prompt = plantilla.format(texto_datos=formatear_datos(df), **valores)
+        return None, prompt, guardar
+
+    # Devuelve la respuesta del modelo para la plantilla aplicada al libro df.
+    # generar(prompt) -> texto solo se llama si no hay respuesta utilizable en caché;
+    # formatear_datos(df) -> texto arma el bloque {texto_datos} del prompt completo.
+    def responder(self, df, plantilla, valores, nombre_modelo, generar, formatear_datos):
+        respuesta, prompt, guardar = self._preparar(df, plantilla, valores, nombre_modelo, formatear_datos)
+        if respuesta is not None:
+            return respuesta
+        respuesta = generar(prompt)
+        guardar(respuesta)
+        return respuesta
+
+    # Igual que responder, pero generar(prompt) devuelve un iterador de trozos de texto que se
+    # reenvían a medida que llegan. La respuesta solo se guarda si el iterador se consumió entero.
+    def responder_stream(self, df, plantilla, valores, nombre_modelo, generar, formatear_datos):
+        respuesta, prompt, guardar = self._preparar(df, plantilla, valores, nombre_modelo, formatear_datos)
+        if respuesta is not None:
+            yield respuesta
+            return
+        trozos = []
+        for trozo in generar(prompt):
+            trozos.append(trozo)
+            yield trozo
+        guardar("".join(trozos))
+
+_cache = None
+_candado_cache = threading.Lock()
+
+def obtener_cache():
+    global _cache
+    with _candado_cache:
+        if _cache is None:
+            _cache = CacheIA()
+        return _cache
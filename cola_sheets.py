@@ -0,0 +1,268 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import trazas
+from esquema import tipar
+from sheets_utils import conectar_google_sheets, obtener_hoja, agregar_movimientos, asignar_ids, ids_en_hoja, error_transitorio
+
+ARCHIVO_DIARIO = "pendientes_sheets.jsonl"
+ARCHIVO_FALLIDOS = "fallidos_sheets.jsonl"  # envíos que no se pudieron guardar, para revisarlos o reencolarlos
+VENTANA = 2.0  # segundos que el trabajador espera para juntar escrituras en un solo envío
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 60.0
+MAX_INTENTOS = 8  # intentos de un envío antes de apartarlo en ARCHIVO_FALLIDOS
+
+PENDIENTE = "pendiente"
+SINCRONIZADO = "sincronizado"
+ERROR = "error"
+
+# 📨 Cola de escritura en segundo plano: la app encola y sigue, un hilo agrupa y sincroniza.
+# Todo lo encolado se escribe antes en un diario local para sobrevivir a un reinicio. Los
+# reintentos y los envíos recuperados del diario se cruzan por ID con la hoja, así un envío que
+# falló a la mitad no duplica las filas que sí llegaron. Tras MAX_INTENTOS (o un error que no se
+# arregla esperando) el envío sale de la cola y queda en el archivo de fallidos.
+class ColaEscritura:
+    def __init__(self, archivo=ARCHIVO_DIARIO, ventana=VENTANA, archivo_fallidos=ARCHIVO_FALLIDOS):
+        self.archivo = archivo
+        self.archivo_fallidos = archivo_fallidos
+        self.ventana = ventana
+        self._candado = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._sin_pendientes = threading.Event()
+        self._pendientes = []
+        self._estados = {}
+        self._errores = {}
+        self._hojas = {}
+        self._recuperar_diario()
+        self._hilo = threading.Thread(target=self._trabajar, name="cola-sheets", daemon=True)
+        self._hilo.start()
+
+    # ---------- diario local ----------
+    def _recuperar_diario(self):
+        if not os.path.exists(self.archivo):
+            self._sin_pendientes.set()
+            return
+        entradas, hechos = {}, set()
+        with open(self.archivo, encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue  # línea truncada por un corte a mitad de escritura
+                if "hechos" in registro:
+                    hechos.update(registro["hechos"])
+                else:
+                    entradas[registro["id"]] = registro
+        self._pendientes = [e for i, e in entradas.items() if i not in hechos]
+        for entrada in self._pendientes:
+            # Pudo llegar a la hoja antes del corte: se cruza por ID antes de enviarla
+            entrada["recuperada"] = True
+            self._estados[entrada["id"]] = PENDIENTE
+        self._reescribir_diario()
+        if self._pendientes:
+            self._hay_trabajo.set()
+        else:
+            self._sin_pendientes.set()
+
+    def _anotar(self, registro, archivo=None):
+        with open(archivo or self.archivo, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _reescribir_diario(self):
+        if not self._pendientes:
+            if os.path.exists(self.archivo):
+                os.remove(self.archivo)
+            return
+        temporal = self.archivo + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for entrada in self._pendientes:
+                f.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+        os.replace(temporal, self.archivo)
+
+    # ---------- API pública ----------
+    def encolar(self, hoja, df_nuevos, recuperada=False):
+        clave = (hoja.spreadsheet.title, hoja.title)
+        with self._candado:
+            self._hojas[clave] = hoja
+        return self._encolar(clave, df_nuevos, recuperada)
+
+    def _encolar(self, clave, df_nuevos, recuperada=False):
+        df_nuevos = asignar_ids(df_nuevos)
+        entrada = {
+            "id": uuid.uuid4().hex,
+            "libro": clave[0],
+            "hoja": clave[1],
+            "filas": df_nuevos.astype(object).where(df_nuevos.notna(), None).to_dict(orient="records"),
+        }
+        if recuperada:
+            entrada["recuperada"] = True
+        with self._candado:
+            self._anotar(entrada)
+            self._pendientes.append(entrada)
+            self._estados[entrada["id"]] = PENDIENTE
+            self._sin_pendientes.clear()
+        self._hay_trabajo.set()
+        return entrada["id"]
+
+    def estado(self, id_envio):
+        with self._candado:
+            return self._estados.get(id_envio, SINCRONIZADO), self._errores.get(id_envio)
+
+    def pendientes(self, hoja):
+        clave = (hoja.spreadsheet.title, hoja.title)
+        with self._candado:
+            filas = [f for e in self._pendientes if (e["libro"], e["hoja"]) == clave for f in e["filas"]]
+        df = tipar(pd.DataFrame(filas))
+        # Índices negativos: todavía no tienen número de fila en la hoja
+        df.index = range(-1, -len(df) - 1, -1)
+        return df
+
+    # Identificadores de los envíos de la hoja que siguen en la cola; cambian con cada alta o envío
+    def envios_pendientes(self, hoja):
+        clave = (hoja.spreadsheet.title, hoja.title)
+        with self._candado:
+            return tuple(e["id"] for e in self._pendientes if (e["libro"], e["hoja"]) == clave)
+
+    def esperar(self, timeout=None):
+        return self._sin_pendientes.wait(timeout)
+
+    # ---------- trabajador ----------
+    def _trabajar(self):
+        while True:
+            self._hay_trabajo.wait()
+            time.sleep(self.ventana)
+            with self._candado:
+                self._hay_trabajo.clear()
+                lote = [e for e in self._pendientes if self._estados.get(e["id"]) == PENDIENTE]
+            grupos = {}
+            for entrada in lote:
+                grupos.setdefault((entrada["libro"], entrada["hoja"]), []).append(entrada)
+            for clave, entradas in grupos.items():
+                with trazas.traza("cola-sheets"):
+                    self._enviar(clave, entradas)
+            with self._candado:
+                if not any(self._estados.get(e["id"]) == PENDIENTE for e in self._pendientes):
+                    self._sin_pendientes.set()
+
+    def _resolver_hoja(self, clave):
+        with self._candado:
+            hoja = self._hojas.get(clave)
+        if hoja is None:
+            cliente, _ = conectar_google_sheets()
+            hoja = obtener_hoja(cliente, clave[0], clave[1])
+            with self._candado:
+                self._hojas[clave] = hoja
+        return hoja
+
+    # Un solo append por libro/hoja con todas las filas acumuladas en la ventana
+    def _enviar(self, clave, entradas):
+        df = pd.DataFrame([f for e in entradas for f in e["filas"]])
+        cruzar = any(e.get("recuperada") for e in entradas)
+        intento = 0
+        while True:
+            try:
+                hoja = self._resolver_hoja(clave)
+                faltan = df
+                if cruzar and "ID" in df.columns:
+                    faltan = df[~df["ID"].astype(str).isin(ids_en_hoja(hoja))]
+                agregar_movimientos(hoja, faltan)
+                break
+            except Exception as error:
+                intento += 1
+                # Las filas de un append que falló pueden haber llegado en parte
+                cruzar = True
+                if not error_transitorio(error) or intento >= MAX_INTENTOS:
+                    self._apartar(entradas, error)
+                    return
+                espera = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** intento) * (1 + random.random())
+                time.sleep(espera)
+        self._terminar(entradas)
+
+    def _terminar(self, entradas, estado=SINCRONIZADO):
+        ids = [e["id"] for e in entradas]
+        enviados = set(ids)
+        with self._candado:
+            for id_envio in ids:
+                self._estados[id_envio] = estado
+            self._pendientes = [e for e in self._pendientes if e["id"] not in enviados]
+            self._anotar({"hechos": ids})
+            if not self._pendientes:
+                self._reescribir_diario()
+
+    # El envío sale de la cola (ya no aparece como pendiente) y queda en el archivo de fallidos
+    def _apartar(self, entradas, error):
+        with self._candado:
+            for entrada in entradas:
+                self._errores[entrada["id"]] = str(error)
+                registro = {k: v for k, v in entrada.items() if k != "recuperada"}
+                self._anotar(dict(registro, error=str(error), instante=time.time()), self.archivo_fallidos)
+        self._terminar(entradas, ERROR)
+
+    # Filas de los envíos apartados, con el libro/hoja de destino y el error de cada uno
+    def fallidos(self):
+        if not os.path.exists(self.archivo_fallidos):
+            return pd.DataFrame()
+        filas = []
+        with open(self.archivo_fallidos, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue
+                filas += [dict(fila, envio=registro["id"], libro=registro["libro"], hoja=registro["hoja"], error=registro["error"])
+                          for fila in registro["filas"]]
+        return pd.DataFrame(filas)
+
+    # Vuelve a encolar los envíos apartados (con sus mismos IDs, así no se duplican) y vacía el archivo.
+    # Cada fila vuelve al libro/hoja donde iba; esas hojas se abren de nuevo al enviarlas.
+    def reintentar_fallidos(self):
+        fallidos = self.fallidos()
+        if fallidos.empty:
+            return []
+        with self._candado:
+            os.remove(self.archivo_fallidos)
+        envios = []
+        for clave, filas in fallidos.groupby(["libro", "hoja"], sort=False):
+            with self._candado:
+                self._hojas.pop(clave, None)
+            envios.append(self._encolar(clave, filas.drop(columns=["envio", "libro", "hoja", "error"]), recuperada=True))
+        return envios
+
+_cola = None
+_candado_cola = threading.Lock()
+
+def obtener_cola():
+    global _cola
+    with _candado_cola:
+        if _cola is None:
+            _cola = ColaEscritura()
+        return _cola
+
+def encolar_movimientos(hoja, df_nuevos):
+    return obtener_cola().encolar(hoja, df_nuevos)
+
+def estado_envio(id_envio):
+    return obtener_cola().estado(id_envio)
+
+def movimientos_pendientes(hoja):
+    return obtener_cola().pendientes(hoja)
+
+def movimientos_fallidos():
+    return obtener_cola().fallidos()
+
+def envios_pendientes(hoja):
+    return obtener_cola().envios_pendientes(hoja)
+
+def esperar_sincronizacion(timeout=30):
+    return obtener_cola().esperar(timeout)
@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+import trazas
+from esquema import COLUMNAS_LOCAL, ESCALA, centavos, monto_texto, nombre_columna
+
+# 🏦 Conciliación bancaria: cruza el estado de cuenta con los movimientos del libro por monto exacto
+# (en centavos), fecha con tolerancia y parecido de la descripción, sin comparar par contra par:
+#   1. unión por hash de (centavos, día, número de aparición) para los que coinciden exacto;
+#   2. merge_asof por centavos hacia la fecha más cercana dentro de la tolerancia, en rondas: si dos
+#      cargos del banco eligen el mismo movimiento gana el de fecha más cercana y descripción más
+#      parecida, y el otro vuelve a buscar en la siguiente ronda sin ese movimiento.
+# Además compara el saldo diario de ambos lados y encuentra el primer día en que se separan.
+TOLERANCIA_DIAS = 3
+MAX_RONDAS = 10
+DIFERENCIA_MINIMA = 0.005  # diferencia de saldo que ya cuenta como divergencia
+
+# Nombres de columna de los estados de cuenta más comunes (ya sin acentos y en minúsculas)
+ALIAS = {
+    "fecha": ["fecha", "fecha operacion", "fecha de operacion", "fecha movimiento", "date"],
+    "descripcion": ["descripcion", "concepto", "detalle", "referencia", "description"],
+    "monto": ["monto", "importe", "amount"],
+    "cargo": ["cargo", "cargos", "retiro", "retiros", "debito", "debe"],
+    "abono": ["abono", "abonos", "deposito", "depositos", "credito", "haber"],
+    "saldo": ["saldo", "balance"],
+}
+
+# ---------- estado de cuenta ----------
+# CSV del banco → fecha, descripcion, monto (positivo entra, negativo sale) y saldo si viene.
+# Acepta una columna de monto con signo o columnas separadas de cargos y abonos.
+@trazas.medido("conciliacion.leer_estado")
+def leer_estado(archivo, dia_primero=True, encoding="utf-8"):
+    crudo = pd.read_csv(archivo, dtype=str, encoding=encoding).rename(columns=nombre_columna)
+    columnas = {clave: next((c for c in alias if c in crudo.columns), None) for clave, alias in ALIAS.items()}
+    if columnas["fecha"] is None or (columnas["monto"] is None and columnas["cargo"] is None and columnas["abono"] is None):
+        raise ValueError("El estado de cuenta necesita una columna de fecha y una de monto (o de cargos y abonos)")
+    texto = lambda clave: crudo[columnas[clave]].fillna("") if columnas[clave] else pd.Series("", index=crudo.index)
+    if columnas["monto"]:
+        monto = monto_texto(texto("monto"))
+    else:
+        monto = monto_texto(texto("abono")).fillna(0.0) - monto_texto(texto("cargo")).fillna(0.0)
+    estado = pd.DataFrame({
+        "fecha": pd.to_datetime(texto("fecha").str.strip(), errors="coerce", format="mixed", dayfirst=dia_primero),
+        "descripcion": texto("descripcion").str.strip(),
+        "monto": monto.round(2),
+        "saldo": monto_texto(texto("saldo")) if columnas["saldo"] else np.nan,
+    })
+    estado = estado[estado["fecha"].notna() & estado["monto"].notna()]
+    # Los saldos se leen en orden cronológico: los bancos que listan del más reciente al más antiguo
+    # se invierten antes del orden estable por fecha para conservar el orden dentro de cada día
+    if len(estado) > 1 and estado["fecha"].iloc[0] > estado["fecha"].iloc[-1]:
+        estado = estado.iloc[::-1]
+    return estado.sort_values("fecha", kind="stable").reset_index(drop=True)
+
+# ---------- cruce ----------
+# Palabras de cada descripción distinta, sin acentos ni mayúsculas
+def _palabras(descripciones):
+    texto = pd.Series(descripciones, dtype=object).fillna("").astype(str)
+    limpio = texto.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii").str.lower()
+    return [frozenset(p) for p in limpio.str.findall(r"[a-z0-9]+")]
+
+# Jaccard de palabras de cada par de descripciones; cada descripción y cada par distinto se calcula una vez
+def similitud(a, b):
+    codigos_a, unicas_a = pd.factorize(np.asarray(a, dtype=object))
+    codigos_b, unicas_b = pd.factorize(np.asarray(b, dtype=object))
+    # El código -1 (descripción vacía) pasa a 0: un conjunto de palabras vacío
+    palabras_a, palabras_b = [frozenset()] + _palabras(unicas_a), [frozenset()] + _palabras(unicas_b)
+    ancho = len(palabras_b)
+    pares, inverso = np.unique((codigos_a.astype(np.int64) + 1) * ancho + codigos_b + 1, return_inverse=True)
+    valores = np.zeros(len(pares))
+    for k, par in enumerate(pares):
+        x, y = palabras_a[par // ancho], palabras_b[par % ancho]
+        if x | y:
+            valores[k] = len(x & y) / len(x | y)
+    return valores[inverso.ravel()]
+
+def _preparar(df, prefijo):
+    return pd.DataFrame({
+        f"id_{prefijo}": np.arange(len(df)),
+        "fecha": df["fecha"].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype("datetime64[ns]"),
+        "centavos": df["centavos"].to_numpy(),
+        f"descripcion_{prefijo}": df["descripcion"].astype(object).to_numpy(),
+    })
+
+def _exactos(banco, libro):
+    clave = ["centavos", "fecha"]
+    b = banco.assign(aparicion=banco.groupby(clave).cumcount())
+    l = libro.assign(aparicion=libro.groupby(clave).cumcount())
+    return b.merge(l, on=clave + ["aparicion"])[["id_banco", "id_libro"]]
+
+def _cercanos(banco, libro, tolerancia):
+    elegidos = []
+    for _ in range(MAX_RONDAS):
+        if banco.empty or libro.empty:
+            break
+        candidatos = pd.merge_asof(
+            banco.sort_values("fecha"), libro.rename(columns={"fecha": "fecha_libro"}).assign(fecha=lambda d: d["fecha_libro"])
+            .sort_values("fecha"), on="fecha", by="centavos", direction="nearest", tolerance=pd.Timedelta(days=tolerancia))
+        candidatos = candidatos[candidatos["id_libro"].notna()].astype({"id_libro": np.int64})
+        if candidatos.empty:
+            break
+        candidatos["dias"] = (candidatos["fecha"] - candidatos["fecha_libro"]).abs().dt.days
+        # La descripción solo desempata cuando dos cargos del banco eligen el mismo movimiento
+        disputados = candidatos["id_libro"].duplicated(keep=False).to_numpy()
+        candidatos["similitud"] = 0.0
+        candidatos.loc[disputados, "similitud"] = similitud(
+            candidatos.loc[disputados, "descripcion_banco"], candidatos.loc[disputados, "descripcion_libro"])
+        ganadores = candidatos.sort_values(["dias", "similitud"], ascending=[True, False], kind="stable") \
+            .drop_duplicates("id_libro")[["id_banco", "id_libro"]]
+        elegidos.append(ganadores)
+        banco = banco[~banco["id_banco"].isin(ganadores["id_banco"])]
+        libro = libro[~libro["id_libro"].isin(ganadores["id_libro"])]
+    return pd.concat(elegidos, ignore_index=True) if elegidos else pd.DataFrame(columns=["id_banco", "id_libro"], dtype=np.int64)
+
+# Saldo al cierre de cada día del periodo en ambos lados; el del banco sale de su columna de saldo si viene
+def _saldos(estado, libro, inicio, fin, saldo_inicial):
+    dias = pd.date_range(inicio, fin, freq="D")
+    if saldo_inicial is None:
+        con_saldo = estado[estado["saldo"].notna()]
+        saldo_inicial = float(con_saldo["saldo"].iloc[0] - con_saldo["monto"].iloc[0]) if not con_saldo.empty else 0.0
+
+    def acumulado(fechas, centavos_):
+        por_dia = pd.Series(np.asarray(centavos_), index=fechas.dt.normalize().to_numpy()).groupby(level=0).sum()
+        return por_dia.reindex(dias, fill_value=0).cumsum().to_numpy() / ESCALA + saldo_inicial
+
+    saldo_banco = acumulado(estado["fecha"], estado["centavos"])
+    if estado["saldo"].notna().any():
+        # El saldo que informa el banco al cierre de cada día, arrastrado a los días sin movimientos
+        cierre = estado[estado["saldo"].notna()].groupby(estado["fecha"].dt.normalize())["saldo"].last()
+        informado = pd.merge_asof(pd.DataFrame({"fecha": dias}), cierre.rename("saldo").reset_index(), on="fecha")["saldo"]
+        saldo_banco = np.where(informado.notna(), informado.to_numpy(), saldo_banco)
+    saldos = pd.DataFrame({
+        "fecha": dias,
+        "saldo_banco": np.round(saldo_banco, 2),
+        "saldo_libro": np.round(acumulado(libro["fecha"], libro["centavos"]), 2),
+    })
+    saldos["diferencia"] = (saldos["saldo_banco"] - saldos["saldo_libro"]).round(2)
+    return saldos
+
+# Movimientos del libro (formato local) contra el estado de cuenta. Devuelve un dict con los pares
+# conciliados, lo que solo está en el banco, lo que solo está en el libro (y cuáles de esos parecen
+# duplicados de uno ya conciliado), los saldos diarios y el primer día en que no coinciden.
+@trazas.medido("conciliacion.conciliar")
+def conciliar(estado, libro, columnas=COLUMNAS_LOCAL, tolerancia=TOLERANCIA_DIAS, saldo_inicial=None):
+    c = columnas
+    if estado.empty:
+        raise ValueError("El estado de cuenta no tiene movimientos con fecha y monto válidos")
+    estado = estado.reset_index(drop=True).assign(centavos=centavos(estado["monto"]))
+    inicio, fin = estado["fecha"].min().normalize(), estado["fecha"].max().normalize()
+    fechas = pd.to_datetime(libro[c["fecha"]], errors="coerce")
+    # Solo el periodo del estado de cuenta (más la tolerancia); el resto del historial no participa
+    en_periodo = (fechas >= inicio - pd.Timedelta(days=tolerancia)) & (fechas < fin + pd.Timedelta(days=tolerancia + 1))
+    libro = libro[en_periodo.to_numpy()]
+    montos = centavos(libro[c["monto"]])
+    libro = pd.DataFrame({
+        "fecha": fechas[en_periodo].to_numpy(),
+        "tipo": libro[c["tipo"]].astype(object).to_numpy(),
+        "categoria": libro[c["categoria"]].astype(object).to_numpy(),
+        "descripcion": libro[c["descripcion"]].astype(object).to_numpy(),
+        "monto": montos / ESCALA,
+        "centavos": np.where((libro[c["tipo"]] == c["ingreso"]).to_numpy(), montos, -montos),
+    })
+
+    banco, propio = _preparar(estado, "banco"), _preparar(libro, "libro")
+    exactos = _exactos(banco, propio)
+    cercanos = _cercanos(banco[~banco["id_banco"].isin(exactos["id_banco"])],
+                         propio[~propio["id_libro"].isin(exactos["id_libro"])], tolerancia)
+    pares = pd.concat([exactos, cercanos], ignore_index=True)
+
+    conciliados = pd.DataFrame({
+        "fecha_banco": estado["fecha"].to_numpy()[pares["id_banco"]],
+        "fecha_libro": libro["fecha"].to_numpy()[pares["id_libro"]],
+        "monto": estado["monto"].to_numpy()[pares["id_banco"]],
+        "descripcion_banco": estado["descripcion"].to_numpy()[pares["id_banco"]],
+        "descripcion_libro": libro["descripcion"].to_numpy()[pares["id_libro"]],
+    })
+    conciliados["dias"] = (conciliados["fecha_banco"].dt.normalize() - conciliados["fecha_libro"].dt.normalize()).dt.days
+    conciliados["similitud"] = similitud(conciliados["descripcion_banco"], conciliados["descripcion_libro"]).round(2)
+    conciliados = conciliados.sort_values("fecha_banco", kind="stable", ignore_index=True)
+
+    solo_banco = estado.drop(index=pares["id_banco"]).drop(columns="centavos")
+    sin_pareja = ~np.isin(np.arange(len(libro)), pares["id_libro"])
+    dentro = (libro["fecha"] >= inicio) & (libro["fecha"] < fin + pd.Timedelta(days=1))
+    solo_libro = libro[sin_pareja & dentro.to_numpy()]
+    # Un movimiento sin pareja con el mismo monto y fecha cercana a uno conciliado es un posible duplicado
+    pareados = libro.iloc[pares["id_libro"]][["fecha", "centavos"]].sort_values("fecha")
+    cercano = pd.merge_asof(solo_libro[["fecha", "centavos"]].reset_index().sort_values("fecha"),
+                            pareados.assign(pareado=True), on="fecha", by="centavos", direction="nearest",
+                            tolerance=pd.Timedelta(days=tolerancia)).set_index("index")["pareado"]
+    solo_libro = solo_libro.assign(posible_duplicado=cercano.reindex(solo_libro.index).eq(True).to_numpy())
+
+    saldos = _saldos(estado, libro[dentro.to_numpy()], inicio, fin, saldo_inicial)
+    distintos = saldos.loc[saldos["diferencia"].abs() > DIFERENCIA_MINIMA, "fecha"]
+    return {
+        "conciliados": conciliados,
+        "solo_banco": solo_banco.reset_index(drop=True),
+        "solo_libro": solo_libro.drop(columns="centavos").reset_index(drop=True),
+        "saldos": saldos,
+        "dia_divergencia": distintos.iloc[0] if not distintos.empty else None,
+        "resumen": {
+            "estado": len(estado),
+            "conciliados": len(conciliados),
+            "solo_banco": len(solo_banco),
+            "solo_libro": len(solo_libro),
+            "posibles_duplicados": int(solo_libro["posible_duplicado"].sum()),
+        },
+    }
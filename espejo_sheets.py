@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+import trazas
+from almacenamiento import AlmacenSQLite, SINCRONIZADO, asignar_ids, _normalizar
+
+ARCHIVO_ESPEJO = "espejo_sheets.sqlite3"
+MAX_ANTIGUEDAD = float(os.environ.get("ESPEJO_ANTIGUEDAD", 60))  # segundos que una lectura acepta sin sincronizar
+VENTANA = 2.0  # segundos que el trabajador espera para juntar escrituras locales
+ESPERA_BASE = 5.0
+ESPERA_MAXIMA = 300.0
+
+PENDIENTE = "pendiente"
+ERROR = "error"
+
+# Estados locales de cada movimiento en la tabla espejo
+SIN_CAMBIOS = ""
+NUEVO = "nuevo"
+EDITADO = "editado"
+BORRADO = "borrado"
+
+def _hoja_compartida():
+    from sheets_utils import conectar_google_sheets, obtener_hoja_unica
+    cliente, _ = conectar_google_sheets()
+    return obtener_hoja_unica(cliente)
+
+# 🪞 Réplica local de la hoja compartida: todas las lecturas salen de SQLite y un hilo aparte
+# sincroniza con Sheets. Bajada: se leen solo las columnas ID y Modificado y después las filas
+# cuya versión cambió. Subida: altas, correcciones y bajas locales en lotes; si la fila cambió
+# en la hoja desde la versión local, gana la hoja y el cambio local queda en la tabla conflictos.
+class AlmacenEspejo(AlmacenSQLite):
+    nombre = "espejo"
+
+    def __init__(self, archivo=ARCHIVO_ESPEJO, obtener_hoja=_hoja_compartida, max_antiguedad=MAX_ANTIGUEDAD):
+        super().__init__(archivo)
+        self.obtener_hoja = obtener_hoja
+        self.max_antiguedad = max_antiguedad
+        self.ultimo_error = None
+        self._candado = threading.Lock()  # una sincronización a la vez
+        self._despertar = threading.Event()
+        with self._conectar() as conexion:
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS espejo (
+                    id TEXT PRIMARY KEY,
+                    modificado INTEGER NOT NULL DEFAULT 0,
+                    estado TEXT NOT NULL DEFAULT '',
+                    cambio INTEGER NOT NULL DEFAULT 0,
+                    en_hoja INTEGER NOT NULL DEFAULT 0
+                )""")
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_espejo_estado ON espejo (estado)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS conflictos (id TEXT, instante REAL, motivo TEXT, local TEXT)")
+            conexion.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+        self._hilo = threading.Thread(target=self._trabajar, name="espejo-sheets", daemon=True)
+        self._hilo.start()
+        if self._cambios_locales():
+            self._despertar.set()
+
+    # ---------- lecturas: siempre locales ----------
+    def ultima_sincronizacion(self):
+        with self._conectar() as conexion:
+            fila = conexion.execute("SELECT valor FROM meta WHERE clave = 'ultima_sincronizacion'").fetchone()
+        return float(fila[0]) if fila else None
+
+    # La primera lectura espera a la réplica inicial; después, si los datos pasan de
+    # max_antiguedad se pide una sincronización en segundo plano y se responde con lo local
+    def _vigilar(self):
+        ultima = self.ultima_sincronizacion()
+        if ultima is None:
+            try:
+                self.sincronizar()
+            except Exception:
+                pass
+        elif time.time() - ultima > self.max_antiguedad:
+            self._despertar.set()
+
+    def cargar(self, usuario):
+        self._vigilar()
+        return super().cargar(usuario)
+
+    def consultar(self, usuario, mes=None, categorias=None):
+        self._vigilar()
+        return super().consultar(usuario, mes, categorias)
+
+    def meses(self, usuario):
+        self._vigilar()
+        return super().meses(usuario)
+
+    def resumen_mes(self, usuario, mes, categorias=None):
+        self._vigilar()
+        return super().resumen_mes(usuario, mes, categorias)
+
+    # ---------- escrituras: locales al instante, se suben en el próximo lote ----------
+    def agregar(self, df, deduplicar=False):
+        df = asignar_ids(_normalizar(df))
+        if deduplicar:
+            df = self._sin_duplicados(df)
+        if df.empty:
+            return None
+        with self._conectar() as conexion:
+            conexion.executemany("INSERT OR REPLACE INTO movimientos VALUES (?, ?, ?, ?, ?, ?, ?)", self._a_registros(df))
+            conexion.executemany(
+                "INSERT INTO espejo (id, estado, cambio) VALUES (?, 'nuevo', 1) "
+                "ON CONFLICT(id) DO UPDATE SET cambio = cambio + 1", [(i,) for i in df["ID"]])
+        self._despertar.set()
+        return tuple(df["ID"])
+
+    def eliminar(self, ids):
+        encontrados = super().eliminar(ids)
+        with self._conectar() as conexion:
+            conexion.executemany(
+                "UPDATE espejo SET estado = 'borrado', cambio = cambio + 1 WHERE id = ?", [(i,) for i in encontrados])
+        self._despertar.set()
+        return encontrados
+
+    def editar(self, df_cambios):
+        encontrados = super().editar(df_cambios)
+        with self._conectar() as conexion:
+            conexion.executemany(
+                "UPDATE espejo SET estado = CASE WHEN estado = 'nuevo' THEN 'nuevo' ELSE 'editado' END, "
+                "cambio = cambio + 1 WHERE id = ?", [(i,) for i in encontrados])
+        self._despertar.set()
+        return encontrados
+
+    def estado(self, envio):
+        if not envio:
+            return SINCRONIZADO, None
+        with self._conectar() as conexion:
+            pendientes = self._contar_pendientes(conexion, envio)
+        if not pendientes:
+            return SINCRONIZADO, None
+        return (ERROR, self.ultimo_error) if self.ultimo_error else (PENDIENTE, None)
+
+    # Sin conexión no se registra la visita; la app sigue funcionando con la réplica
+    def registrar_usuario(self, correo_usuario):
+        from sheets_utils import conectar_google_sheets, registrar_usuario_activo
+        try:
+            cliente, _ = conectar_google_sheets()
+        except Exception:
+            return
+        registrar_usuario_activo(correo_usuario, cliente)
+
+    def _contar_pendientes(self, conexion, ids):
+        ids = list(ids)
+        return sum(
+            conexion.execute(
+                f"SELECT COUNT(*) FROM espejo WHERE estado != '' AND id IN ({', '.join('?' * len(ids[i:i + 500]))})",
+                ids[i:i + 500]).fetchone()[0]
+            for i in range(0, len(ids), 500)
+        )
+
+    def _cambios_locales(self):
+        with self._conectar() as conexion:
+            return conexion.execute("SELECT COUNT(*) FROM espejo WHERE estado != ''").fetchone()[0]
+
+    # Resumen para mostrar en la app: antigüedad, cambios por subir, conflictos y último error
+    def estado_espejo(self):
+        ultima = self.ultima_sincronizacion()
+        with self._conectar() as conexion:
+            conflictos = conexion.execute("SELECT COUNT(*) FROM conflictos").fetchone()[0]
+        return {
+            "antiguedad": None if ultima is None else time.time() - ultima,
+            "cambios_locales": self._cambios_locales(),
+            "conflictos": conflictos,
+            "error": self.ultimo_error,
+        }
+
+    def conflictos(self):
+        with self._conectar() as conexion:
+            return pd.read_sql_query("SELECT * FROM conflictos ORDER BY instante DESC", conexion)
+
+    # ---------- sincronización ----------
+    def _trabajar(self):
+        espera = None
+        while True:
+            self._despertar.wait(espera)
+            time.sleep(VENTANA)
+            self._despertar.clear()
+            try:
+                with trazas.traza("espejo-fondo"):
+                    self.sincronizar()
+                espera = None
+            except Exception:
+                # Sin conexión o sin cuota: se reintenta solo si hay cambios locales por subir
+                espera = min(ESPERA_MAXIMA, (espera or ESPERA_BASE / 2) * 2) if self._cambios_locales() else None
+
+    # Baja lo que cambió en la hoja y sube los cambios locales. Devuelve un reporte con conteos.
+    @trazas.medido("espejo.sincronizar")
+    def sincronizar(self):
+        from sheets_utils import listar_versiones
+        with self._candado:
+            try:
+                hoja = self.obtener_hoja()
+                remotas = listar_versiones(hoja)
+                reporte = self._bajar(hoja, remotas)
+                reporte.update(self._subir(hoja, remotas))
+            except Exception as error:
+                self.ultimo_error = str(error)
+                raise
+            self.ultimo_error = None
+            with self._conectar() as conexion:
+                conexion.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('ultima_sincronizacion', ?)", (str(time.time()),))
+            return reporte
+
+    def _bajar(self, hoja, remotas):
+        from sheets_utils import leer_movimientos_filas
+        with self._conectar() as conexion:
+            locales = pd.read_sql_query("SELECT id, modificado, estado FROM espejo", conexion)
+        cruce = remotas.merge(locales, left_on="ID", right_on="id", how="left")
+        # Los movimientos con cambios locales sin subir se resuelven al subir (detección de conflictos)
+        cambiadas = cruce[(cruce["modificado"] != cruce["Modificado"]) & (cruce["estado"].fillna("") == "")]
+        borradas = locales.loc[(locales["estado"] == "") & ~locales["id"].isin(remotas["ID"]), "id"].tolist()
+
+        versiones = dict(zip(cambiadas["ID"], cambiadas["Modificado"]))
+        df = leer_movimientos_filas(hoja, cambiadas["fila"].tolist())
+        if not df.empty:
+            df["ID"] = df["ID"].astype(str)
+            df = _normalizar(df[df["ID"].isin(versiones)])
+        with self._conectar() as conexion:
+            # Una escritura local pudo llegar durante la lectura: solo se pisan filas sin cambios
+            estados = dict(conexion.execute("SELECT id, estado FROM espejo").fetchall())
+            df = df[df["ID"].map(estados).fillna("") == ""] if not df.empty else df
+            if not df.empty:
+                conexion.executemany("INSERT OR REPLACE INTO movimientos VALUES (?, ?, ?, ?, ?, ?, ?)", self._a_registros(df))
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO espejo (id, modificado, estado, cambio, en_hoja) VALUES (?, ?, '', 0, 1)",
+                    [(i, int(versiones[i])) for i in df["ID"]])
+            borradas = [i for i in borradas if estados.get(i) == ""]
+            conexion.executemany("DELETE FROM movimientos WHERE id = ?", [(i,) for i in borradas])
+            conexion.executemany("DELETE FROM espejo WHERE id = ?", [(i,) for i in borradas])
+        return {"bajadas": len(df), "borradas_en_hoja": len(borradas)}
+
+    def _conflicto(self, conexion, id_movimiento, motivo, local):
+        conexion.execute(
+            "INSERT INTO conflictos VALUES (?, ?, ?, ?)",
+            (id_movimiento, time.time(), motivo, json.dumps(local, ensure_ascii=False, default=str)))
+
+    def _subir(self, hoja, remotas):
+        from sheets_utils import agregar_movimientos, editar_movimientos, eliminar_movimientos, marca_modificado
+        with self._conectar() as conexion:
+            cambios = pd.read_sql_query("SELECT * FROM espejo WHERE estado != ''", conexion)
+        if cambios.empty:
+            return {"subidas": 0, "conflictos": 0}
+        versiones = dict(zip(remotas["ID"], remotas["Modificado"]))
+        ids = cambios["id"].tolist()
+        filas = pd.concat([
+            self._consultar_sql([f"id IN ({', '.join('?' * len(ids[i:i + 500]))})"], ids[i:i + 500])
+            for i in range(0, len(ids), 500)
+        ]).set_index("ID", drop=False)
+        marca = marca_modificado()
+        hechos, conflictos, descartados = [], [], []
+
+        nuevos = cambios[cambios["estado"] == NUEVO]
+        nuevos = nuevos[nuevos["id"].isin(filas.index)]
+        # Un alta cuyo ID ya está en la hoja llegó en un envío anterior aunque su respuesta se perdiera:
+        # no se vuelve a agregar, se sobrescribe con el contenido local (pudo cambiar desde ese envío)
+        ya_en_hoja = nuevos[nuevos["id"].isin(versiones)]
+        nuevos = nuevos[~nuevos["id"].isin(versiones)]
+        if not nuevos.empty:
+            agregar_movimientos(hoja, filas.loc[nuevos["id"]], marca)
+            hechos += nuevos.to_dict("records")
+        if not ya_en_hoja.empty:
+            subidos = set(editar_movimientos(hoja, filas.loc[ya_en_hoja["id"]], marca))
+            hechos += ya_en_hoja[ya_en_hoja["id"].isin(subidos)].to_dict("records")
+
+        editados = cambios[cambios["estado"] == EDITADO]
+        vigentes = editados[editados["id"].map(versiones) == editados["modificado"]]
+        conflictos += [(r, "modificado en la hoja") for r in editados[~editados["id"].isin(vigentes["id"])].to_dict("records")]
+        if not vigentes.empty:
+            subidos = set(editar_movimientos(hoja, filas.loc[vigentes["id"]], marca))
+            hechos += vigentes[vigentes["id"].isin(subidos)].to_dict("records")
+            conflictos += [(r, "borrado en la hoja") for r in vigentes[~vigentes["id"].isin(subidos)].to_dict("records")]
+
+        borrados = cambios[cambios["estado"] == BORRADO]
+        # Los que nunca llegaron a la hoja o que ya no están en ella se descartan sin llamar a la API
+        descartados += borrados[(borrados["en_hoja"] == 0) | ~borrados["id"].isin(versiones)].to_dict("records")
+        en_hoja = borrados[(borrados["en_hoja"] == 1) & borrados["id"].isin(versiones)]
+        vigentes = en_hoja[en_hoja["id"].map(versiones) == en_hoja["modificado"]]
+        conflictos += [(r, "modificado en la hoja") for r in en_hoja[~en_hoja["id"].isin(vigentes["id"])].to_dict("records")]
+        if not vigentes.empty:
+            eliminar_movimientos(hoja, vigentes["id"].tolist())
+            descartados += vigentes.to_dict("records")
+
+        with self._conectar() as conexion:
+            # Si hubo otra escritura local mientras se subía, el movimiento queda pendiente
+            for r in hechos:
+                conexion.execute(
+                    "UPDATE espejo SET modificado = ?, en_hoja = 1, estado = CASE WHEN cambio = ? THEN '' "
+                    "WHEN estado = 'nuevo' THEN 'editado' ELSE estado END WHERE id = ?",
+                    (marca, r["cambio"], r["id"]))
+            for r in descartados:
+                conexion.execute("DELETE FROM espejo WHERE id = ? AND cambio = ?", (r["id"], r["cambio"]))
+            # Conflicto: gana la hoja. El movimiento se marca sin cambios con versión 0 para que
+            # la próxima bajada lo traiga de nuevo (o lo quite si ya no existe en la hoja).
+            for r, motivo in conflictos:
+                local = filas.loc[r["id"]].to_dict() if r["id"] in filas.index else {"ID": r["id"]}
+                self._conflicto(conexion, r["id"], motivo, local)
+                conexion.execute(
+                    "UPDATE espejo SET estado = '', modificado = 0, en_hoja = 1 WHERE id = ? AND cambio = ?",
+                    (r["id"], r["cambio"]))
+        if conflictos:
+            self._despertar.set()
+        return {"subidas": len(hechos) + len(descartados), "conflictos": len(conflictos)}
@@ -0,0 +1,149 @@
+import os
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# 🧱 Esquema del libro de movimientos. Los libros entran por aquí una sola vez (desde Sheets,
+# CSV o los almacenes locales) y quedan con tipos compactos: fecha datetime64[ns], tipo,
+# categoría y usuario como categóricas, descripción como categórica si se repite, y monto
+# redondeado al centavo. Los totales se suman en centavos enteros, sin errores de redondeo.
+
+# Nombres de columnas y valores de "tipo" de cada formato de libro
+COLUMNAS_SHEETS = {
+    "fecha": "Fecha",
+    "tipo": "Tipo",
+    "categoria": "Categoría",
+    "monto": "Monto",
+    "descripcion": "Descripción",
+    "usuario": "Usuario",
+    "ingreso": "Ingreso",
+    "egreso": "Egreso",
+}
+COLUMNAS_LOCAL = {
+    "fecha": "fecha",
+    "tipo": "tipo",
+    "categoria": "categoria",
+    "monto": "monto",
+    "descripcion": "descripcion",
+    "usuario": "usuario",
+    "ingreso": "ingreso",
+    "egreso": "egreso",
+}
+# Columnas con que viajan los movimientos entre almacenes
+COLUMNAS_LIBRO = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID"]
+
+ESCALA = 100               # centavos por unidad de moneda
+FRACCION_CATEGORIA = 0.5   # la descripción va como categórica si tiene menos valores distintos que esta fracción de filas
+OBLIGATORIAS_CSV = ["fecha", "tipo", "monto"]
+
+# ---------- tipos ----------
+def fechas(serie):
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        serie = pd.to_datetime(serie, errors="coerce", format="mixed")
+    return serie.astype("datetime64[ns]") if serie.dtype != "datetime64[ns]" else serie
+
+# Montos como float64 sobre la rejilla de centavos; vacíos o inválidos quedan en NaN.
+# El libro no los guarda como int64 en centavos: las apps los muestran, editan y escriben a Sheets
+# como unidades de moneda y NaN marca la celda vacía. Las sumas sí van en centavos (ver centavos).
+def montos(serie):
+    return pd.to_numeric(serie, errors="coerce").astype(np.float64).round(2)
+
+# Montos en centavos enteros (vacíos como 0), para sumar sin error de punto flotante
+def centavos(serie):
+    valores = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.rint(np.nan_to_num(valores) * ESCALA).astype(np.int64)
+
+def tipar(df, columnas=COLUMNAS_SHEETS):
+    df = df.copy()
+    if columnas["fecha"] in df.columns:
+        df[columnas["fecha"]] = fechas(df[columnas["fecha"]])
+    if columnas["monto"] in df.columns:
+        df[columnas["monto"]] = montos(df[columnas["monto"]])
+    for clave in ["tipo", "categoria", "usuario"]:
+        if columnas[clave] in df.columns:
+            df[columnas[clave]] = df[columnas[clave]].astype("category")
+    descripcion = columnas["descripcion"]
+    if descripcion in df.columns and len(df) and df[descripcion].nunique() <= FRACCION_CATEGORIA * len(df):
+        df[descripcion] = df[descripcion].astype("category")
+    return df
+
+# Categóricas de vuelta a object, para asignar celdas con valores que aún no son categoría
+def sin_categorias(df):
+    return df.astype({c: object for c, tipo in df.dtypes.items() if isinstance(tipo, pd.CategoricalDtype)})
+
+# Filas rechazadas por fecha, tipo o monto inválidos; cada una cuenta una vez, por el primer problema.
+# Devuelve las válidas ya tipadas y el conteo de rechazos por motivo.
+def validar(df, columnas=COLUMNAS_SHEETS):
+    tipado = tipar(df, columnas)
+    pruebas = [
+        ("fecha inválida", tipado[columnas["fecha"]].isna()),
+        ("tipo desconocido", ~tipado[columnas["tipo"]].isin([columnas["ingreso"], columnas["egreso"]])),
+        ("monto inválido", tipado[columnas["monto"]].isna()),
+    ]
+    rechazada = pd.Series(False, index=df.index)
+    motivos = {}
+    for motivo, falla in pruebas:
+        nuevas = falla & ~rechazada
+        if nuevas.any():
+            motivos[motivo] = int(nuevas.sum())
+        rechazada |= falla
+    return tipado[~rechazada], motivos
+
+# ---------- CSV ----------
+# "Descripción", " FECHA " y "fecha" son la misma columna
+def nombre_columna(nombre):
+    sin_acentos = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode("ascii")
+    return sin_acentos.strip().lower()
+
+# Montos escritos como texto ("$1,250.00", " 300 ") → números; lo que no se entiende queda en NaN
+def monto_texto(serie):
+    return pd.to_numeric(serie.str.replace(r"[$\s,]", "", regex=True), errors="coerce")
+
+# Bloque de un CSV externo leído como texto → movimientos válidos en formato local y rechazos
+def desde_csv(bloque):
+    bloque = bloque.rename(columns=nombre_columna)
+    faltan = [c for c in OBLIGATORIAS_CSV if c not in bloque.columns]
+    if faltan:
+        raise ValueError(f"Al archivo le faltan columnas: {', '.join(faltan)}")
+    texto = lambda c: bloque[c].str.strip() if c in bloque.columns else None
+    tipos = {"ingreso": COLUMNAS_LOCAL["ingreso"], "egreso": COLUMNAS_LOCAL["egreso"]}
+    return validar(pd.DataFrame({
+        "fecha": texto("fecha"),
+        "descripcion": texto("descripcion"),
+        "tipo": bloque["tipo"].str.strip().str.lower().map(tipos),
+        "categoria": texto("categoria"),
+        "monto": monto_texto(bloque["monto"]),
+    }, index=bloque.index), COLUMNAS_LOCAL)
+
+# Libro en formato de Sheets guardado como CSV (el almacén csv)
+def leer_csv(archivo):
+    categoricas = {c: "category" for c in ["Tipo", "Categoría", "Usuario"]}
+    df = pd.read_csv(archivo, dtype={"ID": str, "Descripción": object, **categoricas})
+    return tipar(df.reindex(columns=COLUMNAS_LIBRO))
+
+# agregar=True añade al final (con encabezados solo si el archivo no existe)
+def escribir_csv(df, archivo, agregar=False):
+    encabezados = not (agregar and os.path.exists(archivo))
+    df.reindex(columns=COLUMNAS_LIBRO).to_csv(
+        archivo, mode="a" if agregar else "w", header=encabezados, index=False, float_format="%.2f")
+
+# ---------- Google Sheets ----------
+def valor_celda(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    if isinstance(valor, pd.Timestamp):
+        return str(valor)
+    if hasattr(valor, "item"):
+        return valor.item()
+    return valor
+
+def filas_sheets(df, encabezados):
+    return [
+        [valor_celda(v) for v in registro]
+        for registro in df.reindex(columns=encabezados).itertuples(index=False)
+    ]
+
+# Valores leídos de la hoja (celdas vacías como NaN) → libro tipado
+def desde_sheets(df):
+    return tipar(df, COLUMNAS_SHEETS)
@@ -0,0 +1,168 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import trazas
+from analitica import COLUMNAS_LOCAL, resumen_diario
+
+# 📊 Gráficas de las apps. Cada función recibe datos ya resumidos y devuelve la figura,
+# así se pueden medir y reutilizar fuera de Streamlit.
+# Al navegador solo viajan datos al grano de la gráfica (un valor por mes y categoría, por día
+# o una serie reducida con LTTB), así el tamaño de la figura depende de su resolución y no de
+# cuántos movimientos tiene el usuario. Las figuras se guardan en caché por huella de esos datos.
+# plotly y altair se importan dentro de cada gráfica: importar el módulo no los carga.
+MAX_PUNTOS = 400   # puntos máximos de una serie de tiempo
+MAX_FIGURAS = 128  # figuras en caché por proceso
+
+_figuras = OrderedDict()
+_candado = threading.Lock()
+
+def _huella(datos):
+    filas = pd.util.hash_pandas_object(datos, index=True).to_numpy()
+    return hashlib.blake2b(filas.tobytes() + repr(list(datos.columns)).encode(), digest_size=16).hexdigest()
+
+# La misma figura para los mismos datos y parámetros; las figuras de la caché no se modifican
+def _figura(nombre, datos, construir, *parametros):
+    clave = (nombre, _huella(datos), parametros)
+    with _candado:
+        if clave in _figuras:
+            _figuras.move_to_end(clave)
+            return _figuras[clave]
+    figura = construir(datos)
+    with _candado:
+        _figuras[clave] = figura
+        while len(_figuras) > MAX_FIGURAS:
+            _figuras.popitem(last=False)
+    return figura
+
+def limpiar_cache():
+    with _candado:
+        _figuras.clear()
+
+# ---------- reducción de series ----------
+# Largest-Triangle-Three-Buckets: de cada tramo se queda el punto que forma el triángulo más
+# grande con el elegido antes y el promedio del tramo siguiente, así la línea conserva su forma.
+# Además se agregan siempre el mínimo y el máximo globales. Devuelve posiciones ordenadas.
+def lttb(x, y, puntos=MAX_PUNTOS):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+    tramo = (n - 2) / (puntos - 2)
+    limites = (np.arange(puntos - 1) * tramo).astype(np.int64) + 1
+    limites[-1] = n - 1
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        siguiente_fin = limites[i + 2] if i + 2 < len(limites) else n
+        promedio_x = x[fin:siguiente_fin].mean()
+        promedio_y = y[fin:siguiente_fin].mean()
+        areas = np.abs((x[anterior] - promedio_x) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (promedio_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        elegidos[i + 1] = anterior
+    return np.union1d(elegidos, [np.argmin(y), np.argmax(y)])
+
+# Saldo al cierre de cada día (el eje es la fecha) y, si quedan más de `puntos` días, reducido con LTTB
+def serie_saldo(df_saldo, puntos=MAX_PUNTOS):
+    fechas = pd.to_datetime(df_saldo["fecha"]).dt.normalize()
+    cierre = (~fechas.duplicated(keep="last") & fechas.notna()).to_numpy()
+    serie = pd.DataFrame({"fecha": fechas.to_numpy()[cierre], "cashflow": df_saldo["cashflow"].to_numpy()[cierre]})
+    serie = serie.sort_values("fecha", kind="stable", ignore_index=True)
+    if len(serie) > puntos:
+        serie = serie.iloc[lttb(serie["fecha"].to_numpy(dtype="datetime64[ns]").astype(np.int64), serie["cashflow"], puntos)]
+    return serie.reset_index(drop=True)
+
+# ---------- app.py (plotly, desde el resumen mensual materializado) ----------
+@trazas.medido("graficas.ingresos_del_resumen")
+def ingresos_del_resumen(df_resumen):
+    df_resumen = df_resumen.sort_values("clave_mes")
+    return df_resumen[df_resumen["tipo"] == "Ingreso"].rename(columns={"categoria": "Categoría", "suma": "Monto"})
+
+# Un valor por mes (y categoría): lo que dibuja cada barra
+def _por_mes(df_ingresos, columnas):
+    return df_ingresos.groupby(columnas, sort=False, observed=True)["Monto"].sum().reset_index()
+
+@trazas.medido("graficas.histograma_categoria")
+def histograma_categoria(df_ingresos, categoria, titulo=None):
+    import plotly.express as px
+
+    datos = _por_mes(df_ingresos[df_ingresos["Categoría"] == categoria], ["Mes"])
+    return _figura("histograma_categoria", datos, lambda d: px.histogram(
+        d,
+        x="Mes",
+        y="Monto",
+        title=titulo or f"Histograma mensual de '{categoria}'",
+        barmode="stack",
+        color_discrete_sequence=["#2ECC71"]
+    ), categoria, titulo)
+
+@trazas.medido("graficas.ingresos_por_mes")
+def ingresos_por_mes(df_ingresos, titulo="Ingresos por Categoría y Mes"):
+    import plotly.express as px
+
+    datos = _por_mes(df_ingresos, ["Mes", "Categoría"])
+    return _figura("ingresos_por_mes", datos, lambda d: px.bar(
+        d,
+        x="Mes",
+        y="Monto",
+        color="Categoría",
+        title=titulo,
+        barmode="stack"
+    ), titulo)
+
+# por_categoria: Serie categoría → monto, como las de resumen_mes
+@trazas.medido("graficas.pastel_categorias")
+def pastel_categorias(por_categoria, titulo):
+    import plotly.express as px
+
+    datos = por_categoria.rename_axis("Categoría").reset_index(name="Monto")
+    return _figura("pastel_categorias", datos, lambda d: px.pie(
+        d,
+        names="Categoría",
+        values="Monto",
+        title=titulo
+    ), titulo)
+
+# ---------- appy.py (altair, movimientos del mes con saldo acumulado) ----------
+@trazas.medido("graficas.linea_saldo")
+def linea_saldo(df_saldo, puntos=MAX_PUNTOS):
+    import altair as alt
+
+    return _figura("linea_saldo", serie_saldo(df_saldo, puntos), lambda d: alt.Chart(d).mark_line(point=True).encode(
+        x=alt.X('fecha:T', title='Fecha'),
+        y=alt.Y('cashflow:Q', title='Saldo acumulado'),
+        tooltip=['fecha', 'cashflow']
+    ).properties(
+        title="📈 Saldo acumulado durante el mes",
+        width=700,
+        height=300
+    ))
+
+@trazas.medido("graficas.barras_diarias")
+def barras_diarias(df_mes, titulo):
+    import altair as alt
+
+    diario = resumen_diario(df_mes, COLUMNAS_LOCAL)
+    diario["día"] = diario["fecha"].dt.day
+    chart_data = diario.melt(id_vars="día", value_vars=["ingresos", "egresos"], var_name="tipo", value_name="monto")
+    chart_data["tipo"] = chart_data["tipo"].map({"ingresos": "ingreso", "egresos": "egreso"})
+    chart_data = chart_data[chart_data["monto"] != 0]
+
+    return _figura("barras_diarias", chart_data, lambda d: alt.Chart(d).mark_bar().encode(
+        x=alt.X('día:O', title='Día del mes'),
+        y=alt.Y('monto:Q', title='Monto'),
+        color=alt.Color('tipo:N', scale=alt.Scale(domain=['ingreso', 'egreso'],
+                                                  range=['#2ca02c', '#d62728'])),
+        tooltip=['día', 'tipo', 'monto']
+    ).properties(
+        width=700,
+        height=400,
+        title=titulo
+    ), titulo)
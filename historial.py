@@ -0,0 +1,133 @@
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import indice_fechas
+import trazas
+from analitica import COLUMNAS_SHEETS
+
+# 📋 Historial de movimientos paginado. El orden (una permutación de posiciones), el resultado
+# de cada combinación de filtros y las opciones de los filtros se guardan en caché por versión
+# (la del almacén, o una huella de los datos), así que en cada rerun solo se corta y se envía la
+# página visible, sin reordenar ni mandar el libro entero.
+TAMANOS_PAGINA = [25, 50, 100, 250]
+MAX_VISTAS = 64  # órdenes y filtros en caché por proceso
+
+_vistas = OrderedDict()
+_candado = threading.Lock()
+
+def _columnas_vista(columnas):
+    return [columnas[c] for c in ("fecha", "tipo", "categoria", "descripcion", "monto")]
+
+# Cambia si cambia cualquier valor visible o el índice (número de fila o posición)
+def huella(df, columnas=COLUMNAS_SHEETS):
+    filas = pd.util.hash_pandas_object(df.reindex(columns=_columnas_vista(columnas)), index=True).to_numpy()
+    return hashlib.blake2b(filas.tobytes(), digest_size=16).hexdigest()
+
+def _en_cache(clave, calcular):
+    with _candado:
+        if clave in _vistas:
+            _vistas.move_to_end(clave)
+            return _vistas[clave]
+    valor = calcular()
+    with _candado:
+        _vistas[clave] = valor
+        while len(_vistas) > MAX_VISTAS:
+            _vistas.popitem(last=False)
+    return valor
+
+def _fechas(df, columnas):
+    fechas = df[columnas["fecha"]]
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        fechas = pd.to_datetime(fechas, errors="coerce", format="mixed")
+    return fechas
+
+# Posiciones de df ordenadas por la columna; las vacías al final y los empates en el orden original
+def _orden(df, columnas, columna, ascendente):
+    if columna == columnas["fecha"]:
+        valores = _fechas(df, columnas)
+    elif columna == columnas["monto"]:
+        valores = pd.to_numeric(df[columna], errors="coerce")
+    else:
+        valores = df[columna].astype("string").str.lower()
+    valores = valores.reset_index(drop=True)
+    return valores.sort_values(ascending=ascendente, kind="stable", na_position="last").index.to_numpy()
+
+# Valores distintos de la columna para los filtros
+def _opciones(df, columna, version):
+    return _en_cache(("opciones", version, columna), lambda: sorted(df[columna].dropna().unique()))
+
+def _mascara(df, columnas, desde, hasta, categorias, tipos, texto):
+    mascara = np.ones(len(df), dtype=bool)
+    if desde is not None or hasta is not None:
+        # El rango sale del índice de fechas con dos búsquedas binarias; el resultado ya queda en
+        # la caché del historial, así que el índice no se guarda
+        mascara[:] = False
+        mascara[indice_fechas.IndiceFechas(df, columnas).posiciones(desde, hasta)] = True
+    if categorias:
+        mascara &= df[columnas["categoria"]].isin(categorias).to_numpy()
+    if tipos:
+        mascara &= df[columnas["tipo"]].isin(tipos).to_numpy()
+    if texto:
+        coincide = lambda c: df[c].astype("string").str.contains(texto, case=False, regex=False).fillna(False)
+        mascara &= (coincide(columnas["descripcion"]) | coincide(columnas["categoria"])).to_numpy()
+    return mascara
+
+# Una página del historial ya ordenado y filtrado: (filas de la página, total filtrado, páginas).
+# version permite pasar un identificador de los datos y evitar calcular la huella.
+@trazas.medido("historial.pagina")
+def pagina(df, columnas=COLUMNAS_SHEETS, orden=None, ascendente=False, numero=1, tamaño=TAMANOS_PAGINA[1],
+           desde=None, hasta=None, categorias=None, tipos=None, texto=None, version=None):
+    version = version or huella(df, columnas)
+    orden = orden or columnas["fecha"]
+    filtros = (desde, hasta, tuple(sorted(categorias or ())), tuple(sorted(tipos or ())), (texto or "").strip())
+    posiciones = _en_cache(("orden", version, orden, ascendente), lambda: _orden(df, columnas, orden, ascendente))
+    visibles = _en_cache(("filtro", version, orden, ascendente, filtros),
+                         lambda: posiciones[_mascara(df, columnas, *filtros)[posiciones]])
+    total = len(visibles)
+    paginas = max(1, -(-total // tamaño))
+    numero = min(max(1, int(numero)), paginas)
+    return df.iloc[visibles[(numero - 1) * tamaño:numero * tamaño]], total, paginas
+
+# Vista con filtros, orden y páginas; el estado de cada control vive en st.session_state con el
+# prefijo `clave`, así que el orden y la página se conservan entre reruns. version identifica a df
+# (p. ej. la versión de datos del almacén); sin ella se calcula la huella en cada rerun.
+def mostrar(df, columnas=COLUMNAS_SHEETS, clave="historial", version=None):
+    import streamlit as st
+
+    version = version or huella(df, columnas)
+    vista = _columnas_vista(columnas)
+    with st.expander("🔎 Filtrar y ordenar"):
+        col1, col2 = st.columns(2)
+        texto = col1.text_input("Buscar en descripción o categoría", key=f"{clave}_texto")
+        tipos = col2.multiselect("Tipo", _opciones(df, columnas["tipo"], version), key=f"{clave}_tipos")
+        categorias = col2.multiselect("Categoría", _opciones(df, columnas["categoria"], version),
+                                      key=f"{clave}_categorias")
+        desde = hasta = None
+        if col1.checkbox("Filtrar por fechas", key=f"{clave}_por_fechas"):
+            hoy = datetime.date.today()
+            rango = col1.date_input("Rango de fechas", value=(hoy.replace(day=1), hoy), key=f"{clave}_fechas")
+            if len(rango) == 2:
+                desde, hasta = rango
+        orden = col1.selectbox("Ordenar por", vista, key=f"{clave}_orden")
+        ascendente = col2.radio("Sentido", ["Descendente", "Ascendente"], horizontal=True,
+                                key=f"{clave}_sentido") == "Ascendente"
+        tamaño = col2.selectbox("Filas por página", TAMANOS_PAGINA, index=1, key=f"{clave}_tamano")
+
+    df_pagina, total, paginas = pagina(
+        df, columnas, orden, ascendente, st.session_state.get(f"{clave}_pagina", 1), tamaño,
+        desde, hasta, categorias, tipos, texto, version)
+    # La página guardada puede quedar fuera de rango cuando un filtro reduce los resultados
+    numero = min(max(1, st.session_state.get(f"{clave}_pagina", 1)), paginas)
+    st.session_state[f"{clave}_pagina"] = numero
+
+    st.dataframe(df_pagina[vista], hide_index=True, use_container_width=True)
+    col_pagina, col_total = st.columns([1, 3])
+    col_pagina.number_input("Página", min_value=1, max_value=paginas, step=1, key=f"{clave}_pagina")
+    inicio = (numero - 1) * tamaño
+    col_total.caption(
+        f"{inicio + 1 if total else 0:,}–{inicio + len(df_pagina):,} de {total:,} movimientos · página {numero} de {paginas}")
@@ -0,0 +1,55 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+import trazas
+from almacenamiento import desde_local, obtener_almacen
+from esquema import desde_csv
+from resumenes import USUARIO_LOCAL
+
+TAMANO_BLOQUE = 50_000  # filas por bloque leído del CSV
+
+# 📥 Importación de CSV por bloques: cada bloque se valida y tipa al leerlo (esquema.desde_csv) y se agrega
+# con el índice de huellas del almacén, así el costo depende del archivo subido y no del historial.
+
+# archivo puede ser una ruta o un archivo abierto en binario (por ejemplo el de st.file_uploader).
+# al_avanzar(fraccion, reporte) se llama después de cada bloque.
+@trazas.medido("importacion.importar_csv")
+def importar_csv(archivo, almacen, usuario=USUARIO_LOCAL, tamaño_bloque=TAMANO_BLOQUE, al_avanzar=None, encoding="utf-8"):
+    inicio = time.perf_counter()
+    reporte = {"leidas": 0, "agregadas": 0, "duplicadas": 0, "rechazadas": 0, "motivos": {}}
+    propio = isinstance(archivo, (str, os.PathLike))
+    f = open(archivo, "rb") if propio else archivo
+    try:
+        f.seek(0, os.SEEK_END)
+        total = f.tell() or 1
+        f.seek(0)
+        for bloque in pd.read_csv(f, chunksize=tamaño_bloque, dtype=str, encoding=encoding):
+            validos, motivos = desde_csv(bloque)
+            agregadas = almacen.importar(desde_local(validos, usuario)) if not validos.empty else 0
+            reporte["leidas"] += len(bloque)
+            reporte["agregadas"] += agregadas
+            reporte["duplicadas"] += len(validos) - agregadas
+            reporte["rechazadas"] += len(bloque) - len(validos)
+            for motivo, cantidad in motivos.items():
+                reporte["motivos"][motivo] = reporte["motivos"].get(motivo, 0) + cantidad
+            if al_avanzar:
+                al_avanzar(min(f.tell() / total, 1.0), reporte)
+    finally:
+        if propio:
+            f.close()
+    reporte["segundos"] = round(time.perf_counter() - inicio, 3)
+    return reporte
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un CSV de movimientos al almacén local sin duplicados")
+    parser.add_argument("archivo_csv")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE)
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args()
+
+    almacen = obtener_almacen("parquet")
+    print(importar_csv(args.archivo_csv, almacen, tamaño_bloque=args.bloque, encoding=args.encoding,
+                       al_avanzar=lambda fraccion, reporte: print(f"{fraccion:6.1%} {reporte['leidas']:,} filas")))
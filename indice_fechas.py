@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import trazas
+from analitica import COLUMNAS_SHEETS, claves_mes, etiqueta_mes
+
+# 📆 Índice de fechas del libro: los movimientos se ordenan por fecha una sola vez y se guardan los
+# límites de cada mes, así que pedir un mes, un año o un rango de fechas es un corte con
+# searchsorted sobre arreglos ordenados, sin recorrer el libro. El índice se guarda en caché por
+# versión de los datos (o mientras se pase el mismo objeto), así que en cada rerun solo se corta.
+MAX_INDICES = 32  # índices en caché por proceso
+
+_indices = OrderedDict()
+_candado = threading.Lock()
+
+def clave_de_mes(mes):
+    año, numero = (int(p) for p in str(mes).split("-")[:2])
+    return año * 12 + numero - 1
+
+# El mismo mes `años` años antes ("2025-06" → "2024-06"); con años negativos, después
+def mismo_mes_hace(mes, años=1):
+    return etiqueta_mes(clave_de_mes(mes) - 12 * años)
+
+class IndiceFechas:
+    @trazas.medido("indice_fechas.construir")
+    def __init__(self, df, columnas=COLUMNAS_SHEETS):
+        fechas = df[columnas["fecha"]]
+        if not pd.api.types.is_datetime64_any_dtype(fechas):
+            fechas = pd.to_datetime(fechas, errors="coerce", format="mixed")
+        valores = fechas.to_numpy(dtype="datetime64[ns]")
+        # Orden estable: los movimientos del mismo día conservan su orden; las fechas vacías al final
+        self.orden = np.argsort(valores, kind="stable")
+        self.ordenado = df.iloc[self.orden]
+        self.fechas = valores[self.orden]
+        self.validas = int((~np.isnat(self.fechas)).sum())
+        # Meses presentes y dónde empieza cada uno; el mes k ocupa inicios[k]:inicios[k + 1]
+        claves = claves_mes(pd.Series(self.fechas[:self.validas]))
+        self.claves, inicios = np.unique(claves, return_index=True)
+        self.inicios = np.append(inicios, self.validas)
+
+    def __len__(self):
+        return len(self.ordenado)
+
+    # Meses "AAAA-MM" con movimientos, en orden
+    def meses(self):
+        return [etiqueta_mes(int(c)) for c in self.claves]
+
+    def años(self):
+        return sorted({int(c) // 12 for c in self.claves})
+
+    # Posiciones [inicio, fin) en el libro ordenado de los meses clave_desde..clave_hasta
+    def _limites_claves(self, clave_desde, clave_hasta):
+        a = np.searchsorted(self.claves, clave_desde, side="left")
+        b = np.searchsorted(self.claves, clave_hasta, side="right")
+        return int(self.inicios[a]), int(self.inicios[b])
+
+    # Posiciones [inicio, fin) de las fechas entre desde y hasta (ambos días incluidos; None = sin límite)
+    def limites(self, desde=None, hasta=None):
+        fechas = self.fechas[:self.validas]
+        inicio = 0 if desde is None else int(np.searchsorted(fechas, np.datetime64(pd.Timestamp(desde).normalize()), "left"))
+        fin = self.validas if hasta is None else int(np.searchsorted(
+            fechas, np.datetime64(pd.Timestamp(hasta).normalize() + pd.Timedelta(days=1)), "left"))
+        return inicio, max(inicio, fin)
+
+    def mes(self, mes):
+        inicio, fin = self._limites_claves(clave_de_mes(mes), clave_de_mes(mes))
+        return self.ordenado.iloc[inicio:fin]
+
+    def año(self, año):
+        inicio, fin = self._limites_claves(int(año) * 12, int(año) * 12 + 11)
+        return self.ordenado.iloc[inicio:fin]
+
+    def rango(self, desde=None, hasta=None):
+        inicio, fin = self.limites(desde, hasta)
+        return self.ordenado.iloc[inicio:fin]
+
+    # Posiciones en el DataFrame original de los movimientos del rango, en orden de fecha
+    def posiciones(self, desde=None, hasta=None):
+        inicio, fin = self.limites(desde, hasta)
+        return self.orden[inicio:fin]
+
+    # Varios meses juntos con su etiqueta en la columna "Mes" (p. ej. este mes y el del año pasado);
+    # cuesta un corte por mes pedido sin importar el tamaño del libro
+    def varios(self, meses):
+        partes = [self.mes(m).assign(Mes=m) for m in meses]
+        return pd.concat(partes) if partes else self.ordenado.iloc[:0].assign(Mes=None)
+
+def _en_cache(clave, es_vigente, construir):
+    with _candado:
+        entrada = _indices.get(clave)
+        if entrada is not None and es_vigente(entrada[0]):
+            _indices.move_to_end(clave)
+            return entrada[1]
+    df, indice = construir()
+    with _candado:
+        _indices[clave] = (df, indice)
+        while len(_indices) > MAX_INDICES:
+            _indices.popitem(last=False)
+    return indice
+
+# Índice del DataFrame, reutilizado mientras se pase el mismo objeto (no modificarlo en el lugar)
+def obtener(df, columnas=COLUMNAS_SHEETS):
+    return _en_cache(("objeto", id(df), columnas["fecha"]), lambda guardado: guardado is df,
+                     lambda: (df, IndiceFechas(df, columnas)))
+
+# Índice de los datos identificados por `version`; cargar() solo se llama si no está en caché.
+# Los cortes salen del DataFrame guardado, así que cargar no se repite mientras la versión no cambie.
+def por_version(version, cargar, columnas=COLUMNAS_SHEETS):
+    def construir():
+        df = cargar()
+        return df, IndiceFechas(df, columnas)
+    return _en_cache(("version", version, columnas["fecha"]), lambda guardado: True, construir)
+
+def limpiar_cache():
+    with _candado:
+        _indices.clear()
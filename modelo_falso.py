@@ -0,0 +1,35 @@
+import hashlib
+import time
+
+# 🤖 Sustituto local de genai.GenerativeModel para probar sin red ni API key.
+# Se activa con la variable de entorno MODELO_IA=falso.
+
+class RespuestaFalsa:
+    def __init__(self, text):
+        self.text = text
+
+class ModeloFalso:
+    def __init__(self, nombre_modelo="falso", demora=0.0):
+        self.nombre_modelo = nombre_modelo
+        self.demora = demora
+        self.llamadas = []
+
+    def _texto(self, prompt):
+        huella = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"[{self.nombre_modelo}] Respuesta simulada {huella} para un prompt de {len(prompt)} caracteres."
+
+    # Con stream=True devuelve los trozos uno a uno, repartiendo la demora entre ellos
+    def generate_content(self, prompt, stream=False):
+        self.llamadas.append(prompt)
+        if stream:
+            return self._trozos(prompt)
+        if self.demora:
+            time.sleep(self.demora)
+        return RespuestaFalsa(self._texto(prompt))
+
+    def _trozos(self, prompt):
+        palabras = self._texto(prompt).split(" ")
+        for i, palabra in enumerate(palabras):
+            if self.demora:
+                time.sleep(self.demora / len(palabras))
+            yield RespuestaFalsa(palabra if i == 0 else " " + palabra)
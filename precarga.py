@@ -0,0 +1,58 @@
+import importlib
+import os
+import threading
+import time
+
+import trazas
+
+# 🚀 Precarga de los SDK pesados. Los módulos de la app los importan al primer uso; las apps llaman
+# a precargar() justo después de mostrar el título y el correo, y un hilo en segundo plano los
+# importa mientras el usuario escribe. Si el hilo no terminó cuando se necesitan, el import del
+# hilo principal espera al del hilo (Python no importa dos veces el mismo módulo). PRECARGA=0 lo apaga.
+ACTIVA = os.environ.get("PRECARGA", "1") != "0"
+GRUPOS = {
+    "sheets": ["gspread", "oauth2client.service_account", "gspread_dataframe"],
+    "graficas": ["plotly.express", "altair"],
+    "ia": ["google.generativeai"],
+}
+
+_hilos = {}
+_tiempos = {}  # módulo -> segundos que tardó su import, o el error
+_candado = threading.Lock()
+
+def _importar(grupos):
+    with trazas.traza("precarga"):
+        for grupo in grupos:
+            for modulo in GRUPOS[grupo]:
+                inicio = time.perf_counter()
+                with trazas.span(f"precarga.{modulo}"):
+                    try:
+                        importlib.import_module(modulo)
+                        resultado = round(time.perf_counter() - inicio, 4)
+                    except Exception as e:
+                        resultado = f"{type(e).__name__}: {e}"
+                with _candado:
+                    _tiempos[modulo] = resultado
+
+# Un hilo por combinación de grupos y proceso; las llamadas de reruns siguientes no hacen nada
+def precargar(*grupos):
+    grupos = grupos or tuple(GRUPOS)
+    if not ACTIVA:
+        return None
+    with _candado:
+        if grupos not in _hilos:
+            hilo = threading.Thread(target=_importar, args=(grupos,), name="precarga", daemon=True)
+            _hilos[grupos] = hilo
+            hilo.start()
+        return _hilos[grupos]
+
+def esperar(timeout=None):
+    with _candado:
+        hilos = list(_hilos.values())
+    for hilo in hilos:
+        hilo.join(timeout)
+    return all(not h.is_alive() for h in hilos)
+
+def tiempos():
+    with _candado:
+        return dict(_tiempos)
@@ -0,0 +1,212 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import trazas
+from analitica import claves_mes, etiqueta_mes, tabla_resumen
+from cache_ia import huellas_filas, normalizar_libro
+from esquema import COLUMNAS_SHEETS
+
+# 🔮 Pronóstico local por categoría: el libro se resume en una matriz serie × mes (una serie por
+# tipo y categoría) y todas las series se proyectan a la vez con NumPy. Cada serie se desestacionaliza
+# con el promedio de cada mes del calendario (si hay al menos dos años), se suaviza con
+# suavizado exponencial simple y el intervalo sale de los errores a un paso. Con eso se arma el
+# presupuesto sugerido y la meta de ahorro. El resultado se guarda en caché por huella del libro.
+HORIZONTE = 3               # meses a proyectar
+ALFA = 0.3                  # suavizado exponencial: peso del último mes
+MESES_ESTACIONALES = 24     # historia mínima para estimar estacionalidad
+INTERVALO = 0.80            # cobertura del intervalo de predicción
+FRACCION_AHORRO = 0.10      # meta de ahorro: fracción de los ingresos pronosticados
+INCERTIDUMBRE_INICIAL = 0.5 # desviación relativa cuando una serie tiene menos de dos errores
+MAX_PRONOSTICOS = 256       # pronósticos en caché por proceso
+
+Z_INTERVALO = NormalDist().inv_cdf((1 + INTERVALO) / 2)
+
+_pronosticos = OrderedDict()
+_candado = threading.Lock()
+
+# ---------- matriz serie × mes ----------
+# Solo meses completos: el mes en curso se excluye si hay historia anterior
+def _matriz(df, columnas, hoy):
+    tabla = tabla_resumen(df, columnas)
+    actual = int(claves_mes(pd.Series(pd.to_datetime([hoy])))[0])
+    if (tabla["clave_mes"] < actual).any():
+        tabla = tabla[tabla["clave_mes"] < actual]
+    tabla = tabla[tabla["tipo"].isin([columnas["ingreso"], columnas["egreso"]])]
+    if tabla.empty:
+        return None
+    series = pd.MultiIndex.from_frame(tabla[["tipo", "categoria"]].fillna("(sin categoría)"))
+    codigos, claves = pd.factorize(series)
+    primero = int(tabla["clave_mes"].min())
+    meses = np.arange(primero, int(tabla["clave_mes"].max()) + 1)
+    matriz = np.zeros((len(claves), len(meses)))
+    np.add.at(matriz, (codigos, tabla["clave_mes"].to_numpy() - primero), tabla["monto"].to_numpy(dtype=np.float64))
+    return pd.MultiIndex.from_tuples(list(claves), names=["tipo", "categoria"]), meses, matriz
+
+# Índice por mes del calendario (filas × 12), normalizado a promedio 1; 1 si falta historia
+def _estacionalidad(matriz, meses, activos):
+    indices = np.ones((matriz.shape[0], 12))
+    duracion = activos.sum(axis=1)
+    con_historia = duracion >= MESES_ESTACIONALES
+    if not con_historia.any():
+        return indices
+    valores = np.where(activos, matriz, np.nan)[con_historia]
+    calendario = meses % 12
+    with np.errstate(invalid="ignore", divide="ignore"):
+        promedios = np.column_stack([np.nanmean(valores[:, calendario == c], axis=1) for c in range(12)])
+        crudos = promedios / np.nanmean(promedios, axis=1, keepdims=True)
+    indices[con_historia] = np.where(np.isfinite(crudos) & (crudos > 0), crudos, 1.0)
+    indices /= indices.mean(axis=1, keepdims=True)
+    return indices
+
+# Suavizado exponencial simple de todas las filas a la vez; cada fila empieza en su primer mes con
+# movimientos. Devuelve el nivel final y la desviación de los errores a un paso.
+def _suavizar(desestacionalizada, activos, alfa):
+    filas, meses = desestacionalizada.shape
+    inicio = np.argmax(activos, axis=1)
+    nivel = desestacionalizada[np.arange(filas), inicio]
+    errores = np.full((filas, meses), np.nan)
+    for t in range(1, meses):
+        sigue = t > inicio
+        error = desestacionalizada[:, t] - nivel
+        errores[sigue, t] = error[sigue]
+        nivel = np.where(sigue, nivel + alfa * error, nivel)
+    cuantos = np.sum(~np.isnan(errores), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        desviacion = np.sqrt(np.nansum(errores ** 2, axis=1) / np.maximum(cuantos - 1, 1))
+    desviacion = np.where(cuantos >= 2, desviacion, np.abs(nivel) * INCERTIDUMBRE_INICIAL)
+    return nivel, desviacion
+
+# ---------- presupuesto ----------
+# Egresos pronosticados recortados en proporción hasta alcanzar la meta de ahorro, sin bajar del
+# límite inferior del intervalo de cada categoría
+def _presupuesto(pronostico, inferior, es_egreso, ingresos, fraccion_ahorro):
+    egresos = pronostico[es_egreso].sum()
+    meta = fraccion_ahorro * ingresos
+    faltante = max(0.0, meta - (ingresos - egresos))
+    presupuesto = pronostico.copy()
+    if faltante > 0 and egresos > 0:
+        recortable = np.where(es_egreso, pronostico - inferior, 0.0)
+        if recortable.sum() > 0:
+            presupuesto = pronostico - recortable * min(1.0, faltante / recortable.sum())
+    return presupuesto, meta
+
+def _huella(df):
+    return hashlib.blake2b(huellas_filas(normalizar_libro(df)).tobytes(), digest_size=16).hexdigest()
+
+def _calcular(df, columnas, horizonte, hoy, alfa, fraccion_ahorro):
+    matriz = _matriz(df, columnas, hoy)
+    if matriz is None:
+        return None
+    series, meses, valores = matriz
+    activos = np.cumsum(valores != 0, axis=1) > 0
+    indices = _estacionalidad(valores, meses, activos)
+    nivel, desviacion = _suavizar(valores / indices[:, meses % 12], activos, alfa)
+
+    destino = meses[-1] + np.arange(1, horizonte + 1)
+    estacional = indices[:, destino % 12]
+    pasos = np.arange(1, horizonte + 1)
+    # Varianza del suavizado simple a h pasos: σ² (1 + (h - 1) α²)
+    ancho = Z_INTERVALO * desviacion[:, None] * np.sqrt(1 + (pasos - 1) * alfa ** 2) * estacional
+    pronostico = np.maximum(nivel[:, None] * estacional, 0.0)
+    inferior = np.maximum(pronostico - ancho, 0.0)
+    superior = pronostico + ancho
+
+    tipos = series.get_level_values("tipo").to_numpy()
+    es_egreso = tipos == columnas["egreso"]
+    recientes = valores[:, -min(3, valores.shape[1]):].mean(axis=1)
+    tabla = pd.DataFrame({
+        "tipo": np.repeat(tipos, horizonte),
+        "categoria": np.repeat(series.get_level_values("categoria").to_numpy(), horizonte),
+        "clave_mes": np.tile(destino, len(series)),
+        "Mes": np.tile([etiqueta_mes(c) for c in destino], len(series)),
+        "pronostico": pronostico.ravel().round(2),
+        "inferior": inferior.ravel().round(2),
+        "superior": superior.ravel().round(2),
+    })
+
+    # Presupuesto y meta de cada mes proyectado, todas las categorías a la vez
+    presupuestos, totales = [], []
+    for h in range(horizonte):
+        ingresos = float(pronostico[~es_egreso, h].sum())
+        presupuesto, meta = _presupuesto(pronostico[:, h], inferior[:, h], es_egreso, ingresos, fraccion_ahorro)
+        presupuestos.append(presupuesto)
+        egresos = float(presupuesto[es_egreso].sum())
+        totales.append({"Mes": etiqueta_mes(destino[h]), "ingresos": round(ingresos, 2),
+                        "egresos": round(float(pronostico[es_egreso, h].sum()), 2),
+                        "presupuesto": round(egresos, 2), "ahorro": round(ingresos - egresos, 2),
+                        "meta_ahorro": round(meta, 2)})
+    presupuestos = np.column_stack(presupuestos)
+    presupuesto = pd.DataFrame({
+        "categoria": series.get_level_values("categoria").to_numpy()[es_egreso],
+        "promedio_reciente": recientes[es_egreso].round(2),
+        "pronostico": pronostico[es_egreso].mean(axis=1).round(2),
+        "inferior": inferior[es_egreso].mean(axis=1).round(2),
+        "superior": superior[es_egreso].mean(axis=1).round(2),
+        "presupuesto": presupuestos[es_egreso].mean(axis=1).round(2),
+    }).sort_values("pronostico", ascending=False, ignore_index=True)
+    return {
+        "meses": [etiqueta_mes(c) for c in destino],
+        "historia": len(meses),
+        "tabla": tabla,
+        "presupuesto": presupuesto,
+        "totales": pd.DataFrame(totales),
+    }
+
+# Pronóstico de `horizonte` meses después del último mes completo. Devuelve None si el libro no
+# tiene ingresos ni egresos. El resultado es compartido por la caché: no modificarlo.
+@trazas.medido("pronostico.pronosticar")
+def pronosticar(df, columnas=COLUMNAS_SHEETS, horizonte=HORIZONTE, hoy=None, alfa=ALFA, fraccion_ahorro=FRACCION_AHORRO):
+    hoy = hoy or date.today()
+    clave = (_huella(df), columnas["monto"], horizonte, f"{hoy:%Y-%m}", alfa, fraccion_ahorro)
+    with _candado:
+        if clave in _pronosticos:
+            _pronosticos.move_to_end(clave)
+            return _pronosticos[clave]
+    resultado = _calcular(df, columnas, horizonte, hoy, alfa, fraccion_ahorro)
+    with _candado:
+        _pronosticos[clave] = resultado
+        while len(_pronosticos) > MAX_PRONOSTICOS:
+            _pronosticos.popitem(last=False)
+    return resultado
+
+def limpiar_cache():
+    with _candado:
+        _pronosticos.clear()
+
+# ---------- texto ----------
+def _dinero(valor):
+    return f"${valor:,.2f}"
+
+def _tabla_markdown(encabezados, filas):
+    lineas = ["| " + " | ".join(encabezados) + " |", "|" + "---|" * len(encabezados)]
+    lineas += ["| " + " | ".join(str(v) for v in fila) + " |" for fila in filas]
+    return "\n".join(lineas)
+
+# Proyección y presupuesto en Markdown, listos para mostrar o para dárselos al modelo
+def texto_presupuesto(resultado):
+    if resultado is None:
+        return "Todavía no hay movimientos suficientes para proyectar un presupuesto."
+    totales, presupuesto = resultado["totales"], resultado["presupuesto"]
+    partes = [
+        f"**Proyección a {len(resultado['meses'])} meses** (con {resultado['historia']} meses de historia; "
+        f"rango con {INTERVALO:.0%} de probabilidad)",
+        _tabla_markdown(
+            ["Mes", "Ingresos", "Egresos esperados", "Presupuesto de egresos", "Ahorro", "Meta de ahorro"],
+            [[t.Mes, _dinero(t.ingresos), _dinero(t.egresos), _dinero(t.presupuesto), _dinero(t.ahorro),
+              _dinero(t.meta_ahorro)] for t in totales.itertuples()]),
+        "**Presupuesto mensual sugerido por categoría de egreso**",
+        _tabla_markdown(
+            ["Categoría", "Promedio últimos 3 meses", "Pronóstico", "Rango", "Presupuesto"],
+            [[p.categoria, _dinero(p.promedio_reciente), _dinero(p.pronostico),
+              f"{_dinero(p.inferior)} – {_dinero(p.superior)}", _dinero(p.presupuesto)]
+             for p in presupuesto.itertuples()]),
+        f"Meta de ahorro: {FRACCION_AHORRO:.0%} de los ingresos pronosticados, "
+        f"{_dinero(totales['meta_ahorro'].mean())} al mes en promedio.",
+    ]
+    return "\n\n".join(partes)
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import analitica
+from cache_ia import huellas_filas, normalizar_libro
+
+# 🗃️ Reportes por lotes para todos los usuarios del registro, fuera de Streamlit. Cada usuario se
+# procesa en un proceso del pool: carga su libro, calcula el resumen mensual y escribe
+# reportes/<usuario>/resumen.parquet y reporte.html. Cada resultado se agrega a _avance.jsonl:
+# con --reanudar se saltan los usuarios ya terminados en la última corrida, y los libros cuya
+# huella no cambió desde el último reporte no se recalculan.
+DIRECTORIO_REPORTES = "reportes"
+ARCHIVO_AVANCE = "_avance.jsonl"
+VERSION_REPORTE = "1"  # cambiarla regenera todos los reportes
+EN_VUELO_POR_PROCESO = 2  # usuarios encolados por proceso; acota la memoria con miles de usuarios
+
+GENERADO = "generado"
+SIN_CAMBIOS = "sin cambios"
+ERROR = "error"
+
+_cargar = None
+
+def carpeta_usuario(directorio, usuario):
+    return os.path.join(directorio, re.sub(r"[^\w.@+-]", "_", usuario))
+
+# Misma huella sin importar el orden de las filas; incluye el mes pedido y la versión del reporte
+def huella_libro(df, mes=None):
+    filas = huellas_filas(normalizar_libro(df))
+    return hashlib.blake2b(filas.tobytes() + f"{mes}|{VERSION_REPORTE}".encode(), digest_size=16).hexdigest()
+
+# ---------- avance (checkpoint) ----------
+def _leer_avance(directorio):
+    ruta = os.path.join(directorio, ARCHIVO_AVANCE)
+    ultimos, huellas, corrida = {}, {}, None
+    if not os.path.exists(ruta):
+        return ultimos, huellas, corrida
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue  # línea a medio escribir de una corrida interrumpida
+            ultimos[registro["usuario"]] = registro
+            corrida = registro.get("corrida", corrida)
+            if registro.get("estado") != ERROR:
+                huellas[registro["usuario"]] = registro.get("huella")
+    return ultimos, huellas, corrida
+
+# ---------- artefactos ----------
+def _escribir_atomico(ruta, escribir):
+    temporal = os.path.join(os.path.dirname(ruta), "." + os.path.basename(ruta) + ".tmp")
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+def _tabla_html(serie, columna):
+    if serie.empty:
+        return "<p>Sin movimientos.</p>"
+    tabla = serie.sort_values(ascending=False).rename_axis("Categoría").reset_index(name=columna)
+    return tabla.to_html(index=False, float_format=lambda x: f"${x:,.2f}", border=0)
+
+def reporte_html(usuario, analisis, mes):
+    resumen = analitica.resumen_mes(analisis, mes)
+    por_mes = analisis["por_mes"].rename(columns=str.capitalize).rename_axis("Mes").reset_index()
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>Reporte {html.escape(mes)} · {html.escape(usuario)}</title>
+<style>body{{font-family:sans-serif;margin:2em}} td,th{{padding:.2em .8em;text-align:right}} th{{background:#eee}}</style>
+</head>
+<body>
+<h1>Resumen financiero de {html.escape(mes)}</h1>
+<p>{html.escape(usuario)} · generado el {datetime.now():%Y-%m-%d %H:%M}</p>
+<p><b>Total ingresos:</b> ${resumen["ingresos"]:,.2f} · <b>Total egresos:</b> ${resumen["egresos"]:,.2f}
+· <b>Balance:</b> ${resumen["balance"]:,.2f}</p>
+<h2>Ingresos por categoría</h2>
+{_tabla_html(resumen["ingresos_por_categoria"], "Ingresos")}
+<h2>Egresos por categoría</h2>
+{_tabla_html(resumen["egresos_por_categoria"], "Egresos")}
+<h2>Totales por mes</h2>
+{por_mes.to_html(index=False, float_format=lambda x: f"${x:,.2f}", border=0)}
+</body>
+</html>
+"""
+
+# ---------- trabajo de cada proceso ----------
+# Los procesos solo leen. Con Sheets se lee la hoja directamente, sin la cola de escritura (cada
+# proceso arrancaría la suya y volvería a enviar el diario compartido de pendientes); con el
+# espejo se lee su SQLite sin arrancar el hilo que sincroniza con la hoja.
+def lector(tipo_almacen, archivo=None):
+    if tipo_almacen == "sheets":
+        from sheets_utils import cargar_datos_usuario, conectar_google_sheets, obtener_hoja_unica
+        cliente, _ = conectar_google_sheets()
+        hoja = obtener_hoja_unica(cliente)
+        return lambda usuario: cargar_datos_usuario(hoja, usuario)
+    if tipo_almacen == "espejo":
+        from almacenamiento import AlmacenSQLite
+        from espejo_sheets import ARCHIVO_ESPEJO
+        return AlmacenSQLite(archivo or ARCHIVO_ESPEJO).cargar
+    # Como el espejo, el backend se arma con su archivo sin tocar ALMACEN / ARCHIVO_ALMACEN.
+    # Parquet guarda el libro local de un solo usuario, así que no sirve para reportes por usuario.
+    from almacenamiento import AlmacenCSV, AlmacenSQLite
+    clases = {"csv": AlmacenCSV, "sqlite": AlmacenSQLite}
+    if tipo_almacen not in clases:
+        raise ValueError(f"Almacén sin reportes por usuario: {tipo_almacen} (usa sheets, espejo, csv o sqlite)")
+    clase = clases[tipo_almacen]
+    return (clase(archivo) if archivo else clase()).cargar
+
+def _iniciar_proceso(tipo_almacen, archivo):
+    global _cargar
+    _cargar = lector(tipo_almacen, archivo)
+
+def reportar_usuario(usuario, huella_anterior=None, directorio=DIRECTORIO_REPORTES, mes=None, forzar=False):
+    inicio = time.perf_counter()
+    df = _cargar(usuario)
+    huella = huella_libro(df, mes)
+    carpeta = carpeta_usuario(directorio, usuario)
+    archivos = [os.path.join(carpeta, "resumen.parquet"), os.path.join(carpeta, "reporte.html")]
+    registro = {"usuario": usuario, "huella": huella, "movimientos": len(df)}
+    if not forzar and huella == huella_anterior and all(os.path.exists(a) for a in archivos):
+        return dict(registro, estado=SIN_CAMBIOS, segundos=round(time.perf_counter() - inicio, 4))
+
+    analisis = analitica.analizar(df)
+    mes_reporte = mes or (analisis["meses"][-1] if analisis["meses"] else f"{datetime.now():%Y-%m}")
+    os.makedirs(carpeta, exist_ok=True)
+    tabla = analisis["tabla"].assign(usuario=usuario)
+    _escribir_atomico(archivos[0], lambda ruta: tabla.to_parquet(ruta, index=False))
+    contenido = reporte_html(usuario, analisis, mes_reporte)
+    _escribir_atomico(archivos[1], lambda ruta: open(ruta, "w", encoding="utf-8").write(contenido))
+    return dict(registro, estado=GENERADO, mes=mes_reporte, segundos=round(time.perf_counter() - inicio, 4))
+
+# ---------- corrida ----------
+# Reparte los usuarios en `procesos` procesos con a lo sumo EN_VUELO_POR_PROCESO pendientes cada uno.
+# al_avanzar(hechos, total, registro) se llama en el proceso principal después de cada usuario.
+def generar_reportes(usuarios, directorio=DIRECTORIO_REPORTES, procesos=None, almacen="sheets", archivo=None,
+                     mes=None, forzar=False, reanudar=False, al_avanzar=None):
+    os.makedirs(directorio, exist_ok=True)
+    ultimos, huellas, ultima_corrida = _leer_avance(directorio)
+    corrida = ultima_corrida if reanudar and ultima_corrida else uuid.uuid4().hex[:12]
+    if reanudar:
+        usuarios = [u for u in usuarios if not (
+            ultimos.get(u, {}).get("corrida") == corrida and ultimos[u].get("estado") != ERROR)]
+    procesos = procesos or os.cpu_count() or 1
+    inicio = time.perf_counter()
+    reporte = {"corrida": corrida, "usuarios": len(usuarios), GENERADO: 0, SIN_CAMBIOS: 0, ERROR: 0}
+
+    pendientes = iter(usuarios)
+    en_vuelo = {}
+    with ProcessPoolExecutor(procesos, initializer=_iniciar_proceso, initargs=(almacen, archivo)) as ejecutor, \
+            open(os.path.join(directorio, ARCHIVO_AVANCE), "a", encoding="utf-8") as avance:
+        while True:
+            for usuario in pendientes:
+                futuro = ejecutor.submit(reportar_usuario, usuario, huellas.get(usuario), directorio, mes, forzar)
+                en_vuelo[futuro] = usuario
+                if len(en_vuelo) >= procesos * EN_VUELO_POR_PROCESO:
+                    break
+            if not en_vuelo:
+                break
+            hechos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                usuario = en_vuelo.pop(futuro)
+                try:
+                    registro = futuro.result()
+                except Exception as e:
+                    registro = {"usuario": usuario, "estado": ERROR, "error": f"{type(e).__name__}: {e}"}
+                registro.update(corrida=corrida, instante=datetime.now().isoformat(timespec="seconds"))
+                avance.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                avance.flush()
+                reporte[registro["estado"]] += 1
+                if al_avanzar:
+                    al_avanzar(reporte[GENERADO] + reporte[SIN_CAMBIOS] + reporte[ERROR], len(usuarios), registro)
+    reporte["segundos"] = round(time.perf_counter() - inicio, 3)
+    return reporte
+
+def _usuarios(args):
+    if args.usuarios:
+        with open(args.usuarios, encoding="utf-8") as f:
+            return list(dict.fromkeys(linea.strip().lower() for linea in f if "@" in linea))
+    from sheets_utils import conectar_google_sheets, usuarios_registrados
+    cliente, _ = conectar_google_sheets()
+    return usuarios_registrados(cliente)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los reportes mensuales de todos los usuarios activos")
+    parser.add_argument("--usuarios", help="archivo con un correo por línea (por omisión, el registro usuarios_activos)")
+    parser.add_argument("--almacen", default=os.environ.get("ALMACEN", "sheets"),
+                        help="backend de donde se leen los libros (sheets, espejo, csv, sqlite)")
+    parser.add_argument("--archivo", default=os.environ.get("ARCHIVO_ALMACEN"), help="archivo del almacén local")
+    parser.add_argument("--directorio", default=DIRECTORIO_REPORTES)
+    parser.add_argument("--procesos", type=int, help="procesos en paralelo (por omisión, uno por núcleo)")
+    parser.add_argument("--mes", help="mes del reporte (AAAA-MM); por omisión el último con movimientos")
+    parser.add_argument("--forzar", action="store_true", help="regenera aunque el libro no haya cambiado")
+    parser.add_argument("--reanudar", action="store_true", help="continúa la última corrida interrumpida")
+    args = parser.parse_args()
+
+    usuarios = _usuarios(args)
+    reporte = generar_reportes(
+        usuarios, args.directorio, args.procesos, args.almacen, args.archivo, args.mes, args.forzar, args.reanudar,
+        al_avanzar=lambda hechos, total, r: print(f"{hechos:>6,}/{total:,} {r['usuario']}: {r['estado']}"
+                                                   + (f" ({r['error']})" if r.get("error") else "")))
+    print(json.dumps(reporte, ensure_ascii=False))
+    if reporte[ERROR]:
+        raise SystemExit(1)
@@ -0,0 +1,164 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from analitica import COLUMNAS_SHEETS, COLUMNAS_LOCAL, claves_mes, etiqueta_mes
+
+PRESUPUESTO_TOKENS = 1500
+CARACTERES_POR_TOKEN = 4  # estimación gruesa para español con números
+MUESTRA_CSV = 50  # filas con las que se estima el largo del CSV completo
+
+# Tamaños iniciales de cada sección; se recortan por pasos hasta entrar en el presupuesto
+LIMITES = {"meses": 12, "descripciones": 10, "atipicos": 8, "recientes": 15}
+
+def estimar_tokens(texto):
+    return int(np.ceil(len(texto) / CARACTERES_POR_TOKEN))
+
+# Tokens del CSV del libro estimados con las primeras filas; devuelve también el CSV si la muestra
+# ya es el libro completo. Así un libro grande no se escribe entero solo para compararlo.
+def _tokens_csv(df):
+    muestra = df.head(MUESTRA_CSV).to_csv(index=False)
+    if len(df) <= MUESTRA_CSV:
+        return estimar_tokens(muestra), muestra
+    encabezado = muestra.index("\n") + 1
+    caracteres = encabezado + (len(muestra) - encabezado) / MUESTRA_CSV * len(df)
+    return int(np.ceil(caracteres / CARACTERES_POR_TOKEN)), None
+
+def _preparar(df, columnas):
+    c = columnas
+    base = pd.DataFrame({
+        "fecha": pd.to_datetime(df[c["fecha"]], errors="coerce", format="mixed"),
+        "tipo": df[c["tipo"]].astype("string"),
+        "categoria": df[c["categoria"]].astype("string").fillna("(sin categoría)"),
+        "descripcion": df[c["descripcion"]].astype("string").str.strip().str.lower() if c["descripcion"] in df.columns else pd.NA,
+        "monto": pd.to_numeric(df[c["monto"]], errors="coerce").fillna(0.0),
+    })
+    base = base[base["fecha"].notna()].sort_values("fecha", kind="stable")
+    base["clave_mes"] = claves_mes(base["fecha"])
+    return base
+
+def _general(base, c):
+    ingresos = base.loc[base["tipo"] == c["ingreso"], "monto"].sum()
+    egresos = base.loc[base["tipo"] == c["egreso"], "monto"].sum()
+    return (
+        "RESUMEN GENERAL\n"
+        f"Periodo: {base['fecha'].min():%Y-%m-%d} a {base['fecha'].max():%Y-%m-%d}; "
+        f"{len(base)} movimientos; ingresos totales {ingresos:,.2f}; egresos totales {egresos:,.2f}; "
+        f"balance {ingresos - egresos:,.2f}\n"
+    )
+
+# Totales mensuales por tipo y categoría de los últimos meses; lo anterior se resume por año
+def _mensual(base, c, meses):
+    claves = np.sort(base["clave_mes"].unique())
+    recientes = set(claves[-meses:])
+    tabla = base[base["clave_mes"].isin(recientes)].pivot_table(
+        index="clave_mes", columns=["tipo", "categoria"], values="monto", aggfunc="sum", fill_value=0.0)
+    lineas = ["TOTALES MENSUALES POR CATEGORÍA (tipo/categoría: monto)"]
+    for clave, fila in tabla.iterrows():
+        partes = [f"{t}/{cat}: {v:,.0f}" for (t, cat), v in fila.items() if v]
+        lineas.append(f"{etiqueta_mes(int(clave))} | " + "; ".join(partes))
+    anteriores = base[~base["clave_mes"].isin(recientes)]
+    if not anteriores.empty:
+        por_año = anteriores.groupby([anteriores["fecha"].dt.year, "tipo"])["monto"].sum().unstack(fill_value=0.0)
+        for año, fila in por_año.iterrows():
+            lineas.append(f"{año} (año completo) | " + "; ".join(f"{t}: {v:,.0f}" for t, v in fila.items()))
+    return "\n".join(lineas) + "\n"
+
+# Tendencia por categoría: promedio de los últimos 3 meses contra los 3 anteriores
+def _tendencias(base, c):
+    por_mes = base.pivot_table(index="clave_mes", columns=["tipo", "categoria"], values="monto", aggfunc="sum", fill_value=0.0)
+    completo = por_mes.reindex(range(por_mes.index.min(), por_mes.index.max() + 1), fill_value=0.0)
+    if len(completo) < 4:
+        return ""
+    ultimos = completo.tail(3).mean()
+    previos = completo.iloc[-6:-3].mean()
+    cambio = ((ultimos - previos) / previos.replace(0, np.nan) * 100).dropna()
+    cambio = cambio[cambio.abs() >= 10].sort_values(key=np.abs, ascending=False).head(8)
+    if cambio.empty:
+        return "TENDENCIAS: sin cambios relevantes en los últimos meses\n"
+    lineas = ["TENDENCIAS (promedio últimos 3 meses vs 3 anteriores)"]
+    lineas += [f"{t}/{cat}: {v:+.0f}%" for (t, cat), v in cambio.items()]
+    return "\n".join(lineas) + "\n"
+
+def _recurrentes(base, limite):
+    if base["descripcion"].isna().all():
+        return ""
+    grupos = base.dropna(subset=["descripcion"]).groupby(["descripcion", "tipo"])["monto"].agg(["count", "mean", "sum"])
+    grupos = grupos[grupos["count"] > 1].sort_values("count", ascending=False).head(limite)
+    if grupos.empty:
+        return ""
+    lineas = ["DESCRIPCIONES RECURRENTES (veces, promedio, total)"]
+    lineas += [f"{d} ({t}): {int(r['count'])}, {r['mean']:,.0f}, {r['sum']:,.0f}" for (d, t), r in grupos.iterrows()]
+    return "\n".join(lineas) + "\n"
+
+# Movimientos atípicos: más de 3 desviaciones sobre el promedio de su tipo y categoría
+def _atipicos(base, limite):
+    grupo = base.groupby(["tipo", "categoria"])["monto"]
+    desviacion = grupo.transform("std").replace(0, np.nan)
+    z = (base["monto"] - grupo.transform("mean")) / desviacion
+    atipicos = base[z > 3].assign(z=z[z > 3]).sort_values("z", ascending=False).head(limite)
+    if atipicos.empty:
+        return ""
+    lineas = ["MOVIMIENTOS ATÍPICOS"]
+    lineas += [f"{r.fecha:%Y-%m-%d} {r.tipo}/{r.categoria} {r.monto:,.2f} ({r.descripcion})" for r in atipicos.itertuples()]
+    return "\n".join(lineas) + "\n"
+
+def _recientes(base, limite):
+    recientes = base.tail(limite)
+    lineas = ["MOVIMIENTOS MÁS RECIENTES (fecha,tipo,categoría,descripción,monto)"]
+    lineas += [f"{r.fecha:%Y-%m-%d},{r.tipo},{r.categoria},{r.descripcion},{r.monto:.2f}" for r in recientes.itertuples()]
+    return "\n".join(lineas) + "\n"
+
+def _armar(base, c, limites):
+    return {
+        "general": _general(base, c),
+        "mensual": _mensual(base, c, limites["meses"]),
+        "tendencias": _tendencias(base, c),
+        "recurrentes": _recurrentes(base, limites["descripciones"]),
+        "atipicos": _atipicos(base, limites["atipicos"]),
+        "recientes": _recientes(base, limites["recientes"]),
+    }
+
+# 📝 Convierte el historial en un resumen de tamaño acotado para el prompt.
+# Devuelve el texto y un reporte con la estimación de tokens por sección.
+def compactar_libro(df, presupuesto_tokens=PRESUPUESTO_TOKENS, columnas=COLUMNAS_SHEETS):
+    base = _preparar(df, columnas)
+    if base.empty:
+        return "El usuario no tiene movimientos registrados.", {"tokens_estimados": 10, "filas": 0}
+    limites = dict(LIMITES)
+    while True:
+        secciones = _armar(base, columnas, limites)
+        texto = "\n".join(s for s in secciones.values() if s)
+        if estimar_tokens(texto) <= presupuesto_tokens or all(v <= 1 for v in limites.values()):
+            break
+        limites = {k: max(1, v * 2 // 3) for k, v in limites.items()}
+    # Con pocos movimientos el CSV sale más corto que el resumen y se envía tal cual; el CSV
+    # completo solo se escribe cuando la estimación por muestra queda por debajo del resumen
+    tokens_csv, csv = _tokens_csv(df)
+    if tokens_csv <= estimar_tokens(texto):
+        csv = csv if csv is not None else df.to_csv(index=False)
+        tokens_csv = estimar_tokens(csv)
+        if tokens_csv <= estimar_tokens(texto):
+            texto = "MOVIMIENTOS\n" + csv
+    reporte = {
+        "filas": len(base),
+        "tokens_estimados": estimar_tokens(texto),
+        "tokens_csv_completo": tokens_csv,
+        "presupuesto_tokens": presupuesto_tokens,
+        "secciones": {nombre: estimar_tokens(s) for nombre, s in secciones.items()},
+        "limites": limites,
+    }
+    return texto, reporte
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Muestra el resumen para prompt de un libro y su estimación de tokens")
+    parser.add_argument("archivo_csv")
+    parser.add_argument("--presupuesto", type=int, default=PRESUPUESTO_TOKENS)
+    parser.add_argument("--local", action="store_true", help="columnas del CSV local (fecha, tipo, ...)")
+    args = parser.parse_args()
+
+    columnas = COLUMNAS_LOCAL if args.local else COLUMNAS_SHEETS
+    texto, reporte = compactar_libro(pd.read_csv(args.archivo_csv), args.presupuesto, columnas)
+    print(texto)
+    print(reporte)
@@ -0,0 +1,296 @@
+import argparse
+import glob
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import trazas
+from analitica import COLUMNAS_SHEETS, COLUMNAS_LOCAL, claves_mes, etiqueta_mes
+from esquema import ESCALA, centavos
+
+CLAVES = ["usuario", "clave_mes", "tipo", "categoria"]
+COLUMNAS_RESUMEN = CLAVES + ["Mes", "suma", "conteo", "minimo", "maximo"]
+DIRECTORIO_SHEETS = "resumen_sheets"
+USUARIO_LOCAL = "local"
+_MODULO = 1 << 64
+
+# 🧮 Resumen materializado: una fila por usuario × mes × tipo × categoría con suma, conteo,
+# mínimo y máximo. Se actualiza con cada alta o baja y las métricas se leen de aquí. Cada usuario
+# tiene su propio archivo, así que un alta reescribe solo el resumen de quien la hizo.
+
+def _vacio():
+    return pd.DataFrame({
+        "usuario": pd.Series(dtype=object),
+        "clave_mes": pd.Series(dtype=np.int64),
+        "tipo": pd.Series(dtype=object),
+        "categoria": pd.Series(dtype=object),
+        "Mes": pd.Series(dtype=object),
+        "suma": pd.Series(dtype=np.float64),
+        "conteo": pd.Series(dtype=np.int64),
+        "minimo": pd.Series(dtype=np.float64),
+        "maximo": pd.Series(dtype=np.float64),
+    })
+
+# Lo que entra al resumen de cada movimiento: usuario, mes, tipo, categoría y monto en centavos
+def _base(df, columnas, usuario=None):
+    fechas = df[columnas["fecha"]]
+    if not pd.api.types.is_datetime64_any_dtype(fechas):
+        fechas = pd.to_datetime(fechas, errors="coerce")
+    base = pd.DataFrame({
+        "usuario": usuario if usuario is not None else df["Usuario"].to_numpy(),
+        "clave_mes": claves_mes(fechas),
+        "tipo": df[columnas["tipo"]].to_numpy(),
+        "categoria": df[columnas["categoria"]].to_numpy(),
+        "monto": centavos(df[columnas["monto"]]),
+    })
+    return base[base["clave_mes"] >= 0]
+
+def _agregar(base):
+    # Se agrega en centavos enteros y se vuelve a unidades al final
+    tabla = base.groupby(CLAVES, dropna=False, sort=False)["monto"].agg(
+        suma="sum", conteo="size", minimo="min", maximo="max").reset_index()
+    for columna in ["suma", "minimo", "maximo"]:
+        tabla[columna] = tabla[columna] / ESCALA
+    tabla["Mes"] = [etiqueta_mes(c) for c in tabla["clave_mes"]]
+    return tabla[COLUMNAS_RESUMEN]
+
+# Resume movimientos crudos; usuario fija el usuario de todas las filas, si no se toma la columna "Usuario"
+def resumir(df, columnas=COLUMNAS_SHEETS, usuario=None):
+    if df.empty:
+        return _vacio()
+    return _agregar(_base(df, columnas, usuario))
+
+# Huella de cada movimiento sobre lo mismo que usa el resumen (mes, tipo, categoría y centavos)
+def _huellas(base):
+    base = base[["clave_mes", "tipo", "categoria", "monto"]].astype({"tipo": "string", "categoria": "string"})
+    return pd.util.hash_pandas_object(base, index=False).to_numpy()
+
+# Huella de los movimientos de un usuario: suma (módulo 2**64) de la huella de cada uno. No depende
+# del orden de las filas y se actualiza con sumas y restas en cada alta o baja, así que comparar el
+# resumen con el libro cuesta un hash por fila.
+def huella_movimientos(df, columnas=COLUMNAS_SHEETS):
+    if df.empty:
+        return 0
+    return int(_huellas(_base(df, columnas, usuario="")).sum()) % _MODULO
+
+# Resumen y huella de cada usuario del lote, con una sola agregación para todos;
+# usuario fija el usuario de todas las filas como en resumir
+def _por_usuario(df, columnas, usuario=None):
+    if df.empty:
+        return {} if usuario is None else {usuario: (_vacio(), 0)}
+    base = _base(df, columnas, usuario)
+    tablas = dict(tuple(_agregar(base).groupby("usuario", sort=False)))
+    huellas = pd.Series(_huellas(base)).groupby(base["usuario"].to_numpy(), sort=False).sum()
+    quienes = list(huellas.index) if usuario is None else [usuario]
+    return {q: (tablas[q].reset_index(drop=True) if q in tablas else _vacio(), int(huellas.get(q, 0)) % _MODULO)
+            for q in quienes}
+
+def _combinar(tabla, nuevas):
+    if tabla.empty:
+        return nuevas.reset_index(drop=True)
+    if nuevas.empty:
+        return tabla
+    juntas = pd.concat([tabla, nuevas], ignore_index=True)
+    return juntas.groupby(CLAVES, dropna=False, sort=False).agg(
+        Mes=("Mes", "first"), suma=("suma", "sum"), conteo=("conteo", "sum"),
+        minimo=("minimo", "min"), maximo=("maximo", "max")).reset_index()[COLUMNAS_RESUMEN].round({"suma": 2})
+
+class ResumenMensual:
+    def __init__(self, directorio, columnas=COLUMNAS_SHEETS):
+        self.directorio = directorio
+        self.columnas = columnas
+        self._candado = threading.RLock()
+        self._tablas = {}  # usuario → (resumen, huella), leídos de disco la primera vez que se piden
+        self._versiones = {}  # usuario → versión de datos del almacén ya comprobada
+
+    # Correo legible más un hash del correo tal cual: la limpieza del nombre (y los sistemas de archivos
+    # que no distinguen mayúsculas) juntarían correos distintos, como a/b@x.com y a_b@x.com o A@x.com y
+    # a@x.com. La limpieza cambia "~" por "_", así que "~" solo aparece como separador.
+    def _ruta(self, usuario):
+        usuario = str(usuario)
+        huella = hashlib.blake2b(usuario.encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.directorio, re.sub(r"[^\w.@+-]", "_", usuario) + f"~{huella}.parquet")
+
+    def _de_usuario(self, usuario):
+        with self._candado:
+            if usuario not in self._tablas:
+                ruta = self._ruta(usuario)
+                if os.path.exists(ruta):
+                    archivo = pq.read_table(ruta)
+                    tabla = archivo.to_pandas()
+                    self._tablas[usuario] = (tabla[tabla["usuario"] == usuario].reset_index(drop=True),
+                                             int((archivo.schema.metadata or {}).get(b"huella", b"0")))
+                else:
+                    self._tablas[usuario] = (_vacio(), 0)
+            return self._tablas[usuario]
+
+    # Escribe solo el archivo del usuario; la huella va en los metadatos del Parquet
+    def _guardar(self, usuario, tabla, huella):
+        self._tablas[usuario] = (tabla, huella)
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(usuario)
+        temporal = os.path.join(self.directorio, "." + os.path.basename(ruta) + ".tmp")
+        archivo = pa.Table.from_pandas(tabla[COLUMNAS_RESUMEN], preserve_index=False)
+        metadatos = dict(archivo.schema.metadata or {}, huella=str(huella).encode())
+        pq.write_table(archivo.replace_schema_metadata(metadatos), temporal)
+        os.replace(temporal, ruta)
+
+    # Todos los usuarios con resumen guardado
+    @property
+    def tabla(self):
+        with self._candado:
+            archivos = glob.glob(os.path.join(self.directorio, "*~*.parquet"))
+            partes = [pd.read_parquet(a) for a in sorted(archivos)]
+        partes = [p for p in partes if not p.empty]
+        return pd.concat(partes, ignore_index=True) if partes else _vacio()
+
+    @trazas.medido("resumen.agregar")
+    def agregar(self, df, usuario=None):
+        with self._candado:
+            for quien, (nuevas, huella_nuevas) in _por_usuario(df, self.columnas, usuario).items():
+                tabla, huella = self._de_usuario(quien)
+                self._guardar(quien, _combinar(tabla, nuevas), (huella + huella_nuevas) % _MODULO)
+
+    # Resta los movimientos borrados. Si uno era el mínimo o el máximo de su grupo, esos extremos
+    # se recalculan con `restantes` (los movimientos crudos que quedan); sin ellos quedan en NaN.
+    @trazas.medido("resumen.eliminar")
+    def eliminar(self, df_eliminados, restantes=None, usuario=None):
+        with self._candado:
+            for quien, (quitadas, huella_quitadas) in _por_usuario(df_eliminados, self.columnas, usuario).items():
+                if quitadas.empty:
+                    continue
+                tabla, huella = self._de_usuario(quien)
+                tabla = tabla.merge(
+                    quitadas[CLAVES + ["suma", "conteo", "minimo", "maximo"]],
+                    on=CLAVES, how="left", suffixes=("", "_quitado"))
+                tocadas = tabla["conteo_quitado"].notna()
+                tabla["suma"] = (tabla["suma"] - tabla["suma_quitado"].fillna(0.0)).round(2)
+                tabla["conteo"] = (tabla["conteo"] - tabla["conteo_quitado"].fillna(0)).astype(np.int64)
+                extremo = tocadas & ((tabla["minimo_quitado"] <= tabla["minimo"]) | (tabla["maximo_quitado"] >= tabla["maximo"]))
+                if extremo.any():
+                    suyos = restantes if restantes is None or usuario is not None else restantes[restantes["Usuario"] == quien]
+                    recalculo = resumir(suyos, self.columnas, quien) if suyos is not None else _vacio()
+                    recalculo = tabla.loc[extremo, CLAVES].merge(recalculo[CLAVES + ["minimo", "maximo"]], on=CLAVES, how="left")
+                    tabla.loc[extremo, "minimo"] = recalculo["minimo"].to_numpy()
+                    tabla.loc[extremo, "maximo"] = recalculo["maximo"].to_numpy()
+                self._guardar(quien, tabla.loc[tabla["conteo"] > 0, COLUMNAS_RESUMEN].reset_index(drop=True),
+                              (huella - huella_quitadas) % _MODULO)
+
+    # Reemplaza el resumen del usuario (o de los usuarios presentes en df) por uno calculado
+    # desde cero; con todo=True df es el libro completo y se descartan los resúmenes anteriores
+    @trazas.medido("resumen.reconstruir")
+    def reconstruir(self, df, usuario=None, todo=False):
+        with self._candado:
+            if todo:
+                for archivo in glob.glob(os.path.join(self.directorio, "*.parquet")):
+                    os.remove(archivo)
+                self._tablas.clear()
+            for quien, (tabla, huella) in _por_usuario(df, self.columnas, usuario).items():
+                self._guardar(quien, tabla, huella)
+
+    # Rearma el resumen del usuario si no corresponde a su libro. Mientras la versión de datos del
+    # almacén no cambie no se revisa nada; si cambió (o no hay versión) se compara la huella del libro
+    # con la que se fue llevando en cada alta y baja, así que también se notan los cambios de montos
+    # hechos por otros procesos o traídos por el espejo. Devuelve True si lo rearmó.
+    @trazas.medido("resumen.actualizar")
+    def actualizar(self, df, usuario, version=None):
+        with self._candado:
+            if version is not None and self._versiones.get(usuario) == version:
+                return False
+            distinto = self._de_usuario(usuario)[1] != huella_movimientos(df, self.columnas)
+            if distinto:
+                self.reconstruir(df, usuario)
+            if version is not None:
+                self._versiones[usuario] = version
+            return distinto
+
+    # Compara el resumen guardado contra uno recalculado desde los datos crudos
+    @trazas.medido("resumen.verificar")
+    def verificar(self, df, usuario=None, todo=False):
+        esperado = resumir(df, self.columnas, usuario)
+        if todo:
+            actual = self.tabla
+        else:
+            quienes = [usuario] if usuario is not None else list(dict.fromkeys(df["Usuario"].dropna()))
+            actual = pd.concat([_vacio()] + [self.del_usuario(q) for q in quienes], ignore_index=True)
+        cruce = actual.merge(esperado, on=CLAVES, how="outer", suffixes=("", "_esperado"), indicator=True)
+        distinto = cruce["_merge"] != "both"
+        for columna in ["suma", "minimo", "maximo"]:
+            distinto |= ~np.isclose(cruce[columna], cruce[f"{columna}_esperado"], equal_nan=True)
+        distinto |= cruce["conteo"] != cruce["conteo_esperado"]
+        return cruce[distinto]
+
+    def tiene_usuario(self, usuario):
+        return not self._de_usuario(usuario)[0].empty
+
+    @trazas.medido("resumen.del_usuario")
+    def del_usuario(self, usuario):
+        return self._de_usuario(usuario)[0].copy()
+
+    def conteo(self, usuario):
+        return int(self._de_usuario(usuario)[0]["conteo"].sum())
+
+    @trazas.medido("resumen.meses")
+    def meses(self, usuario):
+        return sorted(self._de_usuario(usuario)[0]["Mes"].unique())
+
+    # Métricas de un mes en O(categorías): ingresos, egresos, balance y desglose por categoría
+    @trazas.medido("resumen.resumen_mes")
+    def resumen_mes(self, usuario, mes, categorias=None):
+        del_mes = self._de_usuario(usuario)[0]
+        del_mes = del_mes[del_mes["Mes"] == mes]
+        if categorias is not None:
+            del_mes = del_mes[del_mes["categoria"].isin(categorias)]
+        ingresos = del_mes[del_mes["tipo"] == self.columnas["ingreso"]]
+        egresos = del_mes[del_mes["tipo"] == self.columnas["egreso"]]
+        return {
+            "ingresos": float(ingresos["suma"].sum()),
+            "egresos": float(egresos["suma"].sum()),
+            "balance": float(ingresos["suma"].sum() - egresos["suma"].sum()),
+            "ingresos_por_categoria": ingresos.groupby("categoria")["suma"].sum(),
+            "egresos_por_categoria": egresos.groupby("categoria")["suma"].sum(),
+        }
+
+_resumenes = {}
+_candado_resumenes = threading.Lock()
+
+# Una instancia por directorio y proceso, compartida entre sesiones
+def obtener_resumen(directorio=DIRECTORIO_SHEETS, columnas=COLUMNAS_SHEETS):
+    with _candado_resumenes:
+        if directorio not in _resumenes:
+            _resumenes[directorio] = ResumenMensual(directorio, columnas)
+        return _resumenes[directorio]
+
+def _cargar_origen(origen):
+    if origen == "local":
+        from almacen_parquet import leer_movimientos, resumen_local
+        return leer_movimientos(), resumen_local(), USUARIO_LOCAL
+    from gspread_dataframe import get_as_dataframe
+    from sheets_utils import conectar_google_sheets, obtener_hoja_unica
+    cliente, _ = conectar_google_sheets()
+    df = get_as_dataframe(obtener_hoja_unica(cliente), evaluate_formulas=True).dropna(how="all")
+    return df, obtener_resumen(DIRECTORIO_SHEETS, COLUMNAS_SHEETS), None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye o verifica el resumen mensual contra los datos crudos")
+    parser.add_argument("accion", choices=["reconstruir", "verificar"])
+    parser.add_argument("--origen", choices=["local", "sheets"], default="local")
+    args = parser.parse_args()
+
+    df, resumen, usuario = _cargar_origen(args.origen)
+    if args.accion == "reconstruir":
+        resumen.reconstruir(df, usuario, todo=True)
+        print(f"Resumen reconstruido: {len(resumen.tabla)} grupos desde {len(df)} movimientos")
+    diferencias = resumen.verificar(df, usuario, todo=True)
+    if diferencias.empty:
+        print("✅ El resumen coincide con los datos crudos")
+    else:
+        print(f"❌ {len(diferencias)} grupos no coinciden:")
+        print(diferencias.to_string())
+        raise SystemExit(1)
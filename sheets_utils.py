@@ -1,12 +1,46 @@
 import streamlit as st
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
-import google.generativeai as genai
+import numpy as np
+import asyncio
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import trazas
+from almacenamiento import nuevo_id, asignar_ids
+from cache_ia import obtener_cache
+from esquema import desde_sheets, filas_sheets
+from pronostico import pronosticar, texto_presupuesto
+from resumen_prompt import compactar_libro
+
+COLUMNAS = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID", "Modificado"]
+TAMANO_LOTE = 500
+MARGEN_RENOVACION = timedelta(minutes=5)
+LIBRO_HOJAS_USUARIO = "circulo_financiero_usuarios"
+TTL_CACHE = 300  # segundos que un índice o una carga de usuario se consideran vigentes
+
+# Estado compartido por todas las sesiones del proceso de Streamlit
+_candado = threading.RLock()
+_conexion = {}
+_hojas = {}
+_encabezados_cache = {}
+_indices = {}
+_datos_cache = {}
+_versiones = {}
+
+# gspread, oauth2client, gspread_dataframe y google.generativeai se importan al primer uso
+# (o en el hilo de precarga): importar este módulo no carga ningún SDK de Google.
+def rowcol_to_a1(fila, columna):
+    from gspread.utils import rowcol_to_a1 as convertir
+    return convertir(fila, columna)
 
 # ✅ CONEXIÓN SEGURA A GOOGLE SHEETS USANDO secrets.toml
-def conectar_google_sheets():
+def _crear_cliente():
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
     scope = [
         "https://spreadsheets.google.com/feeds",
         "https://www.googleapis.com/auth/drive"
@@ -17,23 +51,216 @@ def conectar_google_sheets():
     cliente = gspread.authorize(cred)
     return cliente, cred
 
+# Renueva el token antes de que caduque, reutilizando la sesión HTTP del cliente
+def _renovar_token_si_expira(cliente):
+    auth = getattr(cliente.http_client, "auth", None)
+    if auth is None:
+        return
+    expiracion = getattr(auth, "expiry", None)
+    if expiracion is not None and expiracion - datetime.utcnow() > MARGEN_RENOVACION:
+        return
+    from google.auth.transport.requests import Request
+    auth.refresh(Request(cliente.http_client.session))
+
+# Un solo cliente autorizado por proceso; cada rerun lo reutiliza en lugar de autenticarse de nuevo
+def conectar_google_sheets():
+    with _candado:
+        if "cliente" not in _conexion:
+            _conexion["cliente"], _conexion["cred"] = _crear_cliente()
+            trazas.instrumentar_cliente(_conexion["cliente"])
+        cliente, cred = _conexion["cliente"], _conexion["cred"]
+        _renovar_token_si_expira(cliente)
+    return cliente, cred
+
+# Resuelve libro y hoja por nombre una sola vez y guarda el handle
+@trazas.medido("sheets.obtener_hoja")
+def obtener_hoja(cliente, nombre_libro, nombre_hoja=None):
+    clave = (id(cliente), nombre_libro, nombre_hoja)
+    with _candado:
+        if clave not in _hojas:
+            libro = cliente.open(nombre_libro)
+            _hojas[clave] = libro.worksheet(nombre_hoja) if nombre_hoja else libro.sheet1
+        return _hojas[clave]
+
 def obtener_hoja_unica(cliente):
-    return cliente.open("circulo_financiero_unico").sheet1
+    return obtener_hoja(cliente, "circulo_financiero_unico")
+
+# Hoja propia de cada usuario dentro del libro de hojas por usuario; se crea la primera vez
+@trazas.medido("sheets.obtener_hoja_usuario")
+def obtener_hoja_usuario(correo_usuario, cliente, cred=None):
+    clave = (id(cliente), LIBRO_HOJAS_USUARIO, correo_usuario)
+    with _candado:
+        if clave not in _hojas:
+            libro = cliente.open(LIBRO_HOJAS_USUARIO)
+            try:
+                _hojas[clave] = libro.worksheet(correo_usuario)
+            except _hoja_no_encontrada():
+                hoja = libro.add_worksheet(title=correo_usuario, rows=1000, cols=len(COLUMNAS))
+                hoja.update(values=[COLUMNAS], range_name="A1")
+                _hojas[clave] = hoja
+        return _hojas[clave]
+
+def _hoja_no_encontrada():
+    from gspread.exceptions import WorksheetNotFound
+    return WorksheetNotFound
+
+def _codigo_http(error):
+    codigo = getattr(error, "code", None)
+    if codigo is None:
+        codigo = getattr(getattr(error, "response", None), "status_code", None)
+    return codigo
+
+# 429 (cuota) y 5xx se reintentan; cualquier otro error de la API no se arregla esperando
+def error_transitorio(error):
+    from gspread.exceptions import APIError
+
+    if isinstance(error, APIError):
+        codigo = _codigo_http(error)
+        return codigo == 429 or (codigo is not None and codigo >= 500)
+    return isinstance(error, OSError)  # caídas de red y timeouts
+
+def _clave_hoja(hoja):
+    return (hoja.spreadsheet_id, hoja.id)
+
+def _letra(columna):
+    return re.sub(r"\d", "", rowcol_to_a1(1, columna))
+
+# 📇 Índices usuario → filas e ID → fila: se arman con las columnas "Usuario" e "ID" en una sola
+# lectura y se mantienen con cada escritura. Las filas con datos que no tienen ID reciben uno.
+@trazas.medido("sheets._construir_indice")
+def _construir_indice(hoja, encabezados):
+    nombres = [c for c in ["Usuario", "ID"] if c in encabezados]
+    columnas = hoja.batch_get([f"{_letra(encabezados.index(c) + 1)}2:{_letra(encabezados.index(c) + 1)}" for c in nombres])
+    valores = {
+        nombre: [fila[0] if fila else "" for fila in columna]
+        for nombre, columna in zip(nombres, columnas)
+    }
+    usuarios = {}
+    for fila, valor in enumerate(valores.get("Usuario", []), start=2):
+        if valor:
+            usuarios.setdefault(valor, []).append(fila)
+    ids = {}
+    for fila, valor in enumerate(valores.get("ID", []), start=2):
+        if valor:
+            ids[str(valor)] = fila
+    if "ID" in encabezados:
+        con_ids = set(ids.values())
+        sin_id = [f for filas in usuarios.values() for f in filas if f not in con_ids]
+        if sin_id:
+            letra = _letra(encabezados.index("ID") + 1)
+            nuevos = {f: nuevo_id() for f in sorted(sin_id)}
+            hoja.batch_update([{"range": f"{letra}{f}", "values": [[i]]} for f, i in nuevos.items()], value_input_option="RAW")
+            ids.update({i: f for f, i in nuevos.items()})
+    indice = {"usuarios": usuarios, "ids": ids, "instante": time.monotonic()}
+    with _candado:
+        _indices[_clave_hoja(hoja)] = indice
+    return indice
+
+# IDs que ya están en la hoja según una lectura nueva de la columna ID (sirve para no volver a
+# agregar filas que llegaron en un envío que falló a la mitad)
+def ids_en_hoja(hoja):
+    return set(_construir_indice(hoja, _encabezados(hoja))["ids"])
+
+def _filas_usuario(hoja, correo_usuario, encabezados, reconstruir=False):
+    with _candado:
+        indice = _indices.get(_clave_hoja(hoja))
+    if reconstruir or indice is None or time.monotonic() - indice["instante"] > TTL_CACHE:
+        indice = _construir_indice(hoja, encabezados)
+    with _candado:
+        return list(indice["usuarios"].get(correo_usuario, []))
 
+def _rangos(filas):
+    rangos = []
+    for fila in sorted(filas):
+        if rangos and rangos[-1][1] == fila - 1:
+            rangos[-1][1] = fila
+        else:
+            rangos.append([fila, fila])
+    return rangos
+
+def _version(clave, correo_usuario):
+    return (_versiones.get(clave, 0), _versiones.get((clave, correo_usuario), 0))
+
+# Invalida la caché de los usuarios indicados, o de toda la hoja si usuarios es None
+def _invalidar(clave, usuarios=None):
+    with _candado:
+        if usuarios is None:
+            _versiones[clave] = _versiones.get(clave, 0) + 1
+        else:
+            for usuario in usuarios:
+                _versiones[(clave, usuario)] = _versiones.get((clave, usuario), 0) + 1
+
+def _leer_filas(hoja, filas, encabezados):
+    rangos = _rangos(filas)
+    bloques = hoja.batch_get(
+        [f"{rowcol_to_a1(inicio, 1)}:{rowcol_to_a1(fin, len(encabezados))}" for inicio, fin in rangos],
+        value_render_option="UNFORMATTED_VALUE",
+        date_time_render_option="FORMATTED_STRING",
+    )
+    registros, indice = [], []
+    for (inicio, fin), bloque in zip(rangos, bloques):
+        for desplazamiento in range(fin - inicio + 1):
+            valores = bloque[desplazamiento] if desplazamiento < len(bloque) else []
+            registros.append(list(valores) + [""] * (len(encabezados) - len(valores)))
+            indice.append(inicio + desplazamiento)
+    df = pd.DataFrame(registros, columns=encabezados, index=indice)
+    # mask en lugar de replace: replace de texto a NaN avisa del downcasting en pandas 2.2
+    return df.mask(df == "")
+
+# Lee solo las filas del usuario (batch_get sobre sus rangos) y guarda el resultado
+# en caché hasta que una escritura lo invalide o venza TTL_CACHE.
+# El índice del DataFrame devuelto es el número de fila en la hoja (la fila 1 son los encabezados)
+@trazas.medido("sheets.cargar_datos_usuario")
 def cargar_datos_usuario(hoja, correo_usuario):
-    df = get_as_dataframe(hoja, evaluate_formulas=True).dropna(how="all")
-    if not df.empty and "Usuario" in df.columns:
-        df = df[df["Usuario"] == correo_usuario].copy()
-        if "Fecha" in df.columns:
-            df["Fecha"] = pd.to_datetime(df["Fecha"], errors='coerce')
-    else:
-        df = pd.DataFrame(columns=["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario"])
-    return df
+    clave = _clave_hoja(hoja)
+    with _candado:
+        version = _version(clave, correo_usuario)
+        entrada = _datos_cache.get((clave, correo_usuario))
+    if entrada and entrada[0] == version and time.monotonic() - entrada[1] < TTL_CACHE:
+        return entrada[2].copy()
+
+    encabezados = _encabezados(hoja)
+    if "Usuario" not in encabezados:
+        return pd.DataFrame(columns=COLUMNAS)
+
+    filas = _filas_usuario(hoja, correo_usuario, encabezados)
+    df = _leer_filas(hoja, filas, encabezados) if filas else pd.DataFrame(columns=encabezados)
+    if (df["Usuario"] != correo_usuario).any():
+        # Otro proceso movió filas desde que se armó el índice: se reconstruye y se vuelve a leer
+        filas = _filas_usuario(hoja, correo_usuario, encabezados, reconstruir=True)
+        df = _leer_filas(hoja, filas, encabezados) if filas else pd.DataFrame(columns=encabezados)
+        df = df[df["Usuario"] == correo_usuario]
+
+    df = desde_sheets(df.dropna(how="all"))
+
+    with _candado:
+        _datos_cache[(clave, correo_usuario)] = (version, time.monotonic(), df)
+    return df.copy()
 
+# Identifica los datos que devuelve cargar_datos_usuario mientras siga sirviéndolos de la caché
+# (None si ya no están vigentes); sirve para reutilizar lo que se calculó sobre ellos
+def version_datos(hoja, correo_usuario):
+    clave = _clave_hoja(hoja)
+    with _candado:
+        version = _version(clave, correo_usuario)
+        entrada = _datos_cache.get((clave, correo_usuario))
+    if entrada and entrada[0] == version and time.monotonic() - entrada[1] < TTL_CACHE:
+        return clave, correo_usuario, version, entrada[1]
+    return None
+
+# Reescribe la hoja completa; para cambios puntuales usar agregar_movimientos,
+# actualizar_movimientos o eliminar_filas
+@trazas.medido("sheets.guardar_datos_usuario")
 def guardar_datos_usuario(hoja, df_usuario):
+    from gspread_dataframe import get_as_dataframe, set_with_dataframe
+
+    with _candado:
+        _encabezados_cache.pop(_clave_hoja(hoja), None)
+        _indices.pop(_clave_hoja(hoja), None)
+    _invalidar(_clave_hoja(hoja))
     df_actual = get_as_dataframe(hoja, evaluate_formulas=True).dropna(how="all")
     if df_actual.empty:
-        df_actual = pd.DataFrame(columns=["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario"])
+        df_actual = pd.DataFrame(columns=COLUMNAS)
 
     if not df_usuario.empty and "Usuario" in df_usuario.columns:
         usuario = df_usuario["Usuario"].iloc[0]
@@ -44,20 +271,331 @@ def guardar_datos_usuario(hoja, df_usuario):
     hoja.clear()
     set_with_dataframe(hoja, df_nuevo)
 
+# ✍️ Escrituras incrementales: solo viajan las filas que cambian
+def _encabezados(hoja):
+    clave = _clave_hoja(hoja)
+    with _candado:
+        if clave in _encabezados_cache:
+            return _encabezados_cache[clave]
+    encabezados = [c for c in hoja.row_values(1) if c]
+    if not encabezados:
+        hoja.update(values=[COLUMNAS], range_name="A1")
+        encabezados = list(COLUMNAS)
+    else:
+        # Hojas anteriores a los IDs o a la columna Modificado: se agregan al final;
+        # el índice rellena los IDs que falten
+        faltantes = [c for c in ["ID", "Modificado"] if c not in encabezados]
+        if faltantes:
+            hoja.update(values=[faltantes], range_name=rowcol_to_a1(1, len(encabezados) + 1))
+            encabezados += faltantes
+    with _candado:
+        _encabezados_cache[clave] = encabezados
+    return encabezados
+
+# Versión de cada fila: milisegundos desde 1970 de su última escritura. Se guarda como número
+# para que Sheets no lo reinterprete como fecha.
+def marca_modificado():
+    return int(time.time() * 1000)
+
+# Toda escritura estampa una versión nueva; marca permite fijarla (el espejo local la necesita
+# para reconocer sus propias escrituras)
+def _sellar(df, marca=None):
+    df = df.copy()
+    df["Modificado"] = marca or marca_modificado()
+    return df
+
+def _filas_actualizadas(respuesta):
+    rango = respuesta.get("updates", {}).get("updatedRange", "")
+    coincidencia = re.search(r"[A-Z]+(\d+)(?::[A-Z]+(\d+))?$", rango)
+    if not coincidencia:
+        return []
+    inicio = int(coincidencia.group(1))
+    fin = int(coincidencia.group(2) or inicio)
+    return list(range(inicio, fin + 1))
+
+# Agrega al final de la hoja solo los movimientos nuevos, en lotes de TAMANO_LOTE filas.
+# Devuelve los números de fila asignados, en el mismo orden que df_nuevos.
+@trazas.medido("sheets.agregar_movimientos")
+def agregar_movimientos(hoja, df_nuevos, marca=None):
+    if df_nuevos.empty:
+        return []
+    encabezados = _encabezados(hoja)
+    df_nuevos = _sellar(asignar_ids(df_nuevos), marca)
+    filas = filas_sheets(df_nuevos, encabezados)
+    numeros = []
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        respuesta = hoja.append_rows(
+            filas[inicio:inicio + TAMANO_LOTE],
+            value_input_option="USER_ENTERED",
+            table_range="A1",
+        )
+        numeros.extend(_filas_actualizadas(respuesta))
+
+    usuarios = set(df_nuevos["Usuario"].dropna()) if "Usuario" in df_nuevos.columns else None
+    with _candado:
+        indice = _indices.get(_clave_hoja(hoja))
+        if indice is not None and usuarios is not None and len(numeros) == len(df_nuevos):
+            for usuario, fila in zip(df_nuevos["Usuario"], numeros):
+                if isinstance(usuario, str) and usuario:
+                    indice["usuarios"].setdefault(usuario, []).append(fila)
+            indice["ids"].update(zip(df_nuevos["ID"].astype(str), numeros))
+        else:
+            _indices.pop(_clave_hoja(hoja), None)
+    _invalidar(_clave_hoja(hoja), usuarios)
+    return numeros
+
+# Reescribe únicamente las filas indicadas en el índice de df_cambios (números de fila)
+@trazas.medido("sheets.actualizar_movimientos")
+def actualizar_movimientos(hoja, df_cambios, marca=None):
+    if df_cambios.empty:
+        return
+    encabezados = _encabezados(hoja)
+    df_cambios = _sellar(df_cambios, marca)
+    filas = filas_sheets(df_cambios, encabezados)
+    hoja.batch_update(
+        [
+            {
+                "range": f"{rowcol_to_a1(fila, 1)}:{rowcol_to_a1(fila, len(encabezados))}",
+                "values": [valores],
+            }
+            for fila, valores in zip(df_cambios.index, filas)
+        ],
+        value_input_option="USER_ENTERED",
+    )
+    usuarios = set(df_cambios["Usuario"].dropna()) if "Usuario" in df_cambios.columns else None
+    _invalidar(_clave_hoja(hoja), usuarios)
+
+# Borra las filas indicadas en una sola llamada; los bloques contiguos se agrupan
+# y se eliminan de abajo hacia arriba para que los números no se desplacen
+@trazas.medido("sheets.eliminar_filas")
+def eliminar_filas(hoja, filas):
+    bloques = []
+    for fila in sorted(set(int(f) for f in filas), reverse=True):
+        if bloques and bloques[-1][0] == fila + 1:
+            bloques[-1][0] = fila
+        else:
+            bloques.append([fila, fila])
+    if not bloques:
+        return
+    hoja.spreadsheet.batch_update({
+        "requests": [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": hoja.id,
+                        "dimension": "ROWS",
+                        "startIndex": inicio - 1,
+                        "endIndex": fin,
+                    }
+                }
+            }
+            for inicio, fin in bloques
+        ]
+    })
+
+    # Las filas de abajo suben: se corrige el índice de todos los usuarios y se invalida la hoja
+    eliminadas = np.array(sorted(f for bloque in bloques for f in range(bloque[0], bloque[1] + 1)))
+    with _candado:
+        indice = _indices.get(_clave_hoja(hoja))
+        if indice is not None:
+            for usuario, filas_usuario in list(indice["usuarios"].items()):
+                filas_usuario = np.asarray(filas_usuario)
+                filas_usuario = filas_usuario[~np.isin(filas_usuario, eliminadas)]
+                indice["usuarios"][usuario] = (filas_usuario - np.searchsorted(eliminadas, filas_usuario)).tolist()
+            ids = list(indice["ids"])
+            filas_ids = np.asarray([indice["ids"][i] for i in ids], dtype=np.int64)
+            quedan = ~np.isin(filas_ids, eliminadas)
+            filas_ids = filas_ids - np.searchsorted(eliminadas, filas_ids)
+            indice["ids"] = {i: int(f) for i, f, q in zip(ids, filas_ids, quedan) if q}
+    _invalidar(_clave_hoja(hoja))
+
+# Fila actual de cada ID. Las posiciones del índice se confirman leyendo esas celdas de la
+# columna ID en una sola llamada; si otro proceso movió filas, el índice se rearma una vez.
+def _ubicar(hoja, ids):
+    ids = [str(i) for i in dict.fromkeys(ids)]
+    if not ids:
+        return {}
+    encabezados = _encabezados(hoja)
+    letra = _letra(encabezados.index("ID") + 1)
+    with _candado:
+        indice = _indices.get(_clave_hoja(hoja))
+    fresco = indice is None or time.monotonic() - indice["instante"] > TTL_CACHE
+    if fresco:
+        indice = _construir_indice(hoja, encabezados)
+    while True:
+        filas = {i: indice["ids"][i] for i in ids if i in indice["ids"]}
+        leidas = hoja.batch_get([f"{letra}{f}" for f in filas.values()]) if filas else []
+        confirmadas = {i: f for (i, f), celda in zip(filas.items(), leidas) if celda and str(celda[0][0]) == i}
+        if len(confirmadas) == len(ids) or fresco:
+            return confirmadas
+        indice = _construir_indice(hoja, encabezados)
+        fresco = True
+
+# 🔁 Lecturas para réplicas locales: la versión de cada movimiento en una sola lectura de las
+# columnas ID y Modificado, y después solo las filas que cambiaron
+@trazas.medido("sheets.listar_versiones")
+def listar_versiones(hoja):
+    encabezados = _encabezados(hoja)
+    columnas = [_letra(encabezados.index(c) + 1) for c in ["Usuario", "ID", "Modificado"]]
+    usuarios, ids, versiones = hoja.batch_get([f"{l}2:{l}" for l in columnas], value_render_option="UNFORMATTED_VALUE")
+    largo = max(len(usuarios), len(ids))
+    usuarios, ids, versiones = ([str(v[0]).strip() if v else "" for v in c] + [""] * (largo - len(c)) for c in (usuarios, ids, versiones))
+    # Filas cargadas antes de que existiera la columna ID: se completan y se vuelve a leer
+    if any(u and not i for u, i in zip(usuarios, ids)):
+        _construir_indice(hoja, encabezados)
+        return listar_versiones(hoja)
+    registros = [
+        (i, int(float(v)) if v else 0, fila)
+        for fila, (i, v) in enumerate(zip(ids, versiones), start=2)
+        if i
+    ]
+    return pd.DataFrame(registros, columns=["ID", "Modificado", "fila"])
+
+@trazas.medido("sheets.leer_movimientos_filas")
+def leer_movimientos_filas(hoja, filas):
+    encabezados = _encabezados(hoja)
+    if not filas:
+        return pd.DataFrame(columns=encabezados)
+    return desde_sheets(_leer_filas(hoja, filas, encabezados).dropna(how="all"))
+
+# Borra los movimientos con esos IDs; devuelve {ID: fila borrada} de los que se encontraron
+@trazas.medido("sheets.eliminar_movimientos")
+def eliminar_movimientos(hoja, ids):
+    filas = _ubicar(hoja, ids)
+    eliminar_filas(hoja, filas.values())
+    return filas
+
+# Reescribe los movimientos de df_cambios (filas completas, con columna "ID") en su fila actual.
+# Devuelve {ID: fila} de los que se encontraron; los que ya no existen se ignoran.
+@trazas.medido("sheets.editar_movimientos")
+def editar_movimientos(hoja, df_cambios, marca=None):
+    if df_cambios.empty:
+        return {}
+    filas = _ubicar(hoja, df_cambios["ID"])
+    cambios = df_cambios[df_cambios["ID"].astype(str).isin(filas)].copy()
+    cambios.index = [filas[str(i)] for i in cambios["ID"]]
+    actualizar_movimientos(hoja, cambios, marca)
+    return filas
+
+# Ajusta los números de fila de un DataFrame local después de eliminar_filas
+def desplazar_filas(df, filas_eliminadas):
+    eliminadas = pd.Index(sorted(set(int(f) for f in filas_eliminadas)))
+    df = df.drop(index=eliminadas, errors="ignore")
+    df.index = df.index - eliminadas.searchsorted(df.index)
+    return df
+
+# 👥 Registro de usuarios activos: columna A correo, B primera vez, C última vez; E1 guarda un
+# número de versión que sube con cada escritura. Registrar solo anota en memoria; las altas y
+# las últimas visitas se escriben juntas cada INTERVALO_REGISTRO segundos desde un hilo aparte.
+INTERVALO_REGISTRO = 60
+CELDA_VERSION_REGISTRO = "E1"
+
+_registro = {
+    "filas": {},      # correo -> fila en la hoja, según la última lectura
+    "escrito": {},    # correo -> última visita ya escrita
+    "version": None,
+    "vistos": {},     # correo -> [primera vez, última vez] pendientes de escribir
+    "cliente": None,
+    "programado": False,
+}
+_candado_registro = threading.Lock()
+_candado_escritura_registro = threading.Lock()  # una sola escritura a la vez
+
+def _leer_registro(hoja):
+    correos = hoja.col_values(1)
+    _registro["filas"] = {c.strip().lower(): i for i, c in enumerate(correos, start=1) if c.strip()}
+
+def _escribir_registro():
+    with _candado_escritura_registro:
+        _escribir_registro_pendiente()
+
+def _escribir_registro_en_fondo():
+    with trazas.traza("registro-fondo"):
+        _escribir_registro()
+
+def _escribir_registro_pendiente():
+    with _candado_registro:
+        vistos = _registro["vistos"]
+        _registro["vistos"] = {}
+        _registro["programado"] = False
+        cliente = _registro["cliente"]
+    try:
+        hoja = obtener_hoja(cliente, "usuarios_activos")
+        version = str(hoja.acell(CELDA_VERSION_REGISTRO).value or "")
+        version = int(version) if version.isdigit() else 0
+        # Otro proceso escribió desde la última lectura: se relee la columna antes de dar altas
+        if version != _registro["version"]:
+            _leer_registro(hoja)
+        nuevos = [[c, primera, ultima] for c, (primera, ultima) in vistos.items() if c not in _registro["filas"]]
+        if nuevos:
+            respuesta = hoja.append_rows(nuevos, value_input_option="RAW", table_range="A1")
+            for (correo, _, _), fila in zip(nuevos, _filas_actualizadas(respuesta)):
+                _registro["filas"][correo] = fila
+        cambios = [
+            {"range": f"C{_registro['filas'][c]}", "values": [[ultima]]}
+            for c, (_, ultima) in vistos.items()
+            if c in _registro["filas"] and _registro["escrito"].get(c) != ultima
+        ]
+        cambios.append({"range": CELDA_VERSION_REGISTRO, "values": [[version + 1]]})
+        hoja.batch_update(cambios, value_input_option="RAW")
+        _registro["version"] = version + 1
+        _registro["escrito"].update({c: ultima for c, (_, ultima) in vistos.items()})
+    except Exception as error:
+        # Las visitas vuelven a la memoria sin pisar otras más nuevas. Solo un error transitorio
+        # programa otro intento; los demás se propagan y las visitas esperan a la próxima alta.
+        transitorio = error_transitorio(error)
+        with _candado_registro:
+            for correo, (primera, ultima) in vistos.items():
+                actual = _registro["vistos"].setdefault(correo, [primera, ultima])
+                actual[0] = min(actual[0], primera)
+            if transitorio:
+                _programar_registro()
+        if not transitorio:
+            raise
+
+def _programar_registro():
+    if not _registro["programado"]:
+        _registro["programado"] = True
+        temporizador = threading.Timer(INTERVALO_REGISTRO, _escribir_registro_en_fondo)
+        temporizador.daemon = True
+        temporizador.start()
+
+# Sin llamadas de red: la visita queda en memoria y se escribe en el próximo lote
+@trazas.medido("sheets.registrar_usuario_activo")
 def registrar_usuario_activo(correo_usuario, cliente):
-    hoja_maestra = cliente.open("usuarios_activos").sheet1
-    lista_correos = hoja_maestra.col_values(1)
-    if correo_usuario not in lista_correos:
-        hoja_maestra.append_row([correo_usuario])
+    correo = correo_usuario.strip().lower()
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _candado_registro:
+        _registro["cliente"] = cliente
+        if correo in _registro["vistos"]:
+            _registro["vistos"][correo][1] = ahora
+        else:
+            _registro["vistos"][correo] = [ahora, ahora]
+        _programar_registro()
+
+# Escribe ya las visitas pendientes (por ejemplo antes de cerrar el proceso)
+@trazas.medido("sheets.sincronizar_registro")
+def sincronizar_registro():
+    with _candado_registro:
+        pendiente = bool(_registro["vistos"])
+    if pendiente:
+        _escribir_registro()
+    return pendiente
+
+# Correos del registro (columna A) sin repetir, en el orden de la hoja
+@trazas.medido("sheets.usuarios_registrados")
+def usuarios_registrados(cliente):
+    hoja = obtener_hoja(cliente, "usuarios_activos")
+    return list(dict.fromkeys(c.strip().lower() for c in hoja.col_values(1) if "@" in c))
 
 # 🧠 Funciones de IA con Gemini
-def obtener_recomendacion_financiera(df, objetivo_usuario):
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-    texto_datos = df.to_csv(index=False)
+NOMBRE_MODELO = "gemini-1.5-flash"
+PRESUPUESTO_TOKENS_DATOS = int(os.environ.get("PRESUPUESTO_TOKENS_DATOS", 1500))
+TIEMPO_MAXIMO_IA = 90  # segundos por consulta en el modo concurrente
 
-    prompt = f"""
+PLANTILLA_RECOMENDACION = """
 Eres un asesor financiero inteligente. Un usuario tiene como objetivo "{objetivo_usuario}".
-Aquí están sus datos financieros:
+Aquí está el resumen de sus datos financieros:
 
 {texto_datos}
 
@@ -67,24 +605,144 @@ Analiza sus ingresos, egresos y hábitos financieros.
 3. ¿Qué patrones o riesgos ves en sus finanzas?
     """
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    respuesta = model.generate_content(prompt)
-    return respuesta.text
-
-def generar_presupuesto_sugerido(df):
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-    texto_datos = df.to_csv(index=False)
-
-    prompt = f"""
+# Los números de la proyección los calcula pronostico.py; el modelo solo los comenta
+PLANTILLA_PRESUPUESTO = """
 Eres un experto en análisis financiero.
-Con base en los siguientes registros del usuario:
+Con base en el siguiente resumen de los registros del usuario:
 
 {texto_datos}
 
-Genera una proyección mensual de sus gastos e ingresos esperados para los próximos 3 meses.
-Sugiere un presupuesto realista y metas de ahorro por categoría.
+Y en esta proyección y presupuesto ya calculados para los próximos meses:
+
+{proyeccion}
+
+Explica en pocas líneas qué muestran estos números, qué categorías conviene vigilar y cómo
+alcanzar la meta de ahorro. No cambies ni recalcules las cifras.
     """
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    respuesta = model.generate_content(prompt)
-    return respuesta.text
+# MODELO_IA=falso usa el sustituto local en lugar de Gemini (pruebas sin red)
+def crear_modelo(nombre_modelo=NOMBRE_MODELO):
+    if os.environ.get("MODELO_IA") == "falso":
+        from modelo_falso import ModeloFalso
+        return ModeloFalso(nombre_modelo)
+    import google.generativeai as genai
+
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    return genai.GenerativeModel(nombre_modelo)
+
+# Resumen agregado del libro con tamaño acotado en lugar del CSV completo
+def _texto_datos(df):
+    texto, _ = compactar_libro(df, PRESUPUESTO_TOKENS_DATOS)
+    return texto
+
+# El modelo solo se crea si la caché no tiene una respuesta para estos mismos datos
+def _consultar(df, plantilla, valores, modelo=None):
+    def generar(prompt):
+        return (modelo or crear_modelo()).generate_content(prompt).text
+    return obtener_cache().responder(df, plantilla, valores, NOMBRE_MODELO, generar, _texto_datos)
+
+@trazas.medido("sheets.obtener_recomendacion_financiera")
+def obtener_recomendacion_financiera(df, objetivo_usuario, modelo=None):
+    return _consultar(df, PLANTILLA_RECOMENDACION, {"objetivo_usuario": objetivo_usuario}, modelo)
+
+# 🔮 La proyección y el presupuesto salen de pronostico.py en milisegundos y sin red;
+# con narrativa=True se agrega el comentario del modelo sobre esas mismas cifras
+@trazas.medido("sheets.generar_presupuesto_sugerido")
+def generar_presupuesto_sugerido(df, modelo=None, narrativa=False):
+    proyeccion = texto_presupuesto(pronosticar(df))
+    if not narrativa:
+        return proyeccion
+    return proyeccion + "\n\n" + _consultar(df, PLANTILLA_PRESUPUESTO, {"proyeccion": proyeccion}, modelo)
+
+# ⚡ Streaming: iteradores de trozos de texto para st.write_stream
+def _consultar_stream(df, plantilla, valores, modelo=None):
+    def generar(prompt):
+        for parte in (modelo or crear_modelo()).generate_content(prompt, stream=True):
+            yield parte.text
+    return obtener_cache().responder_stream(df, plantilla, valores, NOMBRE_MODELO, generar, _texto_datos)
+
+@trazas.medido("sheets.recomendacion_financiera_stream")
+def recomendacion_financiera_stream(df, objetivo_usuario, modelo=None):
+    return _consultar_stream(df, PLANTILLA_RECOMENDACION, {"objetivo_usuario": objetivo_usuario}, modelo)
+
+# La proyección llega como primer trozo; el comentario del modelo, si se pide, sigue en streaming
+@trazas.medido("sheets.presupuesto_sugerido_stream")
+def presupuesto_sugerido_stream(df, modelo=None, narrativa=False):
+    proyeccion = texto_presupuesto(pronosticar(df))
+    yield proyeccion
+    if narrativa:
+        yield "\n\n"
+        yield from _consultar_stream(df, PLANTILLA_PRESUPUESTO, {"proyeccion": proyeccion}, modelo)
+
+_FIN = object()
+
+# Corre varias consultas en streaming a la vez, cada una en su hilo.
+# consultas: {nombre: función sin argumentos que devuelve un iterador de trozos}.
+# al_recibir(nombre, texto_acumulado) se llama en el hilo del script con cada trozo nuevo, así que
+# puede actualizar elementos de Streamlit. Si se pasa el tiempo máximo o el script se interrumpe
+# (el usuario cambió de página o volvió a ejecutar), las consultas pendientes se cancelan.
+# Devuelve ({nombre: texto}, {nombre: error}).
+async def consultas_concurrentes(consultas, al_recibir=None, tiempo_maximo=TIEMPO_MAXIMO_IA):
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    cancelar = threading.Event()
+
+    def avisar(mensaje):
+        # Tras la cancelación el bucle de eventos puede estar ya cerrado
+        if not cancelar.is_set():
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, mensaje)
+            except RuntimeError:
+                pass
+
+    def trabajar(nombre, fabrica):
+        trozos = None
+        try:
+            trozos = fabrica()
+            for trozo in trozos:
+                if cancelar.is_set():
+                    break
+                avisar((nombre, trozo, None))
+        except Exception as e:
+            avisar((nombre, _FIN, e))
+            return
+        finally:
+            # Cerrar el iterador evita que una respuesta cortada quede en la caché
+            if hasattr(trozos, "close"):
+                trozos.close()
+        avisar((nombre, _FIN, None))
+
+    textos = {nombre: "" for nombre in consultas}
+    errores = {}
+    activas = set(consultas)
+    limite = loop.time() + tiempo_maximo
+    for nombre, fabrica in consultas.items():
+        threading.Thread(target=trabajar, args=(nombre, fabrica), daemon=True).start()
+    try:
+        while activas:
+            try:
+                nombre, trozo, error = await asyncio.wait_for(cola.get(), max(0.0, limite - loop.time()))
+            except asyncio.TimeoutError:
+                for nombre in activas:
+                    errores[nombre] = TimeoutError(f"Sin respuesta completa en {tiempo_maximo} s")
+                break
+            if trozo is _FIN:
+                activas.discard(nombre)
+                if error is not None:
+                    errores[nombre] = error
+                continue
+            textos[nombre] += trozo
+            if al_recibir is not None:
+                al_recibir(nombre, textos[nombre])
+    finally:
+        # Los hilos dejan de leer en el siguiente trozo; sus mensajes pendientes se descartan
+        cancelar.set()
+    return textos, errores
+
+@trazas.medido("sheets.analisis_concurrente")
+def analisis_concurrente(df, objetivo_usuario, al_recibir=None, tiempo_maximo=TIEMPO_MAXIMO_IA, modelo=None):
+    consultas = {
+        "recomendaciones": lambda: recomendacion_financiera_stream(df, objetivo_usuario, modelo),
+        "presupuesto": lambda: presupuesto_sugerido_stream(df, modelo, narrativa=True),
+    }
+    return asyncio.run(consultas_concurrentes(consultas, al_recibir, tiempo_maximo))
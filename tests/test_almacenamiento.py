@@ -0,0 +1,82 @@
+import ast
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from almacenamiento import AlmacenParquet, desde_local, obtener_almacen
+from resumenes import USUARIO_LOCAL
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def parquet(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ALMACEN", "parquet")
+    monkeypatch.setenv("ARCHIVO_ALMACEN", str(tmp_path / "libro"))
+    almacen = obtener_almacen("parquet")
+    almacen.agregar(desde_local(pd.DataFrame({
+        "fecha": pd.to_datetime(["2025-03-01"]), "descripcion": ["venta"], "tipo": ["ingreso"],
+        "categoria": ["Ventas"], "monto": [100.0]})))
+    return almacen
+
+def test_parquet_no_se_entrega_a_un_usuario_real(parquet):
+    with pytest.raises(ValueError):
+        obtener_almacen("espejo", "a@x.com")
+    assert obtener_almacen("parquet", USUARIO_LOCAL) is parquet
+
+def test_parquet_no_muestra_el_libro_local_a_otro_usuario(parquet):
+    assert len(parquet.cargar(USUARIO_LOCAL)) == 1
+    for leer in (parquet.cargar, parquet.meses, parquet.version_datos):
+        with pytest.raises(ValueError):
+            leer("a@x.com")
+    with pytest.raises(ValueError):
+        parquet.consultar("a@x.com", "2025-03")
+    with pytest.raises(ValueError):
+        parquet.agregar(pd.DataFrame({"Fecha": [pd.Timestamp("2025-03-02")], "Tipo": ["Ingreso"], "Categoría": ["Ventas"],
+                                      "Descripción": ["ajena"], "Monto": [5.0], "Usuario": ["a@x.com"]}))
+    assert len(parquet.cargar(USUARIO_LOCAL)) == 1
+
+def test_parquet_solo_admite_altas(parquet):
+    assert parquet.solo_altas and type(parquet) is AlmacenParquet
+    with pytest.raises(PermissionError):
+        parquet.eliminar(["m1"])
+    with pytest.raises(PermissionError):
+        parquet.editar(pd.DataFrame())
+
+# Cada llamada a almacen.eliminar / almacen.editar de las apps está en la rama else de un
+# `if almacen.solo_altas:`, así que con un almacén de solo altas nunca se alcanza
+@pytest.mark.parametrize("app", ["app.py", "appp.py", "appy.py"])
+def test_las_apps_no_llegan_a_bajas_ni_correcciones_sin_permiso(app):
+    with open(os.path.join(RAIZ, app), encoding="utf-8") as f:
+        arbol = ast.parse(f.read())
+    protegidas = set()
+    for nodo in ast.walk(arbol):
+        if isinstance(nodo, ast.If) and ast.unparse(nodo.test) == "almacen.solo_altas":
+            protegidas |= {id(n) for rama in nodo.orelse for n in ast.walk(rama)}
+    llamadas = [n for n in ast.walk(arbol) if isinstance(n, ast.Call)
+                and ast.unparse(n.func) in ("almacen.eliminar", "almacen.editar")]
+    assert all(id(n) in protegidas for n in llamadas)
+
+def test_importar_el_mismo_csv_dos_veces_no_agrega_filas(parquet, tmp_path, monkeypatch):
+    import almacen_parquet
+    from importacion import importar_csv
+
+    conexiones = []
+    abrir = almacen_parquet._indice_huellas
+    monkeypatch.setattr(almacen_parquet, "_indice_huellas", lambda directorio: conexiones.append(abrir(directorio)) or conexiones[-1])
+    archivo = tmp_path / "banco.csv"
+    archivo.write_text("fecha,descripcion,tipo,monto,categoria\n"
+                       "2025-03-03,renta,egreso,500.00,Gastos generales\n"
+                       "2025-03-04,nómina,ingreso,1200.50,Nómina\n"
+                       "2025-04-01,renta,egreso,500.00,Gastos generales\n", encoding="utf-8")
+    assert importar_csv(str(archivo), parquet)["agregadas"] == 3
+    reporte = importar_csv(str(archivo), parquet)
+    assert (reporte["agregadas"], reporte["duplicadas"]) == (0, 3)
+    assert len(parquet.cargar(USUARIO_LOCAL)) == 4
+    # Cada importación cierra su conexión al índice de huellas
+    assert len(conexiones) == 2
+    for conexion in conexiones:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conexion.execute("SELECT 1")
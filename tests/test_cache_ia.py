@@ -0,0 +1,54 @@
+import pandas as pd
+
+from cache_ia import CacheIA
+
+PLANTILLA = "Objetivo: {objetivo_usuario}\n{texto_datos}"
+
+def _libro(usuario, filas, inicio=0):
+    return pd.DataFrame({
+        "Fecha": pd.date_range("2025-01-01", periods=filas, freq="D")[inicio:],
+        "Tipo": "Egreso",
+        "Categoría": "Otros",
+        "Descripción": [f"movimiento {i}" for i in range(inicio, filas)],
+        "Monto": [10.0 + i for i in range(inicio, filas)],
+        "Usuario": usuario,
+    })
+
+def _responder(cache, df, prompts):
+    def generar(prompt):
+        prompts.append(prompt)
+        return f"ANALISIS PRIVADO DE {df['Usuario'].iloc[0]}"
+    return cache.responder(df, PLANTILLA, {"objetivo_usuario": "ahorrar"}, "modelo", generar,
+                           lambda d: d.to_csv(index=False))
+
+def test_otro_usuario_no_reutiliza_el_analisis(tmp_path):
+    cache = CacheIA(str(tmp_path / "cache.sqlite3"))
+    prompts = []
+    _responder(cache, _libro("a@x.com", 100), prompts)
+    respuesta = _responder(cache, _libro("b@x.com", 101), prompts)
+    assert respuesta == "ANALISIS PRIVADO DE b@x.com"
+    assert "ANALISIS PRIVADO DE a@x.com" not in prompts[-1]
+    assert "Antes le diste" not in prompts[-1]
+
+def test_mismo_usuario_con_altas_actualiza_la_respuesta(tmp_path):
+    cache = CacheIA(str(tmp_path / "cache.sqlite3"))
+    prompts = []
+    _responder(cache, _libro("a@x.com", 100), prompts)
+    _responder(cache, _libro("a@x.com", 103), prompts)
+    assert "Antes le diste" in prompts[-1]
+    assert "ANALISIS PRIVADO DE a@x.com" in prompts[-1]
+    assert prompts[-1].count("movimiento 10") == 3  # solo las filas 100, 101 y 102
+
+def test_libro_con_bajas_no_es_respuesta_cercana(tmp_path):
+    cache = CacheIA(str(tmp_path / "cache.sqlite3"))
+    prompts = []
+    _responder(cache, _libro("a@x.com", 100), prompts)
+    _responder(cache, _libro("a@x.com", 101, inicio=1), prompts)
+    assert "Antes le diste" not in prompts[-1]
+
+def test_respuesta_exacta_no_llama_al_modelo(tmp_path):
+    cache = CacheIA(str(tmp_path / "cache.sqlite3"))
+    prompts = []
+    _responder(cache, _libro("a@x.com", 50), prompts)
+    _responder(cache, _libro("a@x.com", 50).iloc[::-1], prompts)
+    assert len(prompts) == 1
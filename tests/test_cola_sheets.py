@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import cola_sheets
+import sheets_utils
+from gspread_falso import ClienteFalso, HojaFalsa, Red
+
+ENCABEZADOS = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID", "Modificado"]
+
+class HojaQueFalla(HojaFalsa):
+    # La escritura número `falla_en` lanza un error de red después de que llegaron las anteriores
+    falla_en = None
+    escrituras = 0
+
+    def append_rows(self, filas, **opciones):
+        type(self).escrituras += 1
+        if type(self).escrituras == type(self).falla_en:
+            raise OSError("conexión cortada")
+        return super().append_rows(filas, **opciones)
+
+def _hoja(monkeypatch, clase=HojaFalsa):
+    cliente = ClienteFalso(Red(0))
+    libro = cliente.open("circulo_financiero_unico")
+    hoja = clase(libro, "Hoja 1", [ENCABEZADOS])
+    monkeypatch.setattr(cola_sheets, "conectar_google_sheets", lambda: (cliente, None))
+    monkeypatch.setattr(cola_sheets, "obtener_hoja", lambda c, nombre, titulo=None: hoja)
+    monkeypatch.setattr(cola_sheets, "ESPERA_BASE", 0.0)
+    return hoja
+
+def _movimientos(n, inicio=0):
+    return pd.DataFrame({
+        "Fecha": pd.Timestamp("2025-03-01"), "Tipo": "Egreso", "Categoría": "Otros",
+        "Descripción": [f"m{i}" for i in range(inicio, inicio + n)], "Monto": 10.0,
+        "Usuario": "a@x.com", "ID": [f"m{i:011d}" for i in range(inicio, inicio + n)],
+    })
+
+def _ids(hoja):
+    columna = ENCABEZADOS.index("ID")
+    return [f[columna] for f in hoja.filas[1:] if len(f) > columna and f[columna]]
+
+def _diario(ruta, hoja, df):
+    filas = df.astype(object).assign(Fecha=df["Fecha"].astype(str)).to_dict(orient="records")
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "e1", "libro": hoja.spreadsheet.title, "hoja": hoja.title, "filas": filas}) + "\n")
+
+def test_diario_recuperado_no_duplica_filas_ya_enviadas(tmp_path, monkeypatch):
+    hoja = _hoja(monkeypatch)
+    sheets_utils.agregar_movimientos(hoja, _movimientos(3))  # llegaron antes del corte
+    _diario(tmp_path / "diario.jsonl", hoja, _movimientos(5))
+    cola = cola_sheets.ColaEscritura(str(tmp_path / "diario.jsonl"), ventana=0, archivo_fallidos=str(tmp_path / "f.jsonl"))
+    assert cola.esperar(10)
+    assert sorted(_ids(hoja)) == sorted(_movimientos(5)["ID"])
+    assert not os.path.exists(tmp_path / "diario.jsonl")
+
+def test_reintento_tras_fallo_parcial_no_duplica(tmp_path, monkeypatch):
+    hoja = _hoja(monkeypatch, HojaQueFalla)
+    monkeypatch.setattr(sheets_utils, "TAMANO_LOTE", 2)
+    HojaQueFalla.escrituras, HojaQueFalla.falla_en = 0, 2
+    cola = cola_sheets.ColaEscritura(str(tmp_path / "diario.jsonl"), ventana=0, archivo_fallidos=str(tmp_path / "f.jsonl"))
+    envio = cola.encolar(hoja, _movimientos(5))
+    assert cola.esperar(10)
+    assert cola.estado(envio)[0] == cola_sheets.SINCRONIZADO
+    assert sorted(_ids(hoja)) == sorted(_movimientos(5)["ID"])
+
+def test_envio_que_siempre_falla_sale_de_la_cola(tmp_path, monkeypatch):
+    hoja = _hoja(monkeypatch, HojaQueFalla)
+    monkeypatch.setattr(cola_sheets, "MAX_INTENTOS", 3)
+    monkeypatch.setattr(HojaQueFalla, "append_rows", lambda self, filas, **o: (_ for _ in ()).throw(OSError("sin red")))
+    cola = cola_sheets.ColaEscritura(str(tmp_path / "diario.jsonl"), ventana=0, archivo_fallidos=str(tmp_path / "f.jsonl"))
+    envio = cola.encolar(hoja, _movimientos(2))
+    assert cola.esperar(10)
+    assert cola.estado(envio)[0] == cola_sheets.ERROR
+    assert cola.pendientes(hoja).empty
+    assert list(cola.fallidos()["ID"]) == list(_movimientos(2)["ID"])
+
+    # Al reencolarlos se envían con los mismos IDs
+    monkeypatch.undo()
+    hoja_buena = _hoja(monkeypatch)
+    cola.reintentar_fallidos()
+    assert cola.esperar(10)
+    assert sorted(_ids(hoja_buena)) == sorted(_movimientos(2)["ID"])
+    assert cola.fallidos().empty
+
+def test_reintentar_fallidos_devuelve_cada_fila_a_su_libro(tmp_path, monkeypatch):
+    cliente = ClienteFalso(Red(0))
+    destinos = {nombre: HojaFalsa(cliente.open(nombre), "Hoja 1", [ENCABEZADOS]) for nombre in ("libro_a", "libro_b")}
+    monkeypatch.setattr(cola_sheets, "conectar_google_sheets", lambda: (cliente, None))
+    monkeypatch.setattr(cola_sheets, "obtener_hoja", lambda c, nombre, titulo=None: destinos[nombre])
+    monkeypatch.setattr(cola_sheets, "ESPERA_BASE", 0.0)
+    monkeypatch.setattr(cola_sheets, "MAX_INTENTOS", 1)
+    monkeypatch.setattr(HojaFalsa, "append_rows", lambda self, filas, **o: (_ for _ in ()).throw(OSError("sin red")))
+    cola = cola_sheets.ColaEscritura(str(tmp_path / "diario.jsonl"), ventana=0, archivo_fallidos=str(tmp_path / "f.jsonl"))
+    cola.encolar(destinos["libro_a"], _movimientos(2))
+    cola.encolar(destinos["libro_b"], _movimientos(3, inicio=2))
+    assert cola.esperar(10)
+    assert len(cola.fallidos()) == 5
+
+    # Con la red de vuelta (y las hojas abiertas de nuevo) cada fila vuelve a su libro
+    monkeypatch.undo()
+    monkeypatch.setattr(cola_sheets, "conectar_google_sheets", lambda: (cliente, None))
+    destinos = {nombre: HojaFalsa(cliente.open(nombre), "Hoja 1", [ENCABEZADOS]) for nombre in ("libro_a", "libro_b")}
+    monkeypatch.setattr(cola_sheets, "obtener_hoja", lambda c, nombre, titulo=None: destinos[nombre])
+    assert len(cola.reintentar_fallidos()) == 2
+    assert cola.esperar(10)
+    assert sorted(_ids(destinos["libro_a"])) == sorted(_movimientos(2)["ID"])
+    assert sorted(_ids(destinos["libro_b"])) == sorted(_movimientos(3, inicio=2)["ID"])
+    assert cola.fallidos().empty
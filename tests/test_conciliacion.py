@@ -0,0 +1,52 @@
+import io
+
+import pandas as pd
+
+import conciliacion
+from esquema import COLUMNAS_LOCAL
+
+# Estado de cuenta con saldo de apertura 1,000.00; el banco lo lista del más reciente al más antiguo
+ESTADO = """Fecha,Concepto,Cargo,Abono,Saldo
+05/03/2025,Renta local,500.00,,1550.00
+03/03/2025,Venta mostrador,,300.00,2050.00
+03/03/2025,Venta en linea,,250.00,1750.00
+01/03/2025,Pago luz,100.00,,1500.00
+01/03/2025,Deposito cliente,,600.00,1600.00
+"""
+
+def _libro():
+    return pd.DataFrame({
+        "fecha": pd.to_datetime(["2025-03-01", "2025-03-01", "2025-03-03", "2025-03-03", "2025-03-05"]),
+        "descripcion": ["Deposito cliente", "Pago luz", "Venta en linea", "Venta mostrador", "Renta local"],
+        "tipo": ["ingreso", "egreso", "ingreso", "ingreso", "egreso"],
+        "categoria": ["Ventas", "Servicios", "Ventas", "Ventas", "Renta"],
+        "monto": [600.0, 100.0, 250.0, 300.0, 500.0],
+    })
+
+def test_leer_estado_queda_en_orden_cronologico():
+    estado = conciliacion.leer_estado(io.StringIO(ESTADO))
+    assert estado["fecha"].is_monotonic_increasing
+    # Dentro de cada día se conserva el orden real de los movimientos
+    assert list(estado["descripcion"]) == ["Deposito cliente", "Pago luz", "Venta en linea", "Venta mostrador", "Renta local"]
+    assert list(estado["monto"]) == [600.0, -100.0, 250.0, 300.0, -500.0]
+
+def test_estado_del_mas_reciente_al_mas_antiguo_no_diverge():
+    resultado = conciliacion.conciliar(conciliacion.leer_estado(io.StringIO(ESTADO)), _libro(), COLUMNAS_LOCAL)
+    assert resultado["dia_divergencia"] is None
+    assert resultado["resumen"]["conciliados"] == 5
+    saldos = resultado["saldos"].set_index("fecha")
+    assert saldos.loc["2025-03-01", "saldo_banco"] == 1500.0
+    assert saldos.loc["2025-03-05", "saldo_libro"] == 1550.0
+
+def test_saldo_capturado_reemplaza_al_del_estado():
+    resultado = conciliacion.conciliar(conciliacion.leer_estado(io.StringIO(ESTADO)), _libro(), COLUMNAS_LOCAL,
+                                       saldo_inicial=900.0)
+    assert resultado["saldos"]["saldo_libro"].iloc[0] == 1400.0
+
+def test_movimiento_sin_pareja_en_cada_lado():
+    libro = _libro()
+    libro.loc[4, "monto"] = 450.0
+    resultado = conciliacion.conciliar(conciliacion.leer_estado(io.StringIO(ESTADO)), libro, COLUMNAS_LOCAL)
+    assert list(resultado["solo_banco"]["descripcion"]) == ["Renta local"]
+    assert list(resultado["solo_libro"]["monto"]) == [450.0]
+    assert resultado["dia_divergencia"] == pd.Timestamp("2025-03-05")
@@ -0,0 +1,104 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import espejo_sheets
+import sheets_utils
+from espejo_sheets import AlmacenEspejo
+from gspread_falso import ClienteFalso, HojaFalsa, Red
+
+ENCABEZADOS = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID", "Modificado"]
+USUARIO = "a@x.com"
+
+class HojaSinRespuesta(HojaFalsa):
+    # El alta llega a la hoja pero la respuesta se pierde
+    perder_respuesta = False
+
+    def append_rows(self, filas, **opciones):
+        respuesta = super().append_rows(filas, **opciones)
+        if self.perder_respuesta:
+            self.perder_respuesta = False
+            raise OSError("respuesta perdida")
+        return respuesta
+
+@pytest.fixture
+def hoja():
+    libro = ClienteFalso(Red(0)).open("circulo_financiero_unico")
+    hoja = HojaSinRespuesta(libro, "Hoja 1", [ENCABEZADOS])
+    libro.hojas[hoja.title] = hoja
+    return hoja
+
+@pytest.fixture
+def espejo(tmp_path, hoja, monkeypatch):
+    # El hilo de fondo no sincroniza durante la prueba; cada una llama a sincronizar() a mano
+    monkeypatch.setattr(espejo_sheets, "VENTANA", 3600)
+    return AlmacenEspejo(str(tmp_path / "espejo.sqlite3"), obtener_hoja=lambda: hoja, max_antiguedad=3600)
+
+def _movimientos(*montos):
+    return pd.DataFrame({
+        "Fecha": pd.Timestamp("2025-03-01"), "Tipo": "Egreso", "Categoría": "Otros",
+        "Descripción": [f"gasto {i}" for i in range(len(montos))], "Monto": list(montos), "Usuario": USUARIO,
+    })
+
+def _en_hoja(hoja):
+    columnas = [ENCABEZADOS.index(c) for c in ("ID", "Monto")]
+    return sorted((f[columnas[0]], float(f[columnas[1]])) for f in hoja.filas[1:] if any(f))
+
+def test_alta_con_respuesta_perdida_no_se_duplica(espejo, hoja):
+    ids = espejo.agregar(_movimientos(10.0, 20.0))
+    hoja.perder_respuesta = True
+    with pytest.raises(OSError):
+        espejo.sincronizar()
+    assert sorted(i for i, _ in _en_hoja(hoja)) == sorted(ids)
+    espejo.sincronizar()
+    assert sorted(i for i, _ in _en_hoja(hoja)) == sorted(ids)
+    assert espejo.estado_espejo()["cambios_locales"] == 0
+
+def test_alta_con_respuesta_perdida_y_corregida_despues_sube_la_correccion(espejo, hoja):
+    ids = espejo.agregar(_movimientos(10.0))
+    hoja.perder_respuesta = True
+    with pytest.raises(OSError):
+        espejo.sincronizar()
+    espejo.editar(espejo.cargar(USUARIO).assign(Monto=15.0))
+    espejo.sincronizar()
+    assert _en_hoja(hoja) == [(ids[0], 15.0)]
+
+def test_correccion_de_una_fila_cambiada_en_la_hoja_queda_en_conflicto(espejo, hoja):
+    ids = espejo.agregar(_movimientos(10.0))
+    espejo.sincronizar()
+    # Otro usuario corrige la fila en la hoja y después se corrige la copia local
+    remoto = sheets_utils.leer_movimientos_filas(hoja, [2])
+    sheets_utils.editar_movimientos(hoja, remoto.assign(Monto=30.0), sheets_utils.marca_modificado() + 1000)
+    espejo.editar(espejo.cargar(USUARIO).assign(Monto=99.0))
+    reporte = espejo.sincronizar()
+    assert reporte["conflictos"] == 1
+    conflictos = espejo.conflictos()
+    assert list(conflictos["id"]) == list(ids) and list(conflictos["motivo"]) == ["modificado en la hoja"]
+    # Gana la hoja: la próxima sincronización trae su versión
+    espejo.sincronizar()
+    assert _en_hoja(hoja) == [(ids[0], 30.0)]
+    assert espejo.cargar(USUARIO)["Monto"].tolist() == [30.0]
+    assert espejo.estado_espejo()["cambios_locales"] == 0
+
+def test_baja_de_una_fila_que_nunca_se_subio_no_llama_a_la_hoja(espejo, hoja):
+    ids = espejo.agregar(_movimientos(10.0, 20.0))
+    espejo.eliminar([ids[0]])
+    hoja.red.reiniciar()
+    espejo.sincronizar()
+    assert [i for i, _ in _en_hoja(hoja)] == [ids[1]]
+    assert "spreadsheet.batch_update" not in hoja.red.resumen().get("por_metodo", {})
+    assert espejo.estado_espejo()["cambios_locales"] == 0
+    assert espejo.cargar(USUARIO)["ID"].tolist() == [ids[1]]
+
+def test_baja_local_de_una_fila_subida_la_borra_de_la_hoja(espejo, hoja):
+    ids = espejo.agregar(_movimientos(10.0, 20.0, 30.0))
+    espejo.sincronizar()
+    espejo.eliminar([ids[1]])
+    espejo.sincronizar()
+    assert sorted(i for i, _ in _en_hoja(hoja)) == sorted([ids[0], ids[2]])
+    assert espejo.estado_espejo()["cambios_locales"] == 0
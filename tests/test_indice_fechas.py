@@ -0,0 +1,60 @@
+import pandas as pd
+
+import indice_fechas
+from almacenamiento import AlmacenCSV
+from indice_fechas import IndiceFechas, mismo_mes_hace
+
+def _libro():
+    # Desordenado, con dos movimientos el mismo día y una fecha vacía
+    return pd.DataFrame({
+        "Fecha": pd.to_datetime(["2025-03-15", "2024-03-02", None, "2025-01-31", "2025-03-01", "2025-03-01"]),
+        "Tipo": ["Egreso", "Ingreso", "Egreso", "Egreso", "Ingreso", "Egreso"],
+        "Categoría": ["Renta", "Ventas", "Otros", "Otros", "Ventas", "Otros"],
+        "Descripción": ["renta", "venta vieja", "sin fecha", "enero", "venta", "cafe"],
+        "Monto": [500.0, 100.0, 1.0, 20.0, 300.0, 5.0],
+        "Usuario": "a@x.com",
+    })
+
+def test_meses_y_cortes_por_mes_y_año():
+    indice = IndiceFechas(_libro())
+    assert indice.meses() == ["2024-03", "2025-01", "2025-03"]
+    assert indice.años() == [2024, 2025]
+    # Orden por fecha y, en el mismo día, el orden original
+    assert list(indice.mes("2025-03")["Descripción"]) == ["venta", "cafe", "renta"]
+    assert list(indice.año(2025)["Descripción"]) == ["enero", "venta", "cafe", "renta"]
+    assert indice.mes("2025-02").empty
+    assert indice.mes("2030-01").empty
+
+def test_rango_incluye_ambos_dias_y_deja_fuera_las_fechas_vacias():
+    indice = IndiceFechas(_libro())
+    assert list(indice.rango("2025-01-31", "2025-03-01")["Descripción"]) == ["enero", "venta", "cafe"]
+    assert list(indice.rango(desde="2025-03-02")["Descripción"]) == ["renta"]
+    assert len(indice.rango()) == 5
+    assert len(indice) == 6
+    assert list(indice.posiciones("2025-03-01", "2025-03-01")) == [4, 5]
+
+def test_varios_meses_y_mismo_mes_del_año_anterior():
+    indice = IndiceFechas(_libro())
+    meses = [mismo_mes_hace("2025-03"), "2025-03"]
+    assert meses == ["2024-03", "2025-03"]
+    assert list(indice.varios(meses)["Mes"]) == ["2024-03", "2025-03", "2025-03", "2025-03"]
+    assert mismo_mes_hace("2025-01", años=-1) == "2026-01"
+
+def test_almacen_consulta_por_mes_con_el_indice(tmp_path):
+    almacen = AlmacenCSV(str(tmp_path / "movimientos.csv"))
+    almacen.agregar(_libro())
+    assert almacen.meses("a@x.com") == ["2024-03", "2025-01", "2025-03"]
+    assert sorted(almacen.consultar("a@x.com", "2025-03")["Monto"]) == [5.0, 300.0, 500.0]
+    assert list(almacen.consultar("a@x.com", "2025-03", categorias=["Ventas"])["Monto"]) == [300.0]
+    comparacion = almacen.comparar("a@x.com", ["2024-03", "2025-03"])
+    assert comparacion.loc[("Ingreso", "Ventas")].tolist() == [100.0, 300.0]
+    assert comparacion.loc[("Egreso", "Renta")].tolist() == [0.0, 500.0]
+
+def test_sin_version_el_indice_no_llena_la_cache(tmp_path, monkeypatch):
+    almacen = AlmacenCSV(str(tmp_path / "movimientos.csv"))
+    almacen.agregar(_libro())
+    monkeypatch.setattr(AlmacenCSV, "version_datos", lambda self, usuario: None)
+    indice_fechas.limpiar_cache()
+    for _ in range(3):
+        assert almacen.meses("a@x.com") == ["2024-03", "2025-01", "2025-03"]
+    assert len(indice_fechas._indices) == 0
@@ -0,0 +1,22 @@
+import os
+
+import pandas as pd
+import pytest
+
+import reportes
+from esquema import escribir_csv
+
+def test_lector_abre_el_archivo_pedido_sin_tocar_el_entorno(tmp_path, monkeypatch):
+    monkeypatch.delenv("ALMACEN", raising=False)
+    monkeypatch.delenv("ARCHIVO_ALMACEN", raising=False)
+    archivo = str(tmp_path / "libro.csv")
+    escribir_csv(pd.DataFrame({
+        "Fecha": pd.to_datetime(["2025-03-01", "2025-03-02"]), "Tipo": "Ingreso", "Categoría": "Ventas",
+        "Descripción": ["a", "b"], "Monto": [10.0, 20.0], "Usuario": ["a@x.com", "b@x.com"], "ID": ["m1", "m2"]}), archivo)
+    cargar = reportes.lector("csv", archivo)
+    assert list(cargar("a@x.com")["ID"]) == ["m1"]
+    assert "ALMACEN" not in os.environ and "ARCHIVO_ALMACEN" not in os.environ
+
+def test_lector_rechaza_almacenes_de_un_solo_usuario():
+    with pytest.raises(ValueError):
+        reportes.lector("parquet")
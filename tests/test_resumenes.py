@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from resumenes import ResumenMensual
+
+def _libro(usuario, montos):
+    return pd.DataFrame({
+        "Fecha": pd.date_range("2025-01-10", periods=len(montos), freq="15D"),
+        "Tipo": "Egreso",
+        "Categoría": "Otros",
+        "Descripción": [f"gasto {i}" for i in range(len(montos))],
+        "Monto": montos,
+        "Usuario": usuario,
+    })
+
+def test_un_alta_solo_reescribe_el_resumen_de_su_usuario(tmp_path):
+    resumen = ResumenMensual(str(tmp_path / "resumen"))
+    resumen.reconstruir(pd.concat([_libro("a@x.com", [10.0, 20.0]), _libro("b@x.com", [5.0])]), todo=True)
+    ruta_b = resumen._ruta("b@x.com")
+    antes = os.stat(ruta_b).st_mtime_ns
+    resumen.agregar(_libro("a@x.com", [7.0]), usuario="a@x.com")
+    assert os.stat(ruta_b).st_mtime_ns == antes
+    assert resumen.conteo("a@x.com") == 3
+    assert resumen.verificar(_libro("b@x.com", [5.0]), usuario="b@x.com").empty
+
+def test_cambio_de_monto_con_el_mismo_conteo_rearma_el_resumen(tmp_path):
+    resumen = ResumenMensual(str(tmp_path / "resumen"))
+    libro = _libro("a@x.com", [10.0, 20.0, 30.0])
+    assert resumen.actualizar(libro, "a@x.com", version=1)
+    corregido = libro.assign(Monto=[10.0, 25.0, 30.0])
+    # Misma versión: no se revisa; versión nueva: la huella nota el monto distinto
+    assert not resumen.actualizar(corregido, "a@x.com", version=1)
+    assert resumen.actualizar(corregido, "a@x.com", version=2)
+    assert resumen.resumen_mes("a@x.com", "2025-01")["egresos"] == 35.0
+    assert resumen.verificar(corregido, usuario="a@x.com").empty
+
+def test_altas_y_bajas_propias_mantienen_la_huella(tmp_path):
+    directorio = str(tmp_path / "resumen")
+    resumen = ResumenMensual(directorio)
+    libro = _libro("a@x.com", [10.0, 20.0, 30.0])
+    resumen.actualizar(libro, "a@x.com")
+    nuevo = _libro("a@x.com", [40.0]).assign(Descripción="nuevo")
+    resumen.agregar(nuevo, usuario="a@x.com")
+    resumen.eliminar(libro.iloc[[0]], restantes=pd.concat([libro.iloc[1:], nuevo]), usuario="a@x.com")
+    libro = pd.concat([libro.iloc[1:], nuevo], ignore_index=True)
+    # Otro proceso lee la huella guardada en disco y no necesita rearmar nada
+    assert not ResumenMensual(directorio).actualizar(libro, "a@x.com")
+
+def test_correos_que_se_limpian_igual_no_comparten_resumen(tmp_path):
+    resumen = ResumenMensual(str(tmp_path / "resumen"))
+    correos = ["a/b@x.com", "a_b@x.com", "A_b@x.com"]
+    assert len({resumen._ruta(c).lower() for c in correos}) == 3
+    for i, correo in enumerate(correos):
+        resumen.reconstruir(_libro(correo, [10.0 * (i + 1)]), usuario=correo)
+    otro = ResumenMensual(str(tmp_path / "resumen"))  # relee de disco
+    assert [otro.resumen_mes(c, "2025-01")["egresos"] for c in correos] == [10.0, 20.0, 30.0]
+    assert len(otro.tabla) == 3
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("streamlit")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import sheets_utils
+from gspread_falso import ClienteFalso, HojaFalsa, Red
+
+ENCABEZADOS = ["Fecha", "Tipo", "Categoría", "Descripción", "Monto", "Usuario", "ID", "Modificado"]
+USUARIO, ID = ENCABEZADOS.index("Usuario"), ENCABEZADOS.index("ID")
+
+# Hoja compartida con 12 movimientos de dos usuarios intercalados; la fila n tiene la descripción
+# "fila n" e ID "m0000000000n" (sin ID si n está en sin_id)
+def _hoja(sin_id=()):
+    libro = ClienteFalso(Red(0)).open("circulo_financiero_unico")
+    filas = [ENCABEZADOS] + [
+        ["2025-03-01", "Egreso", "Otros", f"fila {n}", "10", "a@x.com" if n % 3 else "b@x.com",
+         "" if n in sin_id else f"m{n:011d}", "1"]
+        for n in range(2, 14)
+    ]
+    hoja = HojaFalsa(libro, "Hoja 1", filas)
+    libro.hojas[hoja.title] = hoja
+    return hoja
+
+def _descripciones(hoja):
+    return [f[3] for f in hoja.filas[1:]]
+
+def _indice(hoja):
+    return sheets_utils._indices[sheets_utils._clave_hoja(hoja)]
+
+# El índice en memoria apunta a la fila donde de verdad está cada ID y cada usuario
+def _indice_coincide(hoja):
+    indice = _indice(hoja)
+    assert all(hoja.filas[fila - 1][ID] == i for i, fila in indice["ids"].items())
+    for usuario, filas in indice["usuarios"].items():
+        assert sorted(filas) == [n for n, f in enumerate(hoja.filas[1:], start=2) if f[USUARIO] == usuario]
+
+def test_eliminar_filas_no_contiguas_de_abajo_hacia_arriba():
+    hoja = _hoja()
+    sheets_utils.eliminar_filas(hoja, [3, 4, 7, 13, 9, 3])
+    assert _descripciones(hoja) == [f"fila {n}" for n in (2, 5, 6, 8, 10, 11, 12)]
+
+def test_eliminar_por_id_deja_las_demas_filas_y_desplaza_el_indice():
+    hoja = _hoja()
+    borradas = sheets_utils.eliminar_movimientos(hoja, ["m00000000004", "m00000000005", "m00000000009", "m00000000012"])
+    assert borradas == {"m00000000004": 4, "m00000000005": 5, "m00000000009": 9, "m00000000012": 12}
+    assert _descripciones(hoja) == [f"fila {n}" for n in (2, 3, 6, 7, 8, 10, 11, 13)]
+    _indice_coincide(hoja)
+    # Un segundo borrado con el índice ya desplazado (sin rearmarlo) quita justo las filas pedidas
+    instante = _indice(hoja)["instante"]
+    sheets_utils.eliminar_movimientos(hoja, ["m00000000003", "m00000000013"])
+    assert _indice(hoja)["instante"] == instante
+    assert _descripciones(hoja) == [f"fila {n}" for n in (2, 6, 7, 8, 10, 11)]
+    _indice_coincide(hoja)
+
+def test_filas_sin_id_reciben_uno_y_se_pueden_borrar():
+    hoja = _hoja(sin_id=(6, 7))
+    indice = sheets_utils._construir_indice(hoja, ENCABEZADOS)
+    nuevos = {hoja.filas[n - 1][ID] for n in (6, 7)}
+    assert all(nuevos) and nuevos <= set(indice["ids"])
+    assert hoja.filas[7][ID] == "m00000000008"  # los IDs existentes no cambian
+    sheets_utils.eliminar_movimientos(hoja, [hoja.filas[5][ID], "m00000000010"])
+    assert _descripciones(hoja) == [f"fila {n}" for n in (2, 3, 4, 5, 7, 8, 9, 11, 12, 13)]
+    _indice_coincide(hoja)
+
+def test_ubicar_rearma_el_indice_si_otro_proceso_movio_filas():
+    hoja = _hoja()
+    sheets_utils._construir_indice(hoja, ENCABEZADOS)
+    del hoja.filas[2]  # otro proceso borró la fila 3 sin pasar por este índice
+    assert sheets_utils._ubicar(hoja, ["m00000000008", "m00000000003"]) == {"m00000000008": 7}
+    _indice_coincide(hoja)
+
+def _error_api(codigo):
+    from gspread.exceptions import APIError
+
+    error = APIError(f"HTTP {codigo}")
+    error.code = codigo
+    return error
+
+@pytest.mark.parametrize("error, reintenta", [(_error_api(429), True), (_error_api(503), True),
+                                              (OSError("sin red"), True), (_error_api(403), False),
+                                              (KeyError("A1"), False)])
+def test_registro_de_usuarios_solo_reprograma_errores_transitorios(monkeypatch, error, reintenta):
+    programados = []
+    monkeypatch.setattr(sheets_utils, "_registro", dict(sheets_utils._registro, vistos={}, filas={}, escrito={}, programado=False))
+    monkeypatch.setattr(sheets_utils, "_programar_registro", lambda: programados.append(True))
+    monkeypatch.setattr(sheets_utils, "obtener_hoja", lambda cliente, nombre: (_ for _ in ()).throw(error))
+    sheets_utils.registrar_usuario_activo("A@x.com", cliente=None)
+    programados.clear()
+    if reintenta:
+        sheets_utils.sincronizar_registro()
+    else:
+        with pytest.raises(type(error)):
+            sheets_utils.sincronizar_registro()
+    assert programados == ([True] if reintenta else [])
+    assert list(sheets_utils._registro["vistos"]) == ["a@x.com"]  # las visitas no se pierden
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+import trazas
+
+def _escribir(archivo, duraciones, app="app", final="\n"):
+    with open(archivo, "a", encoding="utf-8") as f:
+        for i, duracion in enumerate(duraciones):
+            registro = {"app": app, "duracion": duracion,
+                        "spans": [{"nombre": "sheets.cargar", "duracion": duracion / 2, "filas": 1, "bytes": 0, "llamadas": 1}]}
+            f.write(json.dumps(registro) + (final if i == len(duraciones) - 1 else "\n"))
+
+def _conteo(tabla, span="rerun"):
+    return int(tabla.loc[tabla["span"] == span, "conteo"].iloc[0])
+
+@pytest.fixture
+def leidas(monkeypatch):
+    contador = []
+    filas_traza = trazas._filas_traza
+    monkeypatch.setattr(trazas, "_filas_traza", lambda registro: contador.append(1) or filas_traza(registro))
+    return contador
+
+def test_estadisticas_solo_leen_lo_nuevo_del_log(tmp_path, leidas):
+    archivo = str(tmp_path / "trazas.jsonl")
+    _escribir(archivo, [0.1, 0.2, 0.3])
+    tabla = trazas.estadisticas(archivo)
+    assert len(leidas) == 3 and _conteo(tabla) == 3
+
+    # Una traza a medio escribir no se cuenta hasta que termina su línea
+    _escribir(archivo, [0.4, 0.5], final="")
+    assert _conteo(trazas.estadisticas(archivo)) == 4
+    with open(archivo, "a", encoding="utf-8") as f:
+        f.write("\n")
+    tabla = trazas.estadisticas(archivo)
+    assert len(leidas) == 5 and _conteo(tabla) == 5
+    assert tabla.loc[tabla["span"] == "rerun", "p50"].iloc[0] == pytest.approx(0.3)
+
+def test_estadisticas_tras_rotar_no_releen_los_respaldos(tmp_path, leidas):
+    archivo = str(tmp_path / "trazas.jsonl")
+    _escribir(archivo, [0.1, 0.2])
+    _escribir(archivo, [9.0], app="otra")
+    trazas.estadisticas(archivo, app="app")
+    os.replace(archivo, archivo + ".1")
+    _escribir(archivo, [0.3])
+    leidas.clear()
+    tabla = trazas.estadisticas(archivo, app="app")
+    assert len(leidas) == 1
+    assert _conteo(tabla) == 3 and _conteo(tabla, "sheets.cargar") == 3
+    assert set(tabla["app"]) == {"app"}
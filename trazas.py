@@ -0,0 +1,318 @@
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# ⏱️ Trazas por ejecución de la página. Cada rerun de Streamlit abre una traza; las funciones
+# marcadas con @medido abren spans anidados con duración, filas, bytes y llamadas a la API.
+# Al terminar el rerun la traza se agrega como una línea JSON a un log rotativo, del que salen
+# los percentiles por span entre sesiones. Con TRAZAS=0 todo queda en llamadas directas.
+ARCHIVO_TRAZAS = os.environ.get("ARCHIVO_TRAZAS", "trazas.jsonl")
+ACTIVAS = os.environ.get("TRAZAS", "1") != "0"
+MAX_BYTES = 5 * 1024 * 1024  # tamaño de cada archivo antes de rotar
+RESPALDOS = 3                # archivos rotados que se conservan
+
+_actual = contextvars.ContextVar("traza_actual", default=None)
+_log = None
+_candado = threading.Lock()
+_estadisticas = {}
+
+class Traza:
+    def __init__(self, app, sesion=None):
+        self.app = app
+        self.sesion = sesion
+        self.id = uuid.uuid4().hex[:12]
+        self.instante = time.time()
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        self.spans = []
+        self._abiertos = []
+
+    def abrir(self, nombre):
+        registro = {"nombre": nombre, "nivel": len(self._abiertos),
+                    "inicio": time.perf_counter() - self.inicio,
+                    "duracion": None, "filas": 0, "bytes": 0, "llamadas": 0}
+        self.spans.append(registro)
+        self._abiertos.append(registro)
+        return registro
+
+    def cerrar(self, registro):
+        registro["duracion"] = time.perf_counter() - self.inicio - registro["inicio"]
+        if registro in self._abiertos:
+            self._abiertos.remove(registro)
+
+    # Las filas son del span más interno; bytes y llamadas suben a todos los abiertos
+    def anotar(self, filas=0, bytes_=0, llamadas=0):
+        if filas and self._abiertos:
+            self._abiertos[-1]["filas"] += filas
+        for registro in self._abiertos:
+            registro["bytes"] += bytes_
+            registro["llamadas"] += llamadas
+
+    def a_dict(self):
+        return {
+            "id": self.id,
+            "app": self.app,
+            "sesion": self.sesion,
+            "instante": round(self.instante, 3),
+            "duracion": round(self.duracion if self.duracion is not None else time.perf_counter() - self.inicio, 6),
+            "spans": [
+                dict(s, inicio=round(s["inicio"], 6), duracion=round(s["duracion"], 6) if s["duracion"] is not None else None)
+                for s in self.spans
+            ],
+        }
+
+def _registrador():
+    global _log
+    with _candado:
+        if _log is None:
+            _log = logging.getLogger("trazas")
+            _log.setLevel(logging.INFO)
+            _log.propagate = False
+            manejador = logging.handlers.RotatingFileHandler(
+                ARCHIVO_TRAZAS, maxBytes=MAX_BYTES, backupCount=RESPALDOS, encoding="utf-8")
+            manejador.setFormatter(logging.Formatter("%(message)s"))
+            _log.addHandler(manejador)
+        return _log
+
+# ---------- ciclo de vida ----------
+def _sesion_streamlit():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    contexto = get_script_run_ctx()
+    return contexto.session_id if contexto else None
+
+# Al inicio de cada rerun; una traza anterior sin cerrar (rerun interrumpido) se escribe antes
+def iniciar_rerun(app, sesion=None):
+    if not ACTIVAS:
+        return None
+    if _actual.get() is not None:
+        terminar_rerun(interrumpida=True)
+    traza = Traza(app, sesion or _sesion_streamlit())
+    _actual.set(traza)
+    return traza
+
+def terminar_rerun(interrumpida=False):
+    traza = _actual.get()
+    if traza is None:
+        return None
+    _actual.set(None)
+    traza.duracion = time.perf_counter() - traza.inicio
+    for registro in list(traza._abiertos):
+        traza.cerrar(registro)
+    registro = traza.a_dict()
+    if interrumpida:
+        registro["interrumpida"] = True
+    try:
+        _registrador().info(json.dumps(registro, ensure_ascii=False, default=str))
+    except OSError:
+        pass
+    return traza
+
+# Traza para trabajo fuera de un rerun (hilos de sincronización)
+@contextmanager
+def traza(app, sesion=None):
+    if not ACTIVAS:
+        yield None
+        return
+    token = _actual.set(Traza(app, sesion))
+    try:
+        yield _actual.get()
+    finally:
+        terminar_rerun()
+        _actual.reset(token)
+
+def traza_actual():
+    return _actual.get()
+
+# ---------- spans ----------
+@contextmanager
+def span(nombre):
+    traza = _actual.get()
+    if traza is None:
+        yield None
+        return
+    registro = traza.abrir(nombre)
+    try:
+        yield registro
+    finally:
+        traza.cerrar(registro)
+
+def anotar(filas=0, bytes_=0, llamadas=0):
+    traza = _actual.get()
+    if traza is not None:
+        traza.anotar(filas, bytes_, llamadas)
+
+# Filas del resultado si es un DataFrame; si no, del primer DataFrame de los argumentos
+def _filas(resultado, args):
+    if isinstance(resultado, (pd.DataFrame, pd.Series)):
+        return len(resultado)
+    for valor in args:
+        if isinstance(valor, (pd.DataFrame, pd.Series)):
+            return len(valor)
+    return 0
+
+# Los generadores (respuestas en streaming) se miden hasta agotarse, con los bytes recibidos
+def _generador_medido(traza, nombre, generador):
+    registro = traza.abrir(nombre)
+    traza._abiertos.remove(registro)
+    registro["nivel"] = 0
+    try:
+        for parte in generador:
+            if isinstance(parte, str):
+                registro["bytes"] += len(parte.encode("utf-8"))
+            yield parte
+    finally:
+        traza.cerrar(registro)
+
+def medido(nombre):
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            traza = _actual.get()
+            if traza is None:
+                return funcion(*args, **kwargs)
+            registro = traza.abrir(nombre)
+            try:
+                resultado = funcion(*args, **kwargs)
+            finally:
+                traza.cerrar(registro)
+            if inspect.isgenerator(resultado):
+                return _generador_medido(traza, f"{nombre} (stream)", resultado)
+            registro["filas"] += _filas(resultado, args)
+            return resultado
+        return envoltura
+    return decorador
+
+# Cuenta llamadas y bytes de cada petición HTTP del cliente de gspread
+def instrumentar_cliente(cliente):
+    http = getattr(cliente, "http_client", None)
+    if http is None or getattr(http.request, "trazado", False):
+        return cliente
+    original = http.request
+
+    def request(*args, **kwargs):
+        respuesta = original(*args, **kwargs)
+        enviados = len(json.dumps(kwargs["json"])) if kwargs.get("json") is not None else 0
+        anotar(bytes_=enviados + len(getattr(respuesta, "content", b"") or b""), llamadas=1)
+        return respuesta
+
+    request.trazado = True
+    http.request = request
+    return cliente
+
+# ---------- agregados ----------
+def _archivos(archivo):
+    return [a for a in [archivo] + [f"{archivo}.{i}" for i in range(1, RESPALDOS + 1)] if os.path.exists(a)]
+
+def _filas_traza(registro):
+    filas = [(registro.get("app"), "rerun", registro["duracion"], 0, 0, 0)]
+    filas.extend(
+        (registro.get("app"), s["nombre"], s["duracion"], s["filas"], s["bytes"], s["llamadas"])
+        for s in registro.get("spans", []) if s.get("duracion") is not None
+    )
+    return filas
+
+# Filas de las trazas escritas desde `inicio` (en bytes); una última línea sin salto de línea
+# está a medio escribir y se deja para la próxima lectura
+def _leer_desde(nombre, inicio, app):
+    filas = []
+    with open(nombre, "rb") as f:
+        f.seek(inicio)
+        for linea in f:
+            if not linea.endswith(b"\n"):
+                break
+            inicio += len(linea)
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            if app is None or registro.get("app") == app:
+                filas.extend(_filas_traza(registro))
+    return inicio, filas
+
+# p50/p95 por span en todas las trazas del log (incluidos los archivos rotados);
+# "rerun" es la duración total de cada ejecución. Se recalcula solo si el log cambió, y solo se
+# lee lo agregado desde la última vez: cada archivo se sigue por su inodo (rotar lo renombra sin
+# cambiarlo), así tras una rotación solo se lee completo el archivo nuevo.
+def estadisticas(archivo=ARCHIVO_TRAZAS, app=None):
+    firma = tuple((a, os.path.getmtime(a), os.path.getsize(a)) for a in _archivos(archivo))
+    clave = (archivo, app)
+    with _candado:
+        guardado = _estadisticas.get(clave)
+    if guardado is not None and guardado["firma"] == firma:
+        return guardado["tabla"]
+
+    leidos = guardado["leidos"] if guardado is not None else {}
+    actuales = {}
+    for nombre in _archivos(archivo):
+        info = os.stat(nombre)
+        inodo = (info.st_dev, info.st_ino)
+        inicio, filas = leidos.get(inodo, (0, []))
+        if info.st_size < inicio:
+            inicio, filas = 0, []  # el archivo se truncó o se reemplazó
+        inicio, nuevas = _leer_desde(nombre, inicio, app)
+        actuales[inodo] = (inicio, filas + nuevas if nuevas else filas)
+    filas = [fila for _, filas_archivo in actuales.values() for fila in filas_archivo]
+    df = pd.DataFrame(filas, columns=["app", "span", "duracion", "filas", "bytes", "llamadas"])
+    grupos = df.groupby(["app", "span"], sort=False)
+    tabla = grupos.agg(
+        conteo=("duracion", "size"),
+        p50=("duracion", lambda d: np.percentile(d, 50)),
+        p95=("duracion", lambda d: np.percentile(d, 95)),
+        media=("duracion", "mean"),
+        filas=("filas", "mean"),
+        bytes=("bytes", "mean"),
+        llamadas=("llamadas", "mean"),
+    ).reset_index().sort_values("p95", ascending=False, ignore_index=True)
+    with _candado:
+        _estadisticas[clave] = {"firma": firma, "tabla": tabla, "leidos": actuales}
+    return tabla
+
+# ---------- panel ----------
+# Spans del rerun que acaba de terminar y percentiles de la app, en la barra lateral
+def panel(traza=None, app=None):
+    import streamlit as st
+
+    if traza is None or not st.sidebar.checkbox("⏱️ Rendimiento", key="panel_trazas"):
+        return
+    with st.sidebar.expander("Esta ejecución", expanded=True):
+        st.caption(f"{traza.duracion * 1000:,.0f} ms en total")
+        st.dataframe(pd.DataFrame([
+            {"span": "· " * s["nivel"] + s["nombre"], "ms": round(s["duracion"] * 1000, 1),
+             "filas": s["filas"], "bytes": s["bytes"], "llamadas": s["llamadas"]}
+            for s in traza.spans if s["duracion"] is not None
+        ]), hide_index=True, use_container_width=True)
+    with st.sidebar.expander("Percentiles entre sesiones"):
+        tabla = estadisticas(app=app or traza.app)
+        tabla = tabla.assign(p50=(tabla["p50"] * 1000).round(1), p95=(tabla["p95"] * 1000).round(1))
+        st.dataframe(tabla[["span", "conteo", "p50", "p95", "llamadas", "bytes"]].rename(
+            columns={"p50": "p50 ms", "p95": "p95 ms"}), hide_index=True, use_container_width=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Percentiles por span del log de trazas")
+    parser.add_argument("--archivo", default=ARCHIVO_TRAZAS)
+    parser.add_argument("--app")
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    tabla = estadisticas(args.archivo, args.app)
+    if tabla.empty:
+        print("Sin trazas registradas")
+    else:
+        tabla = tabla.assign(p50=(tabla["p50"] * 1000).round(1), p95=(tabla["p95"] * 1000).round(1),
+                             media=(tabla["media"] * 1000).round(1))
+        print(tabla.head(args.top).to_string(index=False))